@@ -4,6 +4,7 @@ import importlib
 import secrets
 import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -21,6 +22,8 @@ from app.schemas.types import ChainEventType, EventType, MessageChannel
 
 from .core import (
     DvbMonitor,
+    IpLookupGuard,
+    PersistentTimedValueCache,
     TimedValueCache,
     analyze_record_precheck,
     analyze_tvh_dvr_reliability,
@@ -52,10 +55,13 @@ from .core import (
     build_user_manage_buttons,
     build_user_select_buttons,
     cancel_tvh_subscription,
+    close_ip_location_dbs,
+    close_tvh_http_clients,
     decode_callback_value,
     enrich_subscriptions_with_ip_locations,
     DEFAULT_IPDB_ASN_URL,
     DEFAULT_IPDB_COUNTRY_URL,
+    DEFAULT_IP2REGION_CACHE_MODE,
     DEFAULT_IP2REGION_URL,
     DEFAULT_RECORD_START_PADDING_MINUTES,
     DEFAULT_RECORD_STOP_PADDING_MINUTES,
@@ -103,11 +109,14 @@ from .core import (
     format_dvb_message,
     format_status_message,
     ensure_ip_location_db,
+    read_ip_location_db_version,
     find_user,
     is_real_playback_subscription,
     is_tvh_dvr_file_available,
     lookup_ip_location_from_mmdb,
     lookup_ip_location_from_ip2region,
+    normalize_ip2region_cache_mode,
+    set_ip2region_cache_mode,
     merge_subscription_details,
     normalize_plugin_callback_payload,
     normalize_interval,
@@ -118,7 +127,9 @@ from .core import (
     ensure_tvhhelper_dvr_config,
     parse_tvh_inputs,
     plan_playback_notifications,
+    make_tvh_comet_poller,
     resolve_play_notify_settings,
+    run_warmup_stages,
     normalize_dvr_filter,
     find_record_merge_candidate,
     reset_tvh_user_token,
@@ -135,14 +146,30 @@ from .core import (
     summarize_tvh_dvr_entries,
     build_tvh_dvr_storage_snapshot,
     token_for_user,
+    tvh_http_client_stats,
     user_callback_key,
+    OrderedWorkQueue,
+    ProcessOffload,
+    TvhCometWatcher,
+    TvhNowNextSnapshot,
     TvhDvrEntry,
+    TvhDvrStore,
+    TvhEpgStore,
+    TvhError,
+    TvhHttpError,
     TvhServerStatus,
     TvhUser,
+    WriteBehindState,
+    DeadlineScheduler,
+    StaleWhileRevalidateCache,
+    configure_hot_path_timings,
+    hot_path_timing,
+    hot_path_timing_stats,
 )
 
 
 _DVR_COMPLETION_LOCK = threading.RLock()
+_PLAYBACK_CHECK_LOCK = threading.Lock()
 
 
 class tvhhelper(_PluginBase):
@@ -180,18 +207,37 @@ class tvhhelper(_PluginBase):
     _ipdb_country_url = DEFAULT_IPDB_COUNTRY_URL
     _ipdb_asn_url = DEFAULT_IPDB_ASN_URL
     _ip2region_url = DEFAULT_IP2REGION_URL
+    _ip2region_cache_mode = DEFAULT_IP2REGION_CACHE_MODE
     _play_notify = True
     _play_notify_source = "auto"
+    _play_notify_comet = False
+    _comet_watcher: TvhCometWatcher | None = None
+    _webhook_async = False
+    _webhook_queue: OrderedWorkQueue | None = None
     _play_notify_users: dict[str, bool] = {}
     _play_notify_snapshot: dict[str, Any] | None = None
     _play_notify_pending_starts: dict[str, tuple[float, Any]] = {}
     _monitor: DvbMonitor | None = None
     _ip_location_cache: TimedValueCache | None = None
+    _ip_lookup_guard: IpLookupGuard | None = None
     _tvh_users_cache: TimedValueCache | None = None
-    _webhook_program_cache: TimedValueCache | None = None
+    _now_next_snapshot: TvhNowNextSnapshot | None = None
     _record_session_cache: TimedValueCache | None = None
     _dvr_reliability_alerts: TimedValueCache | None = None
-    _tvh_data_cache: dict[str, tuple[float, Any]] = {}
+    _tvh_data_cache: StaleWhileRevalidateCache | None = None
+    _tvh_cache_max_stale = 0
+    _prewarm = False
+    _prewarm_thread: threading.Thread | None = None
+    _prewarm_stats: dict[str, dict[str, Any]] = {}
+    _epg_server_filter = True
+    _epg_store: TvhEpgStore | None = None
+    _epg_process_offload = False
+    _epg_offload: ProcessOffload | None = None
+    _hot_path_timings = False
+    _epg_store_max_age = 120
+    _dvr_store: TvhDvrStore | None = None
+    _dvr_store_max_age = 10
+    _dvr_background_max_age = 3
     _playback_history: list[dict[str, Any]] = []
     _last_webhook_event = ""
     _last_webhook_seen_at: float | None = None
@@ -201,6 +247,9 @@ class tvhhelper(_PluginBase):
     _dvr_completion_data_key = "dvr_completion_notifications"
     _dvr_completion_retry_delays = (10, 30, 60)
     _dvr_completion_state: dict[str, Any] = {}
+    _dvr_completion_store: WriteBehindState | None = None
+    _dvr_completion_scheduler: DeadlineScheduler | None = None
+    _dvr_completion_notified_limit = 500
     _record_default_start_padding = DEFAULT_RECORD_START_PADDING_MINUTES
     _record_default_stop_padding = DEFAULT_RECORD_STOP_PADDING_MINUTES
     _record_search_cancel_words = {"取消", "退出", "cancel", "q", "quit", "exit"}
@@ -218,6 +267,7 @@ class tvhhelper(_PluginBase):
             self._webhook_notify = bool(config.get("webhook_notify", True))
             self._webhook_program_enrich = bool(config.get("webhook_program_enrich", True))
             self._webhook_logo_enrich = bool(config.get("webhook_logo_enrich", True))
+            self._webhook_async = bool(config.get("webhook_async", False))
             self._webhook_secret = config.get("webhook_secret") or ""
             self._webhook_hmac_secret = config.get("webhook_hmac_secret") or ""
             self._tvh_url = (config.get("tvh_url") or self._tvh_url).rstrip("/")
@@ -230,6 +280,10 @@ class tvhhelper(_PluginBase):
             self._play_notify_interval = normalize_interval(config.get("play_notify_interval"), 10, 5)
             self._dvr_reliability_enabled = bool(config.get("dvr_reliability_enabled", True))
             self._dvr_reliability_interval = normalize_interval(config.get("dvr_reliability_interval"), 60, 30)
+            self._tvh_cache_max_stale = max(0, self.__to_int(config.get("tvh_cache_max_stale"), 0))
+            self._prewarm = bool(config.get("prewarm", False))
+            self._epg_process_offload = bool(config.get("epg_process_offload", False))
+            self._hot_path_timings = bool(config.get("hot_path_timings", False))
             self._record_default_start_padding = self.__normalize_record_padding(
                 config.get("record_default_start_padding"),
                 DEFAULT_RECORD_START_PADDING_MINUTES,
@@ -254,28 +308,60 @@ class tvhhelper(_PluginBase):
                 LEGACY_IPDB_ASN_URLS,
             )
             self._ip2region_url = config.get("ip2region_url") or DEFAULT_IP2REGION_URL
+            self._ip2region_cache_mode = normalize_ip2region_cache_mode(config.get("ip2region_cache_mode"))
             self._play_notify_source = self.__normalize_play_notify_source(config.get("play_notify_source"))
+            self._play_notify_comet = bool(config.get("play_notify_comet", False))
             self._play_notify, self._play_notify_users = resolve_play_notify_settings(
                 self._play_notify,
                 self._play_notify_users,
                 config,
             )
         self._monitor = DvbMonitor(self._expected_dvb_count)
-        self._ip_location_cache = TimedValueCache(ttl_seconds=21600)
-        self._tvh_users_cache = TimedValueCache(ttl_seconds=10)
-        self._webhook_seen_events = TimedValueCache(ttl_seconds=600)
-        self._webhook_program_cache = TimedValueCache(ttl_seconds=60)
-        self._record_session_cache = TimedValueCache(ttl_seconds=900)
-        self._dvr_reliability_alerts = TimedValueCache(ttl_seconds=48 * 60 * 60)
-        self._tvh_data_cache = {}
+        set_ip2region_cache_mode(self._ip2region_cache_mode)
+        self._ip_location_cache = PersistentTimedValueCache(
+            self.__plugin_data_dir() / "ip_location_cache.sqlite3",
+            ttl_seconds=21600,
+            max_size=4096,
+            version=read_ip_location_db_version(self._ipdb_dir or self.__default_ipdb_dir()),
+        )
+        self._ip_lookup_guard = IpLookupGuard(negative_ttl_seconds=600)
+        self._tvh_users_cache = TimedValueCache(ttl_seconds=10, max_size=64, thread_safe=True)
+        self._webhook_seen_events = TimedValueCache(ttl_seconds=600, max_size=4096, thread_safe=True)
+        self._now_next_snapshot = TvhNowNextSnapshot(self._tvh_url, self._tvh_user, self._tvh_pass, timeout=2)
+        self._record_session_cache = TimedValueCache(ttl_seconds=900, max_size=256, thread_safe=True)
+        self._dvr_reliability_alerts = TimedValueCache(ttl_seconds=48 * 60 * 60, max_size=1024, thread_safe=True)
+        self._tvh_data_cache = StaleWhileRevalidateCache(max_stale=self._tvh_cache_max_stale)
+        self._epg_server_filter = True
+        if self._enabled and self._epg_process_offload:
+            self._epg_offload = ProcessOffload(threshold=2000, workers=2)
+        self._epg_store = TvhEpgStore(hours=24, offload=self._epg_offload)
+        self._dvr_store = TvhDvrStore()
+        configure_hot_path_timings(self._enabled and self._hot_path_timings)
         self._play_notify_snapshot = None
         self._playback_history = []
         self._last_webhook_event = ""
         self._last_webhook_seen_at = None
-        self._dvr_completion_state = self.__load_dvr_completion_state()
+        self._dvr_completion_state = self.__open_dvr_completion_state()
         self.__initialize_dvr_completion_baseline()
+        if self._enabled and self._webhook_notify:
+            self._dvr_completion_scheduler = DeadlineScheduler(
+                self.__run_due_dvr_completion_checks,
+                name="tvhhelper-dvr-completion",
+            )
+            self.__sync_dvr_completion_deadlines()
+            self._dvr_completion_scheduler.start()
         if self._enabled and self._ip_lookup_enabled and self._ipdb_enabled and self._ipdb_auto_update:
             self.__start_ipdb_update_async()
+        self.__start_comet_watcher()
+        if self._enabled and self._webhook_async:
+            self._webhook_queue = OrderedWorkQueue(
+                self.__process_queued_webhook,
+                workers=2,
+                max_size=256,
+                name="tvhhelper-webhook",
+            )
+        if self._enabled and self._prewarm:
+            self.__start_prewarm()
         self.__update_config()
 
     def __merge_existing_config(self, config: dict | None) -> dict | None:
@@ -297,6 +383,10 @@ class tvhhelper(_PluginBase):
         self._webhook_notify = True
         self._webhook_program_enrich = True
         self._webhook_logo_enrich = True
+        self._webhook_async = False
+        if self._webhook_queue:
+            self._webhook_queue.close()
+        self._webhook_queue = None
         self._webhook_secret = ""
         self._webhook_hmac_secret = ""
         self._tvh_url = "http://127.0.0.1:9981"
@@ -319,22 +409,43 @@ class tvhhelper(_PluginBase):
         self._ipdb_country_url = DEFAULT_IPDB_COUNTRY_URL
         self._ipdb_asn_url = DEFAULT_IPDB_ASN_URL
         self._ip2region_url = DEFAULT_IP2REGION_URL
+        self._ip2region_cache_mode = DEFAULT_IP2REGION_CACHE_MODE
         self._play_notify = True
         self._play_notify_source = "auto"
+        self._play_notify_comet = False
+        self.__stop_comet_watcher()
         self._play_notify_users = {}
         self._play_notify_snapshot = None
         self._play_notify_pending_starts = {}
         self._webhook_seen_events = None
+        if isinstance(self._ip_location_cache, PersistentTimedValueCache):
+            self._ip_location_cache.close()
         self._ip_location_cache = None
+        self._ip_lookup_guard = None
         self._tvh_users_cache = None
-        self._webhook_program_cache = None
+        self._now_next_snapshot = None
         self._record_session_cache = None
         self._dvr_reliability_alerts = None
-        self._tvh_data_cache = {}
+        self._tvh_data_cache = None
+        self._tvh_cache_max_stale = 0
+        self._prewarm = False
+        self._prewarm_thread = None
+        self._prewarm_stats = {}
+        self._epg_store = None
+        self._epg_process_offload = False
+        if self._epg_offload:
+            self._epg_offload.close()
+        self._epg_offload = None
+        self._hot_path_timings = False
+        self._dvr_store = None
         self._playback_history = []
         self._last_webhook_event = ""
         self._last_webhook_seen_at = None
         self._ipdb_update_running = False
+        if self._dvr_completion_scheduler:
+            self._dvr_completion_scheduler.stop()
+        self._dvr_completion_scheduler = None
+        self.__close_dvr_completion_store()
         self._dvr_completion_state = {}
 
     @staticmethod
@@ -355,25 +466,47 @@ class tvhhelper(_PluginBase):
             return default
 
     def __cached_tvh_data(self, key: str, ttl_seconds: int, loader, force_refresh: bool = False):
+        if self._tvh_data_cache is None:
+            return loader()
         cache_key = "|".join([self._tvh_url, self._tvh_user, key])
-        now = time.time()
-        if not force_refresh:
-            item = self._tvh_data_cache.get(cache_key)
-            if item:
-                expires_at, value = item
-                if expires_at > now:
-                    return value
-                self._tvh_data_cache.pop(cache_key, None)
-        value = loader()
-        self._tvh_data_cache[cache_key] = (now + max(0, int(ttl_seconds or 0)), value)
-        return value
+        return self._tvh_data_cache.get(cache_key, ttl_seconds, loader, force_refresh=force_refresh)
+
+    def __start_prewarm(self):
+        """启动后在后台并行拉取菜单常用数据，首次 /tvh 直接命中缓存。"""
+        stages = {
+            "status": lambda: self.__status_text(),
+            "dvr_entries": lambda: self.__tvh_dvr_entries(),
+            "dvr_configs": lambda: self.__tvh_dvr_configs(),
+            "channels": lambda: self.__tvh_channels(),
+            "users": lambda: self.__tvh_users(),
+        }
+
+        def run():
+            started = time.perf_counter()
+            stats = run_warmup_stages(stages, max_workers=3)
+            self._prewarm_stats = stats
+            summary = ", ".join(
+                f"{name} {item['seconds'] * 1000:.0f}ms" + (" 失败" if item["error"] else "")
+                for name, item in stats.items()
+            )
+            logger.info(f"TVH助手数据预热完成，耗时 {time.perf_counter() - started:.2f}s: {summary}")
+            for name, item in stats.items():
+                if item["error"]:
+                    logger.debug(f"TVH助手预热 {name} 失败: {item['error']}")
+
+        self._prewarm_thread = threading.Thread(target=run, name="tvhhelper-prewarm", daemon=True)
+        self._prewarm_thread.start()
 
     def __clear_tvh_data_cache(self, prefix: str | None = None) -> None:
+        if self._dvr_store and (not prefix or prefix == "dvr_entries"):
+            self._dvr_store.invalidate()
+        if self._tvh_data_cache is None:
+            return
         if not prefix:
             self._tvh_data_cache.clear()
             return
         marker = f"|{prefix}"
-        for key in list(self._tvh_data_cache.keys()):
+        for key in self._tvh_data_cache.keys():
             if marker in key:
                 self._tvh_data_cache.pop(key, None)
 
@@ -384,6 +517,7 @@ class tvhhelper(_PluginBase):
             "webhook_notify": self._webhook_notify,
             "webhook_program_enrich": self._webhook_program_enrich,
             "webhook_logo_enrich": self._webhook_logo_enrich,
+            "webhook_async": self._webhook_async,
             "webhook_secret": self._webhook_secret,
             "webhook_hmac_secret": self._webhook_hmac_secret,
             "tvh_url": self._tvh_url,
@@ -396,6 +530,10 @@ class tvhhelper(_PluginBase):
             "play_notify_interval": self._play_notify_interval,
             "dvr_reliability_enabled": self._dvr_reliability_enabled,
             "dvr_reliability_interval": self._dvr_reliability_interval,
+            "tvh_cache_max_stale": self._tvh_cache_max_stale,
+            "prewarm": self._prewarm,
+            "epg_process_offload": self._epg_process_offload,
+            "hot_path_timings": self._hot_path_timings,
             "record_default_start_padding": self._record_default_start_padding,
             "record_default_stop_padding": self._record_default_stop_padding,
             "ip_lookup_enabled": self._ip_lookup_enabled,
@@ -406,15 +544,21 @@ class tvhhelper(_PluginBase):
             "ipdb_country_url": self._ipdb_country_url,
             "ipdb_asn_url": self._ipdb_asn_url,
             "ip2region_url": self._ip2region_url,
+            "ip2region_cache_mode": self._ip2region_cache_mode,
             "play_notify": self._play_notify,
             "play_notify_source": self._play_notify_source,
+            "play_notify_comet": self._play_notify_comet,
             "play_notify_users": self._play_notify_users,
         })
 
     @staticmethod
-    def __default_ipdb_dir() -> str:
+    def __plugin_data_dir() -> Path:
         config_dir = getattr(settings, "CONFIG_DIR", "/config") or "/config"
-        return str(Path(config_dir) / "plugins" / "tvhhelper" / "ipdb")
+        return Path(config_dir) / "plugins" / "tvhhelper"
+
+    @staticmethod
+    def __default_ipdb_dir() -> str:
+        return str(tvhhelper.__plugin_data_dir() / "ipdb")
 
     @staticmethod
     def __normalize_ipdb_url(value: Any, default: str, legacy_urls: set[str]) -> str:
@@ -475,7 +619,10 @@ class tvhhelper(_PluginBase):
         data = getattr(event, "event_data", None)
         plugin_id = getattr(data, "plugin_id", None)
         reset_config = getattr(data, "reset_config", False)
-        if plugin_id != self.__class__.__name__ or not reset_config:
+        if plugin_id != self.__class__.__name__:
+            return
+        self.__reset_dvr_completion_state()
+        if not reset_config:
             return
         SystemConfigOper().delete(f"plugin.{self.__class__.__name__}")
 
@@ -1041,25 +1188,27 @@ class tvhhelper(_PluginBase):
 
     def __reply(self, event: Event, title: str, text: str, **kwargs):
         text = self.__append_button_text(text, kwargs.get("buttons"))
-        return self.chain.post_message(Notification(
-            channel=event.event_data.get("channel"),
-            title=title,
-            text=text,
-            userid=event.event_data.get("user") or event.event_data.get("userid"),
-            **kwargs,
-        ))
+        with hot_path_timing("message.send"):
+            return self.chain.post_message(Notification(
+                channel=event.event_data.get("channel"),
+                title=title,
+                text=text,
+                userid=event.event_data.get("user") or event.event_data.get("userid"),
+                **kwargs,
+            ))
 
     def __reply_copy(self, event: Event, title: str, text: str, **kwargs):
         text = self.__append_button_text(text, kwargs.get("buttons"))
-        return self.chain.post_message(Notification(
-            channel=event.event_data.get("channel"),
-            title=title,
-            text=text,
-            userid=event.event_data.get("user") or event.event_data.get("userid"),
-            disable_web_page_preview=True,
-            parse_mode="Markdown",
-            **kwargs,
-        ))
+        with hot_path_timing("message.send"):
+            return self.chain.post_message(Notification(
+                channel=event.event_data.get("channel"),
+                title=title,
+                text=text,
+                userid=event.event_data.get("user") or event.event_data.get("userid"),
+                disable_web_page_preview=True,
+                parse_mode="Markdown",
+                **kwargs,
+            ))
 
     def __edit_or_reply(self, event: Event, title: str, text: str, **kwargs):
         if self.__edit_original(event, title, text, **kwargs):
@@ -1073,6 +1222,10 @@ class tvhhelper(_PluginBase):
 
     def __post_tvh_notification(self, title: str, text: str, **kwargs):
         """按通知渠道发送TVH通知，Telegram保留等宽格式。"""
+        with hot_path_timing("message.send"):
+            self.__post_tvh_notification_to_channels(title, text, **kwargs)
+
+    def __post_tvh_notification_to_channels(self, title: str, text: str, **kwargs):
         channels = self.__enabled_notification_channels()
         if not channels:
             self.post_message(title=title, text=text, parse_mode="Markdown", **kwargs)
@@ -1193,6 +1346,10 @@ class tvhhelper(_PluginBase):
         )
 
     def __load_status_text(self) -> str:
+        with hot_path_timing("status"):
+            return self.__build_status_text()
+
+    def __build_status_text(self) -> str:
         self.__sync_play_notify_config()
         status, inputs, subscriptions = fetch_tvh_status_bundle(
             lambda: fetch_tvh_status(self._tvh_url, self._tvh_user, self._tvh_pass),
@@ -1202,12 +1359,14 @@ class tvhhelper(_PluginBase):
         )
         subscriptions = self.__enrich_ip_locations(subscriptions)
         try:
-            dvr_summary = summarize_tvh_dvr_entries(
-                fetch_tvh_dvr_entries(self._tvh_url, self._tvh_user, self._tvh_pass)
-            )
+            dvr_summary = summarize_tvh_dvr_entries(self.__tvh_dvr_entries())
         except Exception as err:
             logger.debug(f"TVH录制任务摘要读取失败: {err}")
             dvr_summary = None
+        with hot_path_timing("format.status"):
+            return self.__format_status_text(status, inputs, subscriptions, dvr_summary)
+
+    def __format_status_text(self, status, inputs, subscriptions, dvr_summary) -> str:
         return format_status_message(
             status.ok,
             status.version,
@@ -1223,8 +1382,21 @@ class tvhhelper(_PluginBase):
             webhook_notify_enabled=self._webhook_notify,
             webhook_last_event=self._last_webhook_event,
             webhook_last_seen_at=self._last_webhook_seen_at,
+            http_stats=tvh_http_client_stats(self._tvh_url, self._tvh_user),
+            ip_lookup_stats=self.__ip_lookup_stats(),
         )
 
+    def __ip_lookup_stats(self) -> dict[str, Any] | None:
+        if not self._ip_lookup_enabled or not self._ip_location_cache:
+            return None
+        stats: dict[str, Any] = {
+            "cache_hits": self._ip_location_cache.hits,
+            "cache_misses": self._ip_location_cache.misses,
+        }
+        if self._ip_lookup_guard:
+            stats.update(self._ip_lookup_guard.stats())
+        return stats
+
     def __online_users_text(self, subscriptions) -> str:
         return "\n".join(format_status_message(True, None, [], 0, subscriptions).splitlines()[3:])
 
@@ -2054,9 +2226,14 @@ class tvhhelper(_PluginBase):
             logger.debug(f"TVH节目搜索清理输入会话失败: {err}")
 
     def __run_record_search(self, event: Event, keyword: str) -> None:
+        with hot_path_timing("record_search"):
+            self.__search_record_events(event, keyword)
+
+    def __search_record_events(self, event: Event, keyword: str) -> None:
         try:
-            events = fetch_tvh_epg_events(self._tvh_url, self._tvh_user, self._tvh_pass, hours=24)
-            results = search_tvh_epg_events(events, keyword, now=int(time.time()), limit=10)
+            events = self.__tvh_epg_store().events()
+            with hot_path_timing("epg.search"):
+                results = search_tvh_epg_events(events, keyword, now=int(time.time()), limit=10)
         except Exception as err:
             logger.error(f"TVH节目搜索失败: {err}", exc_info=True)
             self.__edit_or_reply(
@@ -2251,7 +2428,7 @@ class tvhhelper(_PluginBase):
             logger.debug(f"TVH预约录制DVB检查失败: {err}")
             inputs = []
         try:
-            entries = self.__cached_tvh_data_value("dvr_entries") or []
+            entries = self.__fresh_tvh_dvr_entries()
         except Exception as err:
             logger.debug(f"TVH预约录制任务检查失败: {err}")
             entries = []
@@ -2285,17 +2462,6 @@ class tvhhelper(_PluginBase):
             return []
         return parse_tvh_inputs(payload)
 
-    def __cached_tvh_data_value(self, key: str):
-        cache_key = "|".join([self._tvh_url, self._tvh_user, key])
-        item = self._tvh_data_cache.get(cache_key)
-        if not item:
-            return None
-        expires_at, value = item
-        if expires_at <= time.time():
-            self._tvh_data_cache.pop(cache_key, None)
-            return None
-        return value
-
     @staticmethod
     def __optional_int(value) -> int | None:
         try:
@@ -2412,7 +2578,7 @@ class tvhhelper(_PluginBase):
 
     def __record_merge_candidate(self, session: dict[str, Any], selected) -> TvhDvrEntry | None:
         try:
-            entries = fetch_tvh_dvr_entries(self._tvh_url, self._tvh_user, self._tvh_pass)
+            entries = self.__tvh_dvr_entries()
         except Exception as err:
             logger.debug(f"TVH预约录制合并检测失败: {err}")
             return None
@@ -2434,14 +2600,14 @@ class tvhhelper(_PluginBase):
 
     def __create_record_session(self, data: dict[str, Any]) -> str:
         if not self._record_session_cache:
-            self._record_session_cache = TimedValueCache(ttl_seconds=900)
+            self._record_session_cache = TimedValueCache(ttl_seconds=900, max_size=256, thread_safe=True)
         session_id = secrets.token_urlsafe(8)
         self._record_session_cache.set(session_id, data)
         return session_id
 
     def __save_record_session(self, session_id: str, data: dict[str, Any]) -> None:
         if not self._record_session_cache:
-            self._record_session_cache = TimedValueCache(ttl_seconds=900)
+            self._record_session_cache = TimedValueCache(ttl_seconds=900, max_size=256, thread_safe=True)
         self._record_session_cache.set(session_id, data)
 
     def __record_session(self, session_id: str) -> dict[str, Any]:
@@ -2491,27 +2657,108 @@ class tvhhelper(_PluginBase):
     def __tvh_epg_events(self, channel) -> list[Any]:
         channel_uuid = getattr(channel, "uuid", "") or ""
         channel_name = getattr(channel, "name", "") or ""
-        return self.__cached_tvh_data(
-            f"epg|{channel_uuid}|{channel_name}|24",
-            60,
-            lambda: fetch_tvh_epg_events(
-                self._tvh_url,
-                self._tvh_user,
-                self._tvh_pass,
-                channel_uuid=channel_uuid,
-                channel_name=channel_name,
-                hours=24,
-            ),
+        store_age = self._epg_store.age() if self._epg_store else None
+        if store_age is not None and store_age <= self._epg_store_max_age:
+            return self._epg_store.window(channel_uuid, channel_name, hours=24)
+        if self._epg_server_filter:
+            try:
+                return self.__cached_tvh_data(
+                    f"epg|{channel_uuid}|{channel_name}|24",
+                    60,
+                    lambda: fetch_tvh_epg_events(
+                        self._tvh_url,
+                        self._tvh_user,
+                        self._tvh_pass,
+                        channel_uuid=channel_uuid,
+                        channel_name=channel_name,
+                        hours=24,
+                        server_filter=True,
+                    ),
+                )
+            except TvhError as err:
+                logger.info(f"TVH节目指南按频道过滤失败，改用整份指南索引: {err}")
+                if self.__server_filter_rejected(err):
+                    self._epg_server_filter = False
+        return self.__tvh_epg_store().window(channel_uuid, channel_name, hours=24)
+
+    def __tvh_epg_store(self) -> TvhEpgStore:
+        """返回常驻节目指南，尚未加载或后台刷新中断时同步刷新一次。"""
+        if self._epg_store is None:
+            self._epg_store = TvhEpgStore(hours=24, offload=self._epg_offload)
+        store = self._epg_store
+        store_age = store.age()
+        if store_age is not None and store_age <= self._epg_store_max_age:
+            return store
+        try:
+            store.refresh(self.__fetch_epg_store_events)
+        except Exception as err:
+            if not store.loaded:
+                raise
+            logger.warning(f"TVH节目指南刷新失败，继续使用内存数据: {err}")
+        return store
+
+    def __fetch_epg_store_events(self, start_from: int | None) -> list[Any]:
+        if start_from is not None and self._epg_server_filter:
+            try:
+                return fetch_tvh_epg_events(
+                    self._tvh_url,
+                    self._tvh_user,
+                    self._tvh_pass,
+                    hours=24,
+                    server_filter=True,
+                    start_from=start_from,
+                    offload=self._epg_offload,
+                )
+            except TvhError as err:
+                logger.info(f"TVH节目指南增量过滤失败，改用整份指南: {err}")
+                if self.__server_filter_rejected(err):
+                    self._epg_server_filter = False
+        return fetch_tvh_epg_events(
+            self._tvh_url,
+            self._tvh_user,
+            self._tvh_pass,
+            hours=24,
+            start_from=start_from,
+            offload=self._epg_offload,
         )
 
-    def __tvh_dvr_entries(self, force_refresh: bool = False):
-        return self.__cached_tvh_data(
-            "dvr_entries",
-            10,
+    @staticmethod
+    def __server_filter_rejected(err: TvhError) -> bool:
+        """只有 TVH 明确拒绝过滤条件（HTTP 400）时才停用服务端过滤；超时、断线或认证失败只影响本次请求。"""
+        return isinstance(err, TvhHttpError) and err.status == 400
+
+    def refresh_epg_store(self):
+        """后台增量刷新已加载的节目指南，合并新节目并清理已结束节目。"""
+        if not self._enabled or not self._epg_store or not self._epg_store.loaded:
+            return
+        try:
+            self._epg_store.refresh(self.__fetch_epg_store_events)
+        except Exception as err:
+            logger.debug(f"TVH节目指南后台刷新失败: {err}")
+
+    def __tvh_dvr_entries(self, force_refresh: bool = False, max_age: float | None = None):
+        """返回共享录制任务快照，超过有效期或强制刷新时重新拉取；并发调用只拉取一次。
+
+        强制刷新只用于响应用户操作；后台检查和 Webhook 传入较短的 max_age，复用刚拉取的快照。
+        """
+        if self._dvr_store is None:
+            self._dvr_store = TvhDvrStore()
+        if force_refresh:
+            max_age = None
+        elif max_age is None:
+            max_age = self._dvr_store_max_age
+        return self._dvr_store.load(
             lambda: fetch_tvh_dvr_entries(self._tvh_url, self._tvh_user, self._tvh_pass),
-            force_refresh=force_refresh,
+            max_age=max_age,
         )
 
+    def __fresh_tvh_dvr_entries(self):
+        """只读取仍在有效期内的录制任务快照，不触发拉取。"""
+        store = self._dvr_store
+        if not store or not store.is_fresh(self._dvr_store_max_age):
+            return []
+        return store.snapshot()
+
     def __tvh_dvr_configs(self):
         return self.__cached_tvh_data(
             "dvr_configs",
@@ -2546,11 +2793,16 @@ class tvhhelper(_PluginBase):
 
     def __enrich_ip_locations(self, subscriptions):
         try:
-            return enrich_subscriptions_with_ip_locations(
-                subscriptions,
-                cache=self._ip_location_cache,
-                enabled=self._ip_lookup_enabled,
-            )
+            with hot_path_timing("ip.enrich"):
+                return enrich_subscriptions_with_ip_locations(
+                    subscriptions,
+                    cache=self._ip_location_cache,
+                    enabled=self._ip_lookup_enabled,
+                    local_resolver=self.__lookup_local_ip if self._ipdb_enabled else None,
+                    local_complete=lambda result: all(result) and not self.__is_weak_ip_location(result[0]),
+                    merge=self.__merge_ip_lookup_result,
+                    guard=self._ip_lookup_guard,
+                )
         except Exception as err:
             logger.warning(f"TVH IP 归属地查询失败，已跳过: {err}")
             return subscriptions
@@ -2581,12 +2833,16 @@ class tvhhelper(_PluginBase):
             )
 
     def check_dvr_reliability(self):
+        with hot_path_timing("dvr.reliability"):
+            self.__check_dvr_reliability()
+
+    def __check_dvr_reliability(self):
         if not self._enabled or not self._dvr_reliability_enabled:
             return
         try:
             status = fetch_tvh_status(self._tvh_url, self._tvh_user, self._tvh_pass)
             inputs = self.__tvh_inputs()
-            entries = self.__tvh_dvr_entries(force_refresh=True)
+            entries = self.__tvh_dvr_entries(max_age=self._dvr_background_max_age)
             issues = analyze_tvh_dvr_reliability(
                 entries,
                 status=status,
@@ -2618,7 +2874,6 @@ class tvhhelper(_PluginBase):
         """检查TVH录制文件是否从缺失状态恢复为可读。"""
         current = build_tvh_dvr_storage_snapshot(entries)
         with _DVR_COMPLETION_LOCK:
-            self._dvr_completion_state = self.__load_dvr_completion_state()
             recovery_missing_ids = set(self._dvr_completion_state.get("recovery_missing_ids") or [])
             current_missing_ids = set(current.get("missing_ids") or [])
             current_readable_ids = set(current.get("readable_ids") or [])
@@ -2646,7 +2901,6 @@ class tvhhelper(_PluginBase):
             )
         except Exception as err:
             with _DVR_COMPLETION_LOCK:
-                self._dvr_completion_state = self.__load_dvr_completion_state()
                 latest_missing_ids = set(self._dvr_completion_state.get("recovery_missing_ids") or [])
                 latest_missing_ids.update(recovery_missing_ids)
                 self._dvr_completion_state["recovery_missing_ids"] = sorted(latest_missing_ids)
@@ -2655,7 +2909,7 @@ class tvhhelper(_PluginBase):
 
     def __dvr_reliability_alert_seen(self, key: str) -> bool:
         if self._dvr_reliability_alerts is None:
-            self._dvr_reliability_alerts = TimedValueCache(ttl_seconds=48 * 60 * 60)
+            self._dvr_reliability_alerts = TimedValueCache(ttl_seconds=48 * 60 * 60, max_size=1024, thread_safe=True)
         if self._dvr_reliability_alerts.get(key):
             return True
         self._dvr_reliability_alerts.set(key, True)
@@ -2684,9 +2938,46 @@ class tvhhelper(_PluginBase):
         }.get(issue_type, "TVH录制可靠性提醒")
 
     def check_playback(self):
+        with hot_path_timing("playback.check"):
+            self.__check_playback()
+
+    def __check_playback(self):
+        self.__sync_play_notify_config()
+        if not self._enabled or not self.__should_poll_playback():
+            return
+        if self.__comet_driven() and not self._play_notify_pending_starts:
+            return
+        with _PLAYBACK_CHECK_LOCK:
+            self.__check_playback_changes()
+
+    def __comet_driven(self) -> bool:
+        """Comet 推送正常时由通知驱动播放检查，定时任务只处理等待确认的开始事件。"""
+        return bool(self._comet_watcher and self._comet_watcher.healthy)
+
+    def __on_comet_playback_change(self):
         self.__sync_play_notify_config()
         if not self._enabled or not self.__should_poll_playback():
             return
+        with _PLAYBACK_CHECK_LOCK:
+            self.__check_playback_changes()
+
+    def __start_comet_watcher(self):
+        self.__stop_comet_watcher()
+        if not self._enabled or not self._play_notify_comet or not self.__should_poll_playback():
+            return
+        self._comet_watcher = TvhCometWatcher(
+            make_tvh_comet_poller(self._tvh_url, self._tvh_user, self._tvh_pass),
+            self.__on_comet_playback_change,
+            max_backoff=max(30, self._play_notify_interval * 6),
+        )
+        self._comet_watcher.start()
+
+    def __stop_comet_watcher(self):
+        if self._comet_watcher:
+            self._comet_watcher.stop()
+        self._comet_watcher = None
+
+    def __check_playback_changes(self):
         if not any(self._play_notify_users.values()):
             self._play_notify_snapshot = None
             self._play_notify_pending_starts = {}
@@ -2792,6 +3083,13 @@ class tvhhelper(_PluginBase):
                 "func": self.check_playback,
                 "kwargs": {},
             })
+        services.append({
+            "id": "tvhhelper_epg_refresh",
+            "name": "TVH节目指南刷新",
+            "trigger": IntervalTrigger(seconds=60, timezone=settings.TZ),
+            "func": self.refresh_epg_store,
+            "kwargs": {},
+        })
         if self._dvr_reliability_enabled:
             services.append({
                 "id": "tvhhelper_dvr_reliability",
@@ -2800,14 +3098,6 @@ class tvhhelper(_PluginBase):
                 "func": self.check_dvr_reliability,
                 "kwargs": {},
             })
-        if self._webhook_notify:
-            services.append({
-                "id": "tvhhelper_dvr_completion_pending",
-                "name": "TVH录制文件就绪检查",
-                "trigger": IntervalTrigger(seconds=10, timezone=settings.TZ),
-                "func": self.check_dvr_completion_pending,
-                "kwargs": {},
-            })
         if self._ip_lookup_enabled and self._ipdb_enabled and self._ipdb_auto_update:
             services.append({
                 "id": "tvhhelper_ipdb_update",
@@ -2825,9 +3115,20 @@ class tvhhelper(_PluginBase):
                 "endpoint": self.receive_webhook,
                 "methods": ["POST"],
                 "summary": "接收TVHeadend Webhook通知",
-            }
+            },
+            {
+                "path": "/timings",
+                "endpoint": self.get_hot_path_timings,
+                "methods": ["GET"],
+                "summary": "热路径耗时统计",
+            },
         ]
 
+    def get_hot_path_timings(self, apikey: str = ""):
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data=hot_path_timing_stats())
+
     def receive_webhook(
         self,
         payload: Optional[Dict[str, Any]] = Body(default=None),
@@ -2836,6 +3137,10 @@ class tvhhelper(_PluginBase):
         x_tvh_signature_input: Optional[str] = Header(default=None),
         apikey: str = "",
     ):
+        with hot_path_timing("webhook"):
+            return self.__receive_webhook(payload, x_tvh_token, x_tvh_signature, x_tvh_signature_input, apikey)
+
+    def __receive_webhook(self, payload, x_tvh_token, x_tvh_signature, x_tvh_signature_input, apikey):
         if not self._enabled:
             return schemas.Response(success=False, message="TVH助手未启用")
         if not isinstance(payload, dict):
@@ -2864,6 +3169,27 @@ class tvhhelper(_PluginBase):
 
         self._last_webhook_event = event or "未知事件"
         self._last_webhook_seen_at = time.time()
+        if self._webhook_queue:
+            if self._webhook_queue.submit(event.split(".", 1)[0] or "unknown", payload):
+                return schemas.Response(success=True, message="Webhook已加入处理队列")
+            if event_id and self._webhook_seen_events:
+                self._webhook_seen_events.delete(event_id)
+            logger.warning(f"TVH Webhook处理队列已满，丢弃: {event} {event_id}")
+            return schemas.Response(success=False, message="Webhook处理队列已满")
+        return self.__process_webhook(payload)
+
+    def __process_queued_webhook(self, payload: Dict[str, Any]) -> None:
+        try:
+            response = self.__process_webhook(payload)
+        except Exception as err:
+            logger.error(f"TVH Webhook后台处理失败: {payload.get('event')} {err}", exc_info=True)
+            raise
+        if not getattr(response, "success", True):
+            logger.warning(f"TVH Webhook后台处理失败: {payload.get('event')} {getattr(response, 'message', '')}")
+
+    def __process_webhook(self, payload: Dict[str, Any]):
+        """补全节目、录制和IP信息并发送通知；同步模式在请求内调用，异步模式由队列工作线程调用。"""
+        event = str(payload.get("event") or "")
         payload = self.__enrich_webhook_program(payload)
         payload = self.__enrich_webhook_dvr(payload)
         ip_location, ip_isp = self.__lookup_webhook_ip(payload.get("ip"))
@@ -2872,7 +3198,6 @@ class tvhhelper(_PluginBase):
         if self._webhook_notify and self.__should_send_webhook_notification(payload):
             if event == "dvr.complete":
                 with _DVR_COMPLETION_LOCK:
-                    self._dvr_completion_state = self.__load_dvr_completion_state()
                     notification_key = self.__dvr_completion_key(payload)
                     if self.__dvr_completion_notified(notification_key):
                         return schemas.Response(success=True, message="录制完成通知已发送")
@@ -2940,12 +3265,13 @@ class tvhhelper(_PluginBase):
                     "next_check_at": next_check_at,
                 }
         raw_notified = saved.get("notified") if isinstance(saved.get("notified"), dict) else {}
-        notified = {}
+        notified_items = []
         for key, value in raw_notified.items():
             try:
-                notified[str(key)] = float(value)
+                notified_items.append((str(key), float(value)))
             except (TypeError, ValueError):
                 continue
+        notified = OrderedDict(sorted(notified_items, key=lambda item: item[1]))
         raw_snapshot = saved.get("storage_snapshot") if isinstance(saved.get("storage_snapshot"), dict) else {}
         storage_snapshot = {
             "readable": self.__to_int(raw_snapshot.get("readable"), 0),
@@ -2967,15 +3293,95 @@ class tvhhelper(_PluginBase):
             "baseline_initialized_at": self.__safe_float(saved.get("baseline_initialized_at")),
         }
 
+    def __open_dvr_completion_state(self) -> dict[str, Any]:
+        """启动时读取一次录制通知状态并重放未写回的日志，此后以内存状态为准。"""
+        self.__close_dvr_completion_store()
+        self._dvr_completion_store = WriteBehindState(
+            self.__plugin_data_dir() / "dvr_completion.journal",
+            lambda state: self.save_data(self._dvr_completion_data_key, state),
+            delay=2,
+            lock=_DVR_COMPLETION_LOCK,
+        )
+        state, replayed = self._dvr_completion_store.load(self.__load_dvr_completion_state())
+        if replayed:
+            logger.info(f"TVH录制通知状态已从日志恢复 {replayed} 项变更")
+            self._dvr_completion_store.flush()
+        return state
+
+    def __close_dvr_completion_store(self) -> None:
+        if self._dvr_completion_store:
+            if not self._dvr_completion_store.close():
+                logger.warning("TVH录制通知状态写回失败，变更保留在本地日志中")
+        self._dvr_completion_store = None
+
+    def __reset_dvr_completion_state(self) -> None:
+        """插件数据重置后清空内存中的录制通知状态和本地日志，避免下一次写回把旧记录写回去。"""
+        with _DVR_COMPLETION_LOCK:
+            state = {
+                "pending": {},
+                "notified": OrderedDict(),
+                "storage_snapshot": {},
+                "recovery_missing_ids": [],
+                "baseline_initialized_at": None,
+            }
+            if self._dvr_completion_store:
+                self._dvr_completion_store.reset(state)
+            else:
+                try:
+                    (self.__plugin_data_dir() / "dvr_completion.journal").unlink(missing_ok=True)
+                except OSError as err:
+                    logger.debug(f"TVH录制通知日志清理失败: {err}")
+            self._dvr_completion_state = state
+            self.__sync_dvr_completion_deadlines()
+
+    def __flush_dvr_completion_state(self) -> bool:
+        return self._dvr_completion_store.flush() if self._dvr_completion_store else True
+
+    def __sync_dvr_completion_deadlines(self) -> None:
+        """把待复查任务的下次检查时间同步到截止时间调度器。"""
+        if not self._dvr_completion_scheduler:
+            return
+        with _DVR_COMPLETION_LOCK:
+            deadlines = {}
+            for key, item in (self._dvr_completion_state.get("pending") or {}).items():
+                next_check_at = self.__safe_float(item.get("next_check_at")) if isinstance(item, dict) else None
+                deadlines[key] = next_check_at if next_check_at is not None else 0.0
+            self._dvr_completion_scheduler.sync(deadlines)
+
+    def __run_due_dvr_completion_checks(self, keys: list[str]) -> None:
+        try:
+            self.check_dvr_completion_pending()
+        finally:
+            self.__sync_dvr_completion_deadlines()
+
+    def __dvr_completion_notified_map(self) -> OrderedDict:
+        notified = self._dvr_completion_state.get("notified")
+        if not isinstance(notified, OrderedDict):
+            notified = OrderedDict(notified or {})
+            self._dvr_completion_state["notified"] = notified
+        return notified
+
+    def __remember_dvr_completion_notified(self, notification_key: str, notified_at: float) -> None:
+        """记录已通知的录制，超出上限时淘汰最早的一项。"""
+        notified = self.__dvr_completion_notified_map()
+        notified[notification_key] = notified_at
+        notified.move_to_end(notification_key)
+        while len(notified) > self._dvr_completion_notified_limit:
+            notified.popitem(last=False)
+
     def __save_dvr_completion_state(self) -> bool:
-        """保存录制文件就绪通知状态并限制防重数量。"""
-        notified = self._dvr_completion_state.setdefault("notified", {})
-        if len(notified) > 500:
-            newest = sorted(notified.items(), key=lambda item: float(item[1] or 0), reverse=True)[:500]
-            self._dvr_completion_state["notified"] = dict(newest)
+        """提交录制文件就绪通知状态：变更先落本地日志，再合并写回插件数据。"""
+        notified = self.__dvr_completion_notified_map()
+        while len(notified) > self._dvr_completion_notified_limit:
+            notified.popitem(last=False)
         try:
-            self.save_data(self._dvr_completion_data_key, self._dvr_completion_state)
-            return True
+            if self._dvr_completion_store is None:
+                self.save_data(self._dvr_completion_data_key, self._dvr_completion_state)
+                return True
+            if self._dvr_completion_store.commit(self._dvr_completion_state):
+                self.__sync_dvr_completion_deadlines()
+                return True
+            raise OSError("录制通知日志写入失败")
         except Exception as err:
             logger.warning(f"TVH录制通知状态保存失败: {err}")
             return False
@@ -3002,7 +3408,6 @@ class tvhhelper(_PluginBase):
         if not self._tvh_user and not self._tvh_pass:
             return
         with _DVR_COMPLETION_LOCK:
-            self._dvr_completion_state = self.__load_dvr_completion_state()
             if self._dvr_completion_state.get("baseline_initialized_at") is not None:
                 return
             if self._dvr_completion_state.get("pending") or self._dvr_completion_state.get("notified"):
@@ -3012,11 +3417,10 @@ class tvhhelper(_PluginBase):
             now_value = time.time()
             cutoff = now_value - 120
             try:
-                entries = fetch_tvh_dvr_entries(self._tvh_url, self._tvh_user, self._tvh_pass)
+                entries = self.__tvh_dvr_entries(max_age=self._dvr_background_max_age)
             except Exception as err:
                 logger.warning(f"TVH录制完成历史基线读取失败: {err}")
                 return
-            notified = self._dvr_completion_state.setdefault("notified", {})
             for entry in entries:
                 if not is_tvh_dvr_file_available(entry):
                     continue
@@ -3027,14 +3431,14 @@ class tvhhelper(_PluginBase):
                     "dvr_uuid": getattr(entry, "uuid", ""),
                     "filename": getattr(entry, "filename", ""),
                 })
-                notified[notification_key] = now_value
+                self.__remember_dvr_completion_notified(notification_key, now_value)
             self._dvr_completion_state["baseline_initialized_at"] = now_value
             self.__save_dvr_completion_state()
 
     def __mark_dvr_completion_notified(self, notification_key: str) -> bool:
         """标记录制完成通知已发送。"""
         self._dvr_completion_state.setdefault("pending", {}).pop(notification_key, None)
-        self._dvr_completion_state.setdefault("notified", {})[notification_key] = time.time()
+        self.__remember_dvr_completion_notified(notification_key, time.time())
         return self.__save_dvr_completion_state()
 
     @staticmethod
@@ -3103,7 +3507,7 @@ class tvhhelper(_PluginBase):
         pending = self._dvr_completion_state.setdefault("pending", {})
         if attempts >= len(self._dvr_completion_retry_delays):
             pending.pop(notification_key, None)
-            self._dvr_completion_state.setdefault("notified", {})[notification_key] = now_value
+            self.__remember_dvr_completion_notified(notification_key, now_value)
             return {
                 "title": "TVH录制文件检查失败" if api_error else "TVH录制文件未就绪",
                 "text": (
@@ -3127,7 +3531,8 @@ class tvhhelper(_PluginBase):
             return
         now_value = float(now if now is not None else time.time())
         with _DVR_COMPLETION_LOCK:
-            self._dvr_completion_state = self.__load_dvr_completion_state()
+            if not self._dvr_completion_state.get("pending"):
+                return
             pending = self._dvr_completion_state.setdefault("pending", {})
             due = {}
             invalid_keys = []
@@ -3145,7 +3550,7 @@ class tvhhelper(_PluginBase):
                     self.__save_dvr_completion_state()
                 return
             try:
-                entries = fetch_tvh_dvr_entries(self._tvh_url, self._tvh_user, self._tvh_pass)
+                entries = self.__tvh_dvr_entries(max_age=self._dvr_background_max_age)
             except Exception as err:
                 logger.warning(f"TVH录制文件就绪复查失败: {err}")
                 alerts = []
@@ -3186,7 +3591,7 @@ class tvhhelper(_PluginBase):
                     payload = self.__enrich_dvr_payload_from_entry(payload, entry)
                 if self.__dvr_payload_file_available(payload):
                     pending.pop(notification_key, None)
-                    self._dvr_completion_state.setdefault("notified", {})[notification_key] = now_value
+                    self.__remember_dvr_completion_notified(notification_key, now_value)
                     completed_payloads.append((notification_key, original_item, payload))
                     continue
                 item["payload"] = payload
@@ -3263,24 +3668,23 @@ class tvhhelper(_PluginBase):
         if payload.get("filesize") or payload.get("data_size"):
             return payload
         try:
-            entries = fetch_tvh_dvr_entries(self._tvh_url, self._tvh_user, self._tvh_pass)
+            self.__tvh_dvr_entries(max_age=self._dvr_background_max_age)
         except Exception as err:
             logger.debug(f"TVH Webhook DVR信息补全失败: {err}")
             return payload
-        for entry in entries:
-            if str(entry.uuid) != dvr_uuid:
-                continue
-            enriched = dict(payload)
-            if entry.filesize and not enriched.get("filesize"):
-                enriched["filesize"] = entry.filesize
-            if entry.filename and not enriched.get("filename"):
-                enriched["filename"] = entry.filename
-            for key in ("start", "stop", "start_real", "stop_real", "duration"):
-                value = getattr(entry, key, None)
-                if value is not None and not enriched.get(key):
-                    enriched[key] = value
-            return enriched
-        return payload
+        entry = self._dvr_store.get(dvr_uuid)
+        if not entry:
+            return payload
+        enriched = dict(payload)
+        if entry.filesize and not enriched.get("filesize"):
+            enriched["filesize"] = entry.filesize
+        if entry.filename and not enriched.get("filename"):
+            enriched["filename"] = entry.filename
+        for key in ("start", "stop", "start_real", "stop_real", "duration"):
+            value = getattr(entry, key, None)
+            if value is not None and not enriched.get(key):
+                enriched[key] = value
+        return enriched
 
     def __should_send_webhook_notification(self, payload: Dict[str, Any]) -> bool:
         event = str(payload.get("event") or "")
@@ -3311,7 +3715,7 @@ class tvhhelper(_PluginBase):
                 self._tvh_url,
                 self._tvh_user,
                 self._tvh_pass,
-                cache=self._webhook_program_cache,
+                snapshot=self._now_next_snapshot,
                 timeout=2,
                 enrich_program=self._webhook_program_enrich,
                 enrich_logo=self._webhook_logo_enrich,
@@ -3334,7 +3738,7 @@ class tvhhelper(_PluginBase):
                 return local_result
             online_result = fetch_ip_location_cached(
                 ip_text,
-                resolver=lambda value: fetch_ip_location(value, timeout=5),
+                resolver=lambda value: fetch_ip_location(value, timeout=5, guard=self._ip_lookup_guard),
                 cache=self._ip_location_cache,
             )
             result = self.__merge_ip_lookup_result(local_result, online_result)
@@ -3406,7 +3810,9 @@ class tvhhelper(_PluginBase):
                 proxy=getattr(settings, "PROXY_HOST", "") or getattr(settings, "GITHUB_PROXY", ""),
             )
             if result.get("updated"):
-                if self._ip_location_cache:
+                if isinstance(self._ip_location_cache, PersistentTimedValueCache):
+                    self._ip_location_cache.invalidate(read_ip_location_db_version(result.get("directory") or ""))
+                elif self._ip_location_cache:
                     self._ip_location_cache.clear()
                 logger.info(f"TVH IP库更新完成: {result.get('directory')}")
             elif result.get("success"):
@@ -3549,6 +3955,113 @@ class tvhhelper(_PluginBase):
         return None
 
     def get_page(self) -> List[dict]:
+        page = self.__playback_history_page()
+        if self._webhook_queue:
+            page.append(self.__build_webhook_queue_card())
+        if self._hot_path_timings:
+            page.append(self.__build_hot_path_card())
+        return page
+
+    def __build_hot_path_card(self) -> dict:
+        stats = hot_path_timing_stats()
+
+        def latency(value) -> str:
+            return "-" if value is None else f"{value * 1000:.1f} ms"
+
+        headers = ["阶段", "次数", "失败", "P50", "P95", "P99", "最大"]
+        rows = [
+            {
+                "component": "tr",
+                "content": [
+                    self.__history_cell(name, "font-weight-medium"),
+                    self.__history_cell(str(stage["count"])),
+                    self.__history_cell(str(stage["errors"])),
+                    self.__history_cell(latency(stage["p50"])),
+                    self.__history_cell(latency(stage["p95"])),
+                    self.__history_cell(latency(stage["p99"])),
+                    self.__history_cell(latency(stage["max"])),
+                ],
+            }
+            for name, stage in stats["stages"].items()
+        ]
+        if not rows:
+            rows = [{
+                "component": "tr",
+                "content": [{"component": "td", "props": {"colspan": len(headers)}, "text": "暂无耗时记录"}],
+            }]
+        return {
+            "component": "VCard",
+            "props": {"variant": "flat", "class": "rounded border mt-4"},
+            "content": [
+                {"component": "VCardTitle", "text": "热路径耗时"},
+                {
+                    "component": "VCardText",
+                    "content": [{
+                        "component": "VTable",
+                        "props": {"density": "compact"},
+                        "content": [
+                            {
+                                "component": "thead",
+                                "content": [{
+                                    "component": "tr",
+                                    "content": [
+                                        {"component": "th", "props": {"class": "text-left font-weight-bold"}, "text": header}
+                                        for header in headers
+                                    ],
+                                }],
+                            },
+                            {"component": "tbody", "content": rows},
+                        ],
+                    }],
+                },
+            ],
+        }
+
+    def __build_webhook_queue_card(self) -> dict:
+        stats = self._webhook_queue.stats()
+
+        def latency(value) -> str:
+            return "-" if value is None else f"{value * 1000:.0f} ms"
+
+        items = [
+            ("队列深度", f"{stats['depth']} / {stats['max_size']}"),
+            ("处理中", stats["in_flight"]),
+            ("已处理", stats["processed"]),
+            ("丢弃", stats["dropped"]),
+            ("失败", stats["errors"]),
+            ("耗时 P50", latency(stats["p50"])),
+            ("耗时 P95", latency(stats["p95"])),
+            ("耗时 P99", latency(stats["p99"])),
+        ]
+        return {
+            "component": "VCard",
+            "props": {"variant": "flat", "class": "rounded border mt-4"},
+            "content": [
+                {"component": "VCardTitle", "text": "Webhook处理队列"},
+                {
+                    "component": "VCardText",
+                    "content": [{
+                        "component": "VTable",
+                        "props": {"density": "compact"},
+                        "content": [{
+                            "component": "tbody",
+                            "content": [
+                                {
+                                    "component": "tr",
+                                    "content": [
+                                        self.__history_cell(label, "font-weight-medium"),
+                                        self.__history_cell(str(value)),
+                                    ],
+                                }
+                                for label, value in items
+                            ],
+                        }],
+                    }],
+                },
+            ],
+        }
+
+    def __playback_history_page(self) -> List[dict]:
         if not self._playback_history:
             return [
                 {
@@ -3685,7 +4198,19 @@ class tvhhelper(_PluginBase):
         }
 
     def stop_service(self):
-        pass
+        self.__stop_comet_watcher()
+        if self._dvr_completion_scheduler:
+            self._dvr_completion_scheduler.stop()
+        self.__close_dvr_completion_store()
+        if self._webhook_queue:
+            self._webhook_queue.close()
+        if self._epg_offload:
+            self._epg_offload.close()
+        configure_hot_path_timings(False)
+        close_tvh_http_clients()
+        close_ip_location_dbs()
+        if isinstance(self._ip_location_cache, PersistentTimedValueCache):
+            self._ip_location_cache.close()
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         def field(model: str, label: str, cols: int = 12, md: int = 6, **props) -> dict:
@@ -3738,6 +4263,11 @@ class tvhhelper(_PluginBase):
             {"title": "仅Webhook：增强版TVH", "value": "webhook"},
             {"title": "仅轮询：原版TVH", "value": "polling"},
         ]
+        ip2region_cache_mode_items = [
+            {"title": "整库载入内存：查询最快", "value": "content"},
+            {"title": "只读内存映射：按需分页", "value": "mmap"},
+            {"title": "仅缓存向量索引：内存最省", "value": "vector_index"},
+        ]
 
         return [
             {
@@ -3777,6 +4307,10 @@ class tvhhelper(_PluginBase):
                                     switch("play_notify", "播放通知"),
                                     select("play_notify_source", "播放通知来源", play_notify_source_items),
                                 ),
+                                row(
+                                    switch("play_notify_comet", "播放通知使用Comet推送"),
+                                    switch("webhook_async", "Webhook后台队列处理"),
+                                ),
                                 row(
                                     switch("webhook_notify", "Webhook通知"),
                                     switch("webhook_program_enrich", "Webhook节目补全"),
@@ -3787,7 +4321,8 @@ class tvhhelper(_PluginBase):
                                     "props": {
                                         "type": "info",
                                         "variant": "tonal",
-                                        "text": "自动模式：Webhook通知开启时停用轮询，Webhook通知关闭时使用轮询兜底。",
+                                        "text": "自动模式：Webhook通知开启时停用轮询，Webhook通知关闭时使用轮询兜底。"
+                                                "Comet推送开启后轮询模式改为订阅TVH通知，连接中断时自动回到定时轮询。",
                                     },
                                 },
                             ),
@@ -3798,6 +4333,11 @@ class tvhhelper(_PluginBase):
                                     field("check_interval", "检查间隔秒", type="number"),
                                     field("play_notify_interval", "播放通知间隔秒", type="number"),
                                 ),
+                                row(
+                                    switch("prewarm", "启动后预热菜单数据"),
+                                    switch("epg_process_offload", "节目指南大批量建索引使用子进程"),
+                                    switch("hot_path_timings", "记录热路径耗时"),
+                                ),
                                 row(
                                     field(
                                         "record_default_start_padding",
@@ -3815,6 +4355,14 @@ class tvhhelper(_PluginBase):
                                         min=0,
                                         max=180,
                                     ),
+                                    field(
+                                        "tvh_cache_max_stale",
+                                        "TVH数据过期后台刷新秒",
+                                        md=4,
+                                        type="number",
+                                        min=0,
+                                        placeholder="0为关闭",
+                                    ),
                                 ),
                                 row(
                                     field(
@@ -3842,6 +4390,9 @@ class tvhhelper(_PluginBase):
                                     field("ipdb_update_interval_hours", "IP库更新间隔小时", type="number"),
                                     field("ipdb_dir", "本地IP库目录"),
                                 ),
+                                row(
+                                    select("ip2region_cache_mode", "国内省市库缓存方式", ip2region_cache_mode_items),
+                                ),
                                 row(
                                     field("ipdb_country_url", "国家/地区库下载地址", md=12),
                                     field("ipdb_asn_url", "ASN组织库下载地址", md=12),
@@ -3866,6 +4417,7 @@ class tvhhelper(_PluginBase):
             "webhook_notify": True,
             "webhook_program_enrich": True,
             "webhook_logo_enrich": True,
+            "webhook_async": False,
             "webhook_secret": "",
             "webhook_hmac_secret": "",
             "tvh_url": "http://127.0.0.1:9981",
@@ -3878,6 +4430,10 @@ class tvhhelper(_PluginBase):
             "play_notify_interval": 10,
             "record_default_start_padding": DEFAULT_RECORD_START_PADDING_MINUTES,
             "record_default_stop_padding": DEFAULT_RECORD_STOP_PADDING_MINUTES,
+            "tvh_cache_max_stale": 0,
+            "prewarm": False,
+            "epg_process_offload": False,
+            "hot_path_timings": False,
             "ip_lookup_enabled": True,
             "ipdb_enabled": True,
             "ipdb_auto_update": True,
@@ -3886,8 +4442,10 @@ class tvhhelper(_PluginBase):
             "ipdb_country_url": DEFAULT_IPDB_COUNTRY_URL,
             "ipdb_asn_url": DEFAULT_IPDB_ASN_URL,
             "ip2region_url": DEFAULT_IP2REGION_URL,
+            "ip2region_cache_mode": DEFAULT_IP2REGION_CACHE_MODE,
             "play_notify": True,
             "play_notify_source": "auto",
+            "play_notify_comet": False,
             "play_notify_users": {},
             "settings_tab": "basic",
         }
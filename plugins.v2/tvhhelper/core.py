@@ -1,15 +1,32 @@
+import base64
+import bisect
+import codecs
+import functools
+import http.client
 import json
 import ipaddress
 import hashlib
+import heapq
+import mmap
 import os
+import pickle
+import re
 import secrets
+import select
+import sqlite3
 import string
+import subprocess
+import sys
+import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
-from concurrent.futures import ThreadPoolExecutor
-from dataclasses import dataclass, field
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, fields, replace
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Iterable
@@ -422,6 +439,11 @@ IPDB_COUNTRY_FILENAME = "country.mmdb"
 IPDB_ASN_FILENAME = "asn.mmdb"
 IP2REGION_FILENAME = "ip2region_v4.xdb"
 IPDB_STATUS_FILENAME = "status.json"
+IP_LOCATION_PROVIDERS = ("pconline", "ip-api", "ipapi")
+IP_API_FIELDS = "status,country,regionName,city,isp,org,query"
+IP_API_BATCH_SIZE = 100
+IP2REGION_CACHE_MODES = ("content", "mmap", "vector_index")
+DEFAULT_IP2REGION_CACHE_MODE = "content"
 COUNTRY_CODE_NAMES = {
     "CN": "China",
     "HK": "Hong Kong",
@@ -445,7 +467,7 @@ class TvhUser:
     passwd_enabled: bool | None = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TvhSubscription:
     subscription_id: str
     username: str
@@ -501,7 +523,7 @@ class TvhChannel:
     number: str | None = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TvhEpgEvent:
     event_id: str
     channel_uuid: str
@@ -525,7 +547,7 @@ class TvhDvrConfig:
     raw: dict = field(default_factory=dict, compare=False, repr=False)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TvhDvrEntry:
     uuid: str
     title: str
@@ -566,34 +588,770 @@ class TvhError(Exception):
     pass
 
 
+class TvhHttpError(TvhError):
+    """TVH 返回 HTTP 错误状态码。"""
+
+    def __init__(self, status: int, reason: str = "") -> None:
+        super().__init__(f"HTTP Error {status}: {reason}")
+        self.status = status
+        self.reason = reason
+
+
 class TimedValueCache:
-    def __init__(self, ttl_seconds: int, now=None) -> None:
+    """按过期时间缓存的键值表。
+
+    可选 max_size 限制条目数，超出时按最近最少使用淘汰；过期条目在读取时移除，
+    并按 TTL 间隔分摊做整表清理。thread_safe 为真时所有操作加锁。
+    """
+
+    def __init__(self, ttl_seconds: int, now=None, max_size: int | None = None, thread_safe: bool = False) -> None:
         self.ttl_seconds = max(0, int(ttl_seconds))
+        self.max_size = max(1, int(max_size)) if max_size else None
         self._now = now or time.time
-        self._values: dict[str, tuple[float, object]] = {}
+        self._values: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.RLock() if thread_safe else nullcontext()
+        self._next_sweep_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
     def get(self, key: str):
-        item = self._values.get(key)
-        if not item:
-            return None
-        expires_at, value = item
-        if expires_at <= self._now():
+        with self._lock:
+            item = self._values.get(key)
+            if not item:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= self._now():
+                del self._values[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._values.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            now_value = self._now()
+            self._values[key] = (now_value + self.ttl_seconds, value)
+            self._values.move_to_end(key)
+            self._prune(now_value)
+            return value
+
+    def set_many(self, items: dict) -> None:
+        with self._lock:
+            now_value = self._now()
+            expires_at = now_value + self.ttl_seconds
+            for key, value in items.items():
+                self._values[key] = (expires_at, value)
+                self._values.move_to_end(key)
+            self._prune(now_value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
             self._values.pop(key, None)
-            return None
-        return value
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._values)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._values),
+                "max_size": self.max_size or 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _prune(self, now_value: float) -> None:
+        if now_value >= self._next_sweep_at:
+            expired = [key for key, (expires_at, _) in self._values.items() if expires_at <= now_value]
+            for key in expired:
+                del self._values[key]
+            self.expirations += len(expired)
+            self._next_sweep_at = now_value + max(1, self.ttl_seconds)
+        if self.max_size is None:
+            return
+        while len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+            self.evictions += 1
+
+
+class PersistentTimedValueCache(TimedValueCache):
+    """写穿到 sqlite 的 TimedValueCache，首次访问时载入未过期条目，重启后继续使用。
+
+    version 记录缓存对应的数据版本（如本地IP库更新时间），载入时版本不一致则整表作废。
+    数据库不可用时退化为纯内存缓存。
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        ttl_seconds: int,
+        now=None,
+        max_size: int | None = None,
+        version: str | None = None,
+    ) -> None:
+        super().__init__(ttl_seconds, now=now, max_size=max_size, thread_safe=True)
+        self.path = Path(path)
+        self.version = str(version or "")
+        self._connection: sqlite3.Connection | None = None
+        self._loaded = False
+        self._disabled = False
+
+    def get(self, key: str):
+        with self._lock:
+            self._load()
+            return super().get(key)
 
     def set(self, key: str, value):
-        self._values[key] = (self._now() + self.ttl_seconds, value)
-        return value
+        with self._lock:
+            self._load()
+            super().set(key, value)
+            self._write({key: value})
+            return value
+
+    def set_many(self, items: dict) -> None:
+        with self._lock:
+            self._load()
+            super().set_many(items)
+            self._write(items)
 
     def delete(self, key: str) -> None:
-        self._values.pop(key, None)
+        with self._lock:
+            self._load()
+            super().delete(key)
+            self._execute(lambda connection: connection.execute("DELETE FROM cache WHERE key = ?", (key,)))
 
     def keys(self) -> list[str]:
-        return list(self._values.keys())
+        with self._lock:
+            self._load()
+            return super().keys()
 
     def clear(self):
-        self._values.clear()
+        self.invalidate(self.version)
+
+    def invalidate(self, version: str | None = None) -> None:
+        """清空内存和磁盘条目，并记录新的数据版本。"""
+        with self._lock:
+            self._loaded = True
+            super().clear()
+            self.version = str(version or "")
+            self._execute(self._reset_table)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.close()
+                except sqlite3.Error:
+                    pass
+                self._connection = None
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        now_value = self._now()
+
+        def load(connection):
+            row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if (row[0] if row else "") != self.version:
+                self._reset_table(connection)
+                return []
+            connection.execute("DELETE FROM cache WHERE expires_at <= ?", (now_value,))
+            rows = connection.execute(
+                "SELECT key, value, expires_at FROM cache ORDER BY expires_at DESC LIMIT ?",
+                (self.max_size or -1,),
+            ).fetchall()
+            if self.max_size and len(rows) >= self.max_size:
+                connection.execute("DELETE FROM cache WHERE expires_at < ?", (rows[-1][2],))
+            return rows
+
+        rows = self._execute(load) or []
+        for key, value, expires_at in reversed(rows):
+            try:
+                decoded = json.loads(value)
+            except (TypeError, json.JSONDecodeError):
+                continue
+            self._values[key] = (float(expires_at), tuple(decoded) if isinstance(decoded, list) else decoded)
+
+    def _write(self, items: dict) -> None:
+        expires_at = self._now() + self.ttl_seconds
+        rows = [(key, json.dumps(value, ensure_ascii=False), expires_at) for key, value in items.items()]
+        self._execute(lambda connection: connection.executemany(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            rows,
+        ))
+
+    def _reset_table(self, connection) -> None:
+        connection.execute("DELETE FROM cache")
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (self.version,))
+
+    def _execute(self, operation):
+        if self._disabled:
+            return None
+        try:
+            connection = self._connect()
+            with connection:
+                return operation(connection)
+        except (OSError, sqlite3.Error):
+            self._disabled = True
+            self.close()
+            return None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._connection = connection
+        return self._connection
+
+
+class StaleWhileRevalidateCache:
+    """按 key 缓存加载结果，过期后先返回旧值并在后台刷新。
+
+    同一 key 同时只有一个加载在进行，其余调用方等待并复用同一次结果；强制刷新和清理之后的读取不复用此前开始的加载。
+    pop 只作废该 key 上进行中的加载，不影响其他 key。
+    过期达到 max_stale 秒的旧值不再返回，调用方阻塞等待刷新；max_stale 为 0 时即普通 TTL 缓存。
+    后台刷新失败时保留旧值，下次读取再重试。
+    """
+
+    def __init__(self, max_stale: float = 0, now=None, spawn=None) -> None:
+        self.max_stale = max(0.0, float(max_stale or 0))
+        self._now = now or time.time
+        self._spawn = spawn or self._spawn_thread
+        self._lock = threading.Lock()
+        self._values: dict[str, tuple[float, Any]] = {}
+        self._inflight: dict[str, dict[str, Any]] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.loads = 0
+        self.refresh_errors = 0
+
+    def get(self, key: str, ttl_seconds: float, loader, force_refresh: bool = False):
+        with self._lock:
+            now = self._now()
+            item = None if force_refresh else self._values.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self.hits += 1
+                    return value
+                if self.max_stale <= 0 or now - expires_at >= self.max_stale:
+                    item = None
+            inflight = self._inflight.get(key)
+            if inflight is not None and force_refresh:
+                self._discard_inflight(inflight)
+                inflight = None
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight[key] = {
+                    "done": threading.Event(),
+                    "error": None,
+                    "value": None,
+                    "current": True,
+                }
+            if item is not None:
+                self.stale_hits += 1
+        if item is not None:
+            if leader:
+                self._spawn(lambda: self._load(key, ttl_seconds, loader, inflight, background=True))
+            return item[1]
+        if not leader:
+            inflight["done"].wait()
+            if inflight["error"] is not None:
+                raise inflight["error"]
+            return inflight["value"]
+        return self._load(key, ttl_seconds, loader, inflight)
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+            self._discard_inflight(self._inflight.pop(key, None))
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._values)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            for inflight in self._inflight.values():
+                self._discard_inflight(inflight)
+            self._inflight.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._values),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "loads": self.loads,
+                "refresh_errors": self.refresh_errors,
+                "in_flight": len(self._inflight),
+            }
+
+    def _load(self, key: str, ttl_seconds: float, loader, inflight: dict, background: bool = False):
+        try:
+            value = loader()
+            with self._lock:
+                self.loads += 1
+                if inflight["current"]:
+                    self._values[key] = (self._now() + max(0.0, float(ttl_seconds or 0)), value)
+            inflight["value"] = value
+            return value
+        except Exception as err:
+            inflight["error"] = err
+            if background:
+                with self._lock:
+                    self.refresh_errors += 1
+                return None
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+            inflight["done"].set()
+
+    @staticmethod
+    def _discard_inflight(inflight: dict | None) -> None:
+        """作废进行中的加载：结果仍交给已在等待的调用方，但不写入缓存。"""
+        if inflight is not None:
+            inflight["current"] = False
+
+    @staticmethod
+    def _spawn_thread(target) -> None:
+        threading.Thread(target=target, name="tvhhelper-cache-refresh", daemon=True).start()
+
+
+class WriteBehindState:
+    """以内存为准的持久状态，合并写回。
+
+    commit 把与上次提交相比的变化（逐层比较到第二层键）追加到本地日志并 fsync，随后在 delay 秒后
+    合并调用一次 save 写回完整状态，写回成功即清空日志。进程中断时由 load 重放日志补回未写回的变化。
+    """
+
+    def __init__(self, journal_path: str | Path, save, delay: float = 2.0, lock=None, timer_factory=None) -> None:
+        self.journal_path = Path(journal_path)
+        self.delay = max(0.0, float(delay))
+        self._save = save
+        self._lock = lock or threading.RLock()
+        self._timer_factory = timer_factory or threading.Timer
+        self._timer = None
+        self._state: dict[str, Any] | None = None
+        self._committed: dict[str, Any] = {}
+        self._unflushed: list[list] = []
+        self.commits = 0
+        self.flushes = 0
+
+    def load(self, base: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        """在 base 上重放日志，返回状态和重放的变更数。"""
+        replayed = 0
+        with self._lock:
+            try:
+                lines = self.journal_path.read_text(encoding="utf-8").splitlines()
+            except OSError:
+                lines = []
+            for line in lines:
+                try:
+                    op = json.loads(line)
+                    _apply_state_op(base, op)
+                except (ValueError, TypeError, KeyError, IndexError):
+                    continue
+                self._unflushed.append(op)
+                replayed += 1
+            self._state = base
+            self._committed = _copy_state_levels(base)
+        return base, replayed
+
+    def commit(self, state: dict[str, Any]) -> bool:
+        """记录 state 相对上次提交的变化并安排写回；日志写入失败时返回 False。"""
+        with self._lock:
+            ops = _diff_state(self._committed, state)
+            self._state = state
+            if not ops:
+                return True
+            try:
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.journal_path.open("a", encoding="utf-8") as journal:
+                    journal.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops))
+                    journal.flush()
+                    os.fsync(journal.fileno())
+            except (OSError, TypeError, ValueError):
+                return False
+            for op in ops:
+                _apply_state_op(self._committed, json.loads(json.dumps(op)))
+            self._unflushed.extend(ops)
+            self.commits += 1
+            self._schedule()
+            return True
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._unflushed)
+
+    def flush(self) -> bool:
+        """立即写回完整状态，成功后清空日志。"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._unflushed or self._state is None:
+                return True
+            snapshot = json.loads(json.dumps(self._state))
+            flushed = len(self._unflushed)
+        try:
+            self._save(snapshot)
+        except Exception:
+            with self._lock:
+                self._schedule()
+            return False
+        with self._lock:
+            del self._unflushed[:flushed]
+            try:
+                if self._unflushed:
+                    self._rewrite_journal(self._unflushed)
+                else:
+                    self.journal_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            self.flushes += 1
+        return True
+
+    def _rewrite_journal(self, ops: list[list]) -> None:
+        """先写同目录临时文件并 fsync，再原子替换日志，中途断电也不会截断已确认的变更。"""
+        tmp_path = self.journal_path.with_suffix(self.journal_path.suffix + ".tmp")
+        try:
+            with tmp_path.open("w", encoding="utf-8") as journal:
+                journal.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops))
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(tmp_path, self.journal_path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def close(self) -> bool:
+        return self.flush()
+
+    def reset(self, base: dict[str, Any]) -> None:
+        """丢弃未写回的变化并清空日志，以 base 作为新的状态（插件数据重置时调用）。"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._unflushed.clear()
+            self._state = base
+            self._committed = _copy_state_levels(base)
+            try:
+                self.journal_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    def _schedule(self) -> None:
+        if self._timer is not None:
+            return
+        self._timer = self._timer_factory(self.delay, self._flush_from_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_from_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+
+class DeadlineScheduler:
+    """按截止时间唤醒的后台调度器。
+
+    最小堆保存每个任务的下次检查时间，线程睡到最早的截止时间后回调 callback(due_keys)；
+    堆为空时一直休眠，schedule/sync 加入更早的任务会立即唤醒。
+    """
+
+    def __init__(self, callback, name: str = "tvhhelper-deadline", now=None) -> None:
+        self._callback = callback
+        self.name = name
+        self._now = now or time.time
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, Any]] = []
+        self._due: dict[Any, float] = {}
+        self._seq = 0
+        self._stopped = False
+        self._thread: threading.Thread | None = None
+        self.wakeups = 0
+        self.runs = 0
+
+    def schedule(self, key: Any, due_at: float) -> None:
+        with self._cond:
+            self._push(key, float(due_at))
+            self._cond.notify()
+
+    def discard(self, key: Any) -> None:
+        with self._cond:
+            self._due.pop(key, None)
+
+    def sync(self, deadlines: dict[Any, float]) -> None:
+        """以 deadlines 替换全部任务。"""
+        with self._cond:
+            self._due = {}
+            self._heap = []
+            for key, due_at in deadlines.items():
+                self._push(key, float(due_at))
+            self._cond.notify()
+
+    def next_deadline(self) -> float | None:
+        with self._cond:
+            return self._peek()
+
+    def pop_due(self, now: float | None = None) -> list[Any]:
+        """取出所有已到期的任务键。"""
+        now_value = self._now() if now is None else now
+        keys = []
+        with self._cond:
+            while True:
+                due_at = self._peek()
+                if due_at is None or due_at > now_value:
+                    return keys
+                _, _, key = heapq.heappop(self._heap)
+                self._due.pop(key, None)
+                keys.append(key)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                due_at = self._peek()
+                delay = None if due_at is None else due_at - self._now()
+                if delay is None or delay > 0:
+                    self._cond.wait(delay)
+                    self.wakeups += 1
+                    continue
+            keys = self.pop_due()
+            if not keys:
+                continue
+            self.runs += 1
+            try:
+                self._callback(keys)
+            except Exception:
+                pass
+
+    def _push(self, key: Any, due_at: float) -> None:
+        self._due[key] = due_at
+        self._seq += 1
+        heapq.heappush(self._heap, (due_at, self._seq, key))
+
+    def _peek(self) -> float | None:
+        while self._heap:
+            due_at, _, key = self._heap[0]
+            if self._due.get(key) == due_at:
+                return due_at
+            heapq.heappop(self._heap)
+        return None
+
+
+def _copy_state_levels(state: dict[str, Any]) -> dict[str, Any]:
+    return json.loads(json.dumps(state))
+
+
+def _diff_state(old: dict[str, Any], new: dict[str, Any]) -> list[list]:
+    ops: list[list] = []
+    for key in [key for key in old if key not in new]:
+        ops.append(["del", [key]])
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            for sub_key in [sub_key for sub_key in previous if sub_key not in value]:
+                ops.append(["del", [key, sub_key]])
+            for sub_key, sub_value in value.items():
+                if previous.get(sub_key, _MISSING) != sub_value:
+                    ops.append(["set", [key, sub_key], sub_value])
+        elif previous != value:
+            ops.append(["set", [key], value])
+    return ops
+
+
+def _apply_state_op(state: dict[str, Any], op: list) -> None:
+    action, path = op[0], op[1]
+    target = state
+    for key in path[:-1]:
+        target = target.setdefault(key, {})
+    if action == "del":
+        target.pop(path[-1], None)
+    else:
+        target[path[-1]] = op[2]
+
+
+_MISSING = object()
+
+
+class ProviderCircuitBreaker:
+    """在线接口熔断器：连续失败或被限流达到阈值后，冷却期内直接跳过该接口。
+
+    冷却结束后进入试探状态，只放行一个请求，其结果决定恢复还是重新熔断。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown_seconds: int = 300, now=None) -> None:
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_seconds = max(0, int(cooldown_seconds))
+        self._now = now or time.time
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.open_until: float | None = None
+        self.failures = 0
+        self.rate_limited = 0
+        self.skipped = 0
+        self.trips = 0
+        self._probe_until: float | None = None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.open_until is None:
+                return True
+            now = self._now()
+            if now < self.open_until or (self._probe_until is not None and now < self._probe_until):
+                self.skipped += 1
+                return False
+            self._probe_until = now + max(1, self.cooldown_seconds)
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.open_until = None
+            self._probe_until = None
+
+    def record_failure(self, rate_limited: bool = False) -> None:
+        with self._lock:
+            self._probe_until = None
+            self.failures += 1
+            if rate_limited:
+                self.rate_limited += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                if self.open_until is None or self._now() >= self.open_until:
+                    self.trips += 1
+                self.open_until = self._now() + self.cooldown_seconds
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.open_until is None:
+                return "closed"
+            return "open" if self._now() < self.open_until else "half_open"
+
+    def stats(self) -> dict[str, Any]:
+        state = self.state
+        with self._lock:
+            remaining = max(0, int(self.open_until - self._now())) if state == "open" else 0
+            return {
+                "state": state,
+                "remaining_seconds": remaining,
+                "consecutive_failures": self.consecutive_failures,
+                "failures": self.failures,
+                "rate_limited": self.rate_limited,
+                "skipped": self.skipped,
+                "trips": self.trips,
+            }
+
+
+class IpLookupGuard:
+    """在线IP归属地查询保护：短期记住查不到的IP，并为每个接口维护熔断器。"""
+
+    def __init__(
+        self,
+        negative_ttl_seconds: int = 600,
+        failure_threshold: int = 3,
+        cooldown_seconds: int = 300,
+        now=None,
+    ) -> None:
+        self.negative_cache = TimedValueCache(
+            ttl_seconds=negative_ttl_seconds,
+            now=now,
+            max_size=4096,
+            thread_safe=True,
+        )
+        self.breakers = {
+            name: ProviderCircuitBreaker(name, failure_threshold, cooldown_seconds, now=now)
+            for name in IP_LOCATION_PROVIDERS
+        }
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.negative_hits = 0
+
+    def breaker(self, name: str) -> ProviderCircuitBreaker | None:
+        return self.breakers.get(name)
+
+    def is_known_miss(self, ip: str) -> bool:
+        if self.negative_cache.get(ip) is None:
+            return False
+        with self._lock:
+            self.negative_hits += 1
+        return True
+
+    def record_result(self, ip: str, result: tuple[str | None, str | None], answered: bool = True) -> None:
+        """记录一次在线查询结果；只有各个能定位该IP的接口都明确答复查不到（answered）时才记入负缓存。"""
+        with self._lock:
+            self.lookups += 1
+        if answered and not any(result):
+            self.negative_cache.set(ip, True)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "negative_hits": self.negative_hits,
+                "negative_entries": self.negative_cache.stats()["size"],
+                "providers": {name: breaker.stats() for name, breaker in self.breakers.items()},
+            }
+
+
+class _IpProviderAnswer:
+    """包装接口熔断器，记下本次查询中该接口是否给出了有效答复。"""
+
+    def __init__(self, breaker: ProviderCircuitBreaker | None) -> None:
+        self.breaker = breaker
+        self.answered = False
+
+    def allow(self) -> bool:
+        return self.breaker.allow() if self.breaker else True
+
+    def record_success(self) -> None:
+        self.answered = True
+        if self.breaker:
+            self.breaker.record_success()
+
+    def record_failure(self, rate_limited: bool = False) -> None:
+        if self.breaker:
+            self.breaker.record_failure(rate_limited=rate_limited)
 
 
 class DvbMonitor:
@@ -1284,26 +2042,71 @@ def _build_url(public_base_url: str, path: str, token: str) -> str:
     return f"{base}/{path}?{urllib.parse.urlencode({'a': token})}"
 
 
+class _PasswdTokenDir:
+    """按文件 mtime/size 缓存 passwd 目录的解析结果，只重新读取变化的文件。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirs: dict[str, dict[str, tuple]] = {}
+        self.parsed = 0
+
+    def tokens(self, root: Path) -> dict[str, str]:
+        key = str(root)
+        with self._lock:
+            previous = self._dirs.get(key, {})
+        current: dict[str, tuple] = {}
+        try:
+            items = list(os.scandir(root))
+        except OSError:
+            return {}
+        parsed = 0
+        for item in items:
+            try:
+                if not item.is_file():
+                    continue
+                stat = item.stat()
+            except OSError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = previous.get(item.name)
+            if cached is not None and cached[0] == signature:
+                current[item.name] = cached
+                continue
+            parsed += 1
+            username = token = None
+            try:
+                payload = json.loads(Path(item.path).read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                payload = None
+            if isinstance(payload, dict):
+                username = payload.get("username")
+                token = payload.get("authcode")
+            current[item.name] = (signature, str(username) if username else None, str(token) if token else None)
+        with self._lock:
+            self._dirs[key] = current
+            self.parsed += parsed
+        tokens: dict[str, str] = {}
+        for name in sorted(current):
+            _signature, username, token = current[name]
+            if username and token:
+                tokens[username] = token
+        return tokens
+
+    def clear(self):
+        with self._lock:
+            self._dirs.clear()
+
+
+_PASSWD_TOKEN_DIR = _PasswdTokenDir()
+
+
 def load_passwd_tokens(path: str | None) -> dict[str, str]:
     if not path:
         return {}
     root = Path(path)
     if not root.exists() or not root.is_dir():
         return {}
-
-    tokens: dict[str, str] = {}
-    for item in root.iterdir():
-        if not item.is_file():
-            continue
-        try:
-            payload = json.loads(item.read_text(encoding="utf-8"))
-        except (OSError, json.JSONDecodeError):
-            continue
-        username = payload.get("username")
-        token = payload.get("authcode")
-        if username and token:
-            tokens[str(username)] = str(token)
-    return tokens
+    return _PASSWD_TOKEN_DIR.tokens(root)
 
 
 def tokens_from_passwd_payload(payload: dict) -> dict[str, str]:
@@ -1445,13 +2248,23 @@ def _bool_or_none(value) -> bool | None:
     return bool(value)
 
 
+class TvhUserList(list):
+    """按用户名建立索引的用户列表，find_user/token_for_user 无需逐个比较。"""
+
+    def __init__(self, users=()):
+        super().__init__(users)
+        self.by_username: dict[str, TvhUser] = {}
+        for user in self:
+            self.by_username.setdefault(user.username, user)
+
+
 def merge_tokens(
     users: list[TvhUser],
     tokens: dict[str, str],
     passwd_users: list[TvhUser] | None = None,
 ) -> list[TvhUser]:
     passwd_by_name = {user.username: user for user in passwd_users or []}
-    return [
+    return TvhUserList(
         TvhUser(
             username=user.username,
             token=user.token or tokens.get(user.username) or (passwd_by_name.get(user.username).token if passwd_by_name.get(user.username) else None),
@@ -1461,17 +2274,17 @@ def merge_tokens(
             passwd_enabled=(passwd_by_name.get(user.username).passwd_enabled if passwd_by_name.get(user.username) else user.passwd_enabled),
         )
         for user in users
-    ]
+    )
 
 
 def token_for_user(users: list[TvhUser], username: str) -> str | None:
-    for user in users:
-        if user.username == username:
-            return user.token
-    return None
+    user = find_user(users, username)
+    return user.token if user else None
 
 
 def find_user(users: list[TvhUser], username: str) -> TvhUser | None:
+    if isinstance(users, TvhUserList):
+        return users.by_username.get(username)
     for user in users:
         if user.username == username:
             return user
@@ -1513,6 +2326,8 @@ def format_status_message(
     webhook_notify_enabled: bool | None = None,
     webhook_last_event: str | None = None,
     webhook_last_seen_at: int | float | str | None = None,
+    http_stats: dict[str, int] | None = None,
+    ip_lookup_stats: dict[str, Any] | None = None,
 ) -> str:
     status_label = "OK" if tvh_ok else "失败"
     subscriptions = subscriptions or []
@@ -1548,6 +2363,10 @@ def format_status_message(
     )
     if notify_line:
         summary_lines.append(notify_line)
+    http_line = _format_http_health_line(http_stats)
+    if http_line:
+        summary_lines.append(http_line)
+    summary_lines.extend(_format_ip_lookup_health_lines(ip_lookup_stats))
     lines = [
         f"```text\n{chr(10).join(summary_lines)}\n```",
         "",
@@ -1583,6 +2402,39 @@ def _format_notify_health_line(
     return "通知: " + " | ".join(parts) if parts else None
 
 
+def _format_http_health_line(http_stats: dict[str, int] | None) -> str | None:
+    if not http_stats:
+        return None
+    opened = max(0, int(http_stats.get("connections_opened") or 0))
+    served = max(0, int(http_stats.get("requests_served") or 0))
+    return f"连接: 新建 {opened} | 请求 {served}"
+
+
+def _format_ip_lookup_health_lines(ip_lookup_stats: dict[str, Any] | None) -> list[str]:
+    if not ip_lookup_stats:
+        return []
+    lines = [
+        "IP查询: 命中 {hits} | 未命中 {misses} | 负缓存 {negative}".format(
+            hits=max(0, int(ip_lookup_stats.get("cache_hits") or 0)),
+            misses=max(0, int(ip_lookup_stats.get("cache_misses") or 0)),
+            negative=max(0, int(ip_lookup_stats.get("negative_hits") or 0)),
+        )
+    ]
+    providers = ip_lookup_stats.get("providers") or {}
+    if providers:
+        parts = []
+        for name, stats in providers.items():
+            state = (stats or {}).get("state")
+            if state == "open":
+                parts.append(f"{name} 熔断 {int(stats.get('remaining_seconds') or 0)}s")
+            elif state == "half_open":
+                parts.append(f"{name} 试探")
+            else:
+                parts.append(f"{name} 正常")
+        lines.append(f"IP接口: {' | '.join(parts)}")
+    return lines
+
+
 def format_subscription_status_line(subscription: TvhSubscription, dvr_type_label: str | None = None) -> str:
     endpoint = subscription.peer or subscription.hostname
     endpoint_meta = _endpoint_meta(subscription.location, subscription.isp)
@@ -2031,23 +2883,29 @@ def detect_playback_events(
     matched_previous: set[str] = set()
     matched_current: set[str] = set()
 
+    current_by_id: dict[Any, list[str]] = {}
+    for current_key, current_subscription in current_items.items():
+        if current_subscription.subscription_id:
+            current_by_id.setdefault(current_subscription.subscription_id, []).append(current_key)
+    for candidates in current_by_id.values():
+        candidates.reverse()
+
     for previous_key, previous_subscription in previous_items.items():
         if not previous_subscription.subscription_id:
             continue
-        for current_key, current_subscription in current_items.items():
-            if current_key in matched_current:
-                continue
-            if previous_subscription.subscription_id != current_subscription.subscription_id:
-                continue
-            matched_previous.add(previous_key)
-            matched_current.add(current_key)
-            if (
-                enabled_users.get(current_subscription.username)
-                and _playback_content_signature(previous_subscription) != _playback_content_signature(current_subscription)
-            ):
-                events.append(("stop", previous_subscription))
-                events.append(("start", current_subscription))
-            break
+        candidates = current_by_id.get(previous_subscription.subscription_id)
+        if not candidates:
+            continue
+        current_key = candidates.pop()
+        current_subscription = current_items[current_key]
+        matched_previous.add(previous_key)
+        matched_current.add(current_key)
+        if (
+            enabled_users.get(current_subscription.username)
+            and _playback_content_signature(previous_subscription) != _playback_content_signature(current_subscription)
+        ):
+            events.append(("stop", previous_subscription))
+            events.append(("start", current_subscription))
 
     previous = _playback_notification_map(
         subscription
@@ -2176,6 +3034,8 @@ def plan_playback_notifications(
 ) -> tuple[list[tuple], dict[str, tuple[float, TvhSubscription]]]:
     notifications: list[tuple] = []
     pending = dict(pending_starts or {})
+    previous_index = _PlaybackSnapshotIndex(previous)
+    current_index = _PlaybackSnapshotIndex(current)
     index = 0
     while index < len(events):
         event_name, subscription = events[index]
@@ -2193,15 +3053,15 @@ def plan_playback_notifications(
                 index += 1
                 continue
         if event_name == "start" and (
-            _has_other_active_stream(subscription, previous)
-            or _has_other_active_stream(subscription, current)
+            previous_index.has_other_active_stream(subscription)
+            or current_index.has_other_active_stream(subscription)
         ):
             pending[subscription.username] = (now, subscription)
             index += 1
             continue
         if event_name == "stop":
             pending_item = pending.pop(subscription.username, None)
-            if pending_item and _subscription_exists(pending_item[1], current):
+            if pending_item and current_index.contains(pending_item[1]):
                 notifications.append(("switch", subscription, pending_item[1]))
             else:
                 notifications.append(("stop", subscription))
@@ -2213,19 +3073,46 @@ def plan_playback_notifications(
     for username, (created_at, subscription) in list(pending.items()):
         if now - created_at >= grace_seconds:
             pending.pop(username, None)
-            if _subscription_exists(subscription, current):
+            if current_index.contains(subscription):
                 notifications.append(("start", subscription))
     return notifications, pending
 
 
-def _subscription_exists(subscription: TvhSubscription, subscriptions: dict[str, TvhSubscription]) -> bool:
-    notification_key = playback_notification_key(subscription)
-    legacy_key = playback_subscription_key(subscription)
-    return (
-        notification_key in subscriptions
-        or legacy_key in subscriptions
-        or any(playback_notification_key(item) == notification_key for item in subscriptions.values())
-    )
+class _PlaybackSnapshotIndex:
+    """一次轮询快照的播放索引：通知键集合，以及按用户名归组的活跃内容签名，按需构建。"""
+
+    def __init__(self, subscriptions: dict[str, TvhSubscription]) -> None:
+        self._subscriptions = subscriptions
+        self._notification_keys: set[str] | None = None
+        self._active_by_user: dict[str, dict[tuple, set[str]]] | None = None
+
+    def contains(self, subscription: TvhSubscription) -> bool:
+        if self._notification_keys is None:
+            self._notification_keys = {
+                playback_notification_key(item)
+                for item in self._subscriptions.values()
+            }
+        notification_key = playback_notification_key(subscription)
+        return (
+            notification_key in self._subscriptions
+            or playback_subscription_key(subscription) in self._subscriptions
+            or notification_key in self._notification_keys
+        )
+
+    def has_other_active_stream(self, subscription: TvhSubscription) -> bool:
+        """同一用户是否还有另一路内容不同的真实播放。"""
+        if self._active_by_user is None:
+            self._active_by_user = {}
+            active = _playback_notification_map(self._subscriptions.values())
+            for key, active_subscription in active.items():
+                signatures = self._active_by_user.setdefault(active_subscription.username, {})
+                signatures.setdefault(_playback_content_signature(active_subscription), set()).add(key)
+        key = playback_notification_key(subscription)
+        signature = _playback_content_signature(subscription)
+        return any(
+            active_signature != signature and (len(keys) > 1 or key not in keys)
+            for active_signature, keys in self._active_by_user.get(subscription.username, {}).items()
+        )
 
 
 def _find_later_stop_for_start(
@@ -2244,16 +3131,6 @@ def _find_later_stop_for_start(
     return None
 
 
-def _has_other_active_stream(subscription: TvhSubscription, subscriptions: dict[str, TvhSubscription]) -> bool:
-    key = playback_notification_key(subscription)
-    return any(
-        subscription_key != key
-        and active_subscription.username == subscription.username
-        and _playback_content_signature(active_subscription) != _playback_content_signature(subscription)
-        for subscription_key, active_subscription in _playback_notification_map(subscriptions.values()).items()
-    )
-
-
 def format_playback_switch_notification(
     previous: TvhSubscription,
     current: TvhSubscription,
@@ -2474,46 +3351,36 @@ def merge_subscription_details(
     subscriptions: list[TvhSubscription],
     connections: list[TvhSubscription],
 ) -> list[TvhSubscription]:
-    unused_connections = list(connections)
+    """按用户名把连接信息（对端地址、客户端等）补到订阅上，每个连接只用一次；未匹配的连接追加在末尾。"""
+    connections_by_user: dict[str, deque] = {}
+    for index, connection in enumerate(connections):
+        connections_by_user.setdefault(connection.username, deque()).append(index)
+    used: set[int] = set()
     merged: list[TvhSubscription] = []
     for subscription in subscriptions:
-        match = next(
-            (
-                connection
-                for connection in unused_connections
-                if connection.username == subscription.username
-            ),
-            None,
-        )
-        if match:
-            unused_connections.remove(match)
-            merged.append(TvhSubscription(
-                subscription_id=match.subscription_id,
-                username=subscription.username,
-                channel=subscription.channel,
-                hostname=subscription.hostname or match.hostname,
-                title=subscription.title,
-                service=subscription.service,
-                profile=subscription.profile,
-                started=subscription.started,
-                state=subscription.state,
-                errors=subscription.errors,
-                input_kbps=subscription.input_kbps,
-                output_kbps=subscription.output_kbps,
-                peer=match.peer or subscription.peer,
-                proxy=match.proxy or subscription.proxy,
-                client=subscription.client or match.client,
-                user_agent=match.user_agent or subscription.user_agent,
-                location=subscription.location or match.location,
-                isp=subscription.isp or match.isp,
-                proxy_location=subscription.proxy_location or match.proxy_location,
-                proxy_isp=subscription.proxy_isp or match.proxy_isp,
-                hostname_location=subscription.hostname_location or match.hostname_location,
-                hostname_isp=subscription.hostname_isp or match.hostname_isp,
-            ))
-        else:
+        candidates = connections_by_user.get(subscription.username)
+        if not candidates:
             merged.append(subscription)
-    merged.extend(unused_connections)
+            continue
+        index = candidates.popleft()
+        used.add(index)
+        match = connections[index]
+        merged.append(replace(
+            subscription,
+            subscription_id=match.subscription_id,
+            hostname=subscription.hostname or match.hostname,
+            peer=match.peer or subscription.peer,
+            proxy=match.proxy or subscription.proxy,
+            client=subscription.client or match.client,
+            user_agent=match.user_agent or subscription.user_agent,
+            location=subscription.location or match.location,
+            isp=subscription.isp or match.isp,
+            proxy_location=subscription.proxy_location or match.proxy_location,
+            proxy_isp=subscription.proxy_isp or match.proxy_isp,
+            hostname_location=subscription.hostname_location or match.hostname_location,
+            hostname_isp=subscription.hostname_isp or match.hostname_isp,
+        ))
+    merged.extend(connection for index, connection in enumerate(connections) if index not in used)
     return merged
 
 
@@ -2522,51 +3389,37 @@ def enrich_subscriptions_with_ip_locations(
     resolver=None,
     cache: TimedValueCache | None = None,
     enabled: bool = True,
+    local_resolver=None,
+    local_complete=None,
+    merge=None,
+    max_workers: int = 4,
+    deadline: float = 8.0,
+    guard: IpLookupGuard | None = None,
 ) -> list[TvhSubscription]:
     if not enabled:
         return subscriptions
-    resolver = resolver or fetch_ip_location
-    local_cache: dict[str, tuple[str | None, str | None]] = {}
+    ips = []
+    for subscription in subscriptions:
+        ips.append(subscription.peer or subscription.hostname)
+        ips.append(subscription.hostname)
+    locations = resolve_ip_locations(
+        ips,
+        resolver=resolver,
+        cache=cache,
+        local_resolver=local_resolver,
+        local_complete=local_complete,
+        merge=merge,
+        max_workers=max_workers,
+        deadline=deadline,
+        guard=guard,
+    )
     enriched: list[TvhSubscription] = []
     for subscription in subscriptions:
         ip = subscription.peer or subscription.hostname
-        location = None
-        isp = None
-        hostname_location = None
-        hostname_isp = None
-        if ip and _is_public_ip(ip):
-            if cache:
-                location, isp = _split_location_result(fetch_ip_location_cached(ip, resolver=resolver, cache=cache))
-            else:
-                if ip not in local_cache:
-                    local_cache[ip] = resolver(ip)
-                location, isp = _split_location_result(local_cache[ip])
-        if subscription.hostname and _is_public_ip(subscription.hostname):
-            if cache:
-                hostname_location, hostname_isp = _split_location_result(
-                    fetch_ip_location_cached(subscription.hostname, resolver=resolver, cache=cache)
-                )
-            else:
-                if subscription.hostname not in local_cache:
-                    local_cache[subscription.hostname] = resolver(subscription.hostname)
-                hostname_location, hostname_isp = _split_location_result(local_cache[subscription.hostname])
-        enriched.append(TvhSubscription(
-            subscription_id=subscription.subscription_id,
-            username=subscription.username,
-            channel=subscription.channel,
-            hostname=subscription.hostname,
-            title=subscription.title,
-            service=subscription.service,
-            profile=subscription.profile,
-            started=subscription.started,
-            state=subscription.state,
-            errors=subscription.errors,
-            input_kbps=subscription.input_kbps,
-            output_kbps=subscription.output_kbps,
-            peer=subscription.peer,
-            proxy=subscription.proxy,
-            client=subscription.client,
-            user_agent=subscription.user_agent,
+        location, isp = locations.get(ip or "", (None, None))
+        hostname_location, hostname_isp = locations.get(subscription.hostname or "", (None, None))
+        enriched.append(replace(
+            subscription,
             location=location,
             isp=isp,
             proxy_location=None,
@@ -2577,11 +3430,142 @@ def enrich_subscriptions_with_ip_locations(
     return enriched
 
 
-def fetch_ip_location(ip: str, timeout: int = 2) -> tuple[str | None, str | None]:
-    location = fetch_ip_location_from_pconline(ip, timeout)
-    fallback = fetch_ip_location_from_ip_api(ip, timeout) or fetch_ip_location_from_ipapi(ip, timeout)
+def resolve_ip_locations(
+    ips: Iterable[str | None],
+    resolver=None,
+    cache: TimedValueCache | None = None,
+    local_resolver=None,
+    local_complete=None,
+    merge=None,
+    max_workers: int = 4,
+    deadline: float = 8.0,
+    timeout: int = 2,
+    guard: IpLookupGuard | None = None,
+) -> dict[str, tuple[str | None, str | None]]:
+    """批量解析IP归属地：去重后先查缓存和本地库，剩余公网IP并发在线查询，整体受截止时间约束。
+
+    未指定 resolver 时先用 ip-api 批量接口一次取回，再按单个IP补查 pconline 和 ipapi。
+    """
+    deadline_at = time.monotonic() + max(0.0, float(deadline))
+    local_complete = local_complete or all
+    merge = merge or _merge_ip_location_results
+    results: dict[str, tuple[str | None, str | None]] = {}
+    local_results: dict[str, tuple[str | None, str | None]] = {}
+    pending: list[str] = []
+    for ip in dict.fromkeys(str(ip) for ip in ips if ip):
+        if not _is_public_ip(ip):
+            continue
+        cached = cache.get(ip) if cache else None
+        if cached is not None:
+            results[ip] = _split_location_result(cached)
+            continue
+        local_result = (None, None)
+        if local_resolver:
+            try:
+                with hot_path_timing("ip.local"):
+                    local_result = _split_location_result(local_resolver(ip))
+            except Exception:
+                local_result = (None, None)
+            if local_complete(local_result):
+                results[ip] = local_result
+                if cache:
+                    cache.set(ip, local_result)
+                continue
+        local_results[ip] = local_result
+        pending.append(ip)
+    if not pending:
+        return results
+
+    with hot_path_timing("ip.online"):
+        if resolver is None:
+            batch_ips = [ip for ip in pending if not (guard and guard.is_known_miss(ip))]
+            ip_api_results = fetch_ip_locations_from_ip_api_batch(
+                batch_ips,
+                timeout=timeout,
+                breaker=_ip_provider_breaker(guard, "ip-api"),
+                deadline_at=deadline_at,
+            ) if batch_ips else {}
+            resolver = lambda value: _fetch_ip_location_with_ip_api_result(
+                value,
+                ip_api_results.get(value),
+                timeout,
+                guard,
+            )
+        online_results: dict[str, tuple[str | None, str | None]] = {}
+        executor = ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(pending))), thread_name_prefix="tvh-ip")
+        try:
+            futures = {executor.submit(resolver, ip): ip for ip in pending}
+            done, _ = wait(futures, timeout=max(0.0, deadline_at - time.monotonic()))
+            for future in done:
+                try:
+                    online_results[futures[future]] = _split_location_result(future.result())
+                except Exception:
+                    continue
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    resolved = {}
+    for ip in pending:
+        results[ip] = merge(local_results[ip], online_results.get(ip, (None, None)))
+        if any(results[ip]):
+            resolved[ip] = results[ip]
+    if cache and resolved:
+        cache.set_many(resolved)
+    return results
+
+
+def fetch_ip_location(ip: str, timeout: int = 2, guard: IpLookupGuard | None = None) -> tuple[str | None, str | None]:
+    if guard and guard.is_known_miss(ip):
+        return None, None
+    answers = {name: _IpProviderAnswer(_ip_provider_breaker(guard, name)) for name in IP_LOCATION_PROVIDERS}
+    location = fetch_ip_location_from_pconline(ip, timeout, answers["pconline"])
+    ip_api_result = fetch_ip_location_from_ip_api(ip, timeout, answers["ip-api"])
+    fallback = ip_api_result or fetch_ip_location_from_ipapi(ip, timeout, answers["ipapi"])
+    fallback_location, isp = _split_location_result(fallback)
+    result = location or fallback_location, isp
+    if guard:
+        answered = (
+            answers["pconline"].answered
+            and answers["ip-api"].answered
+            and (ip_api_result is not None or answers["ipapi"].answered)
+        )
+        guard.record_result(ip, result, answered=answered)
+    return result
+
+
+def _fetch_ip_location_with_ip_api_result(
+    ip: str,
+    ip_api_result: tuple[str | None, str | None] | None,
+    timeout: int = 2,
+    guard: IpLookupGuard | None = None,
+) -> tuple[str | None, str | None]:
+    if guard and guard.is_known_miss(ip):
+        return None, None
+    answers = {name: _IpProviderAnswer(_ip_provider_breaker(guard, name)) for name in ("pconline", "ipapi")}
+    location = fetch_ip_location_from_pconline(ip, timeout, answers["pconline"])
+    fallback = ip_api_result or fetch_ip_location_from_ipapi(ip, timeout, answers["ipapi"])
     fallback_location, isp = _split_location_result(fallback)
-    return location or fallback_location, isp
+    result = location or fallback_location, isp
+    if guard:
+        answered = answers["pconline"].answered and (ip_api_result is not None or answers["ipapi"].answered)
+        guard.record_result(ip, result, answered=answered)
+    return result
+
+
+def _ip_provider_breaker(guard: IpLookupGuard | None, name: str) -> ProviderCircuitBreaker | None:
+    return guard.breaker(name) if guard else None
+
+
+def _record_ip_provider_failure(breaker: ProviderCircuitBreaker | None, err: Exception | None = None) -> None:
+    if breaker:
+        breaker.record_failure(rate_limited=getattr(err, "code", None) == 429)
+
+
+def _merge_ip_location_results(
+    local_result: tuple[str | None, str | None],
+    online_result: tuple[str | None, str | None],
+) -> tuple[str | None, str | None]:
+    return local_result[0] or online_result[0], local_result[1] or online_result[1]
 
 
 def ensure_ip_location_db(
@@ -2651,6 +3635,8 @@ def ensure_ip_location_db(
             "asn_size": asn_path.stat().st_size,
             "ip2region_size": ip2region_path.stat().st_size,
         })
+    if downloaded:
+        reload_ip_location_dbs()
     return {
         "success": success,
         "updated": bool(downloaded),
@@ -2682,26 +3668,211 @@ def lookup_ip_location_from_ip2region(
     ip: str,
     xdb_path: str | Path | None = None,
     ip2region_module=None,
+    cache_mode: str | None = None,
 ) -> tuple[str | None, str | None]:
     if not xdb_path or not _is_public_ip(str(ip)):
         return None, None
     path = Path(xdb_path)
-    if not path.exists():
-        return None, None
     try:
-        searcher_module, util_module = _resolve_ip2region_modules(ip2region_module)
-        header = util_module.load_header_from_file(str(path))
-        version = util_module.version_from_header(header)
-        searcher = searcher_module.new_with_file_only(version, str(path))
-        try:
-            region = searcher.search(str(ip))
-        finally:
-            searcher.close()
+        modules = _resolve_ip2region_modules(ip2region_module)
+        mode = normalize_ip2region_cache_mode(cache_mode or _IP2REGION_CACHE_MODE)
+        with _IP_DB_POOL.use(
+            path,
+            ("ip2region", mode, *map(id, modules)),
+            lambda db_path: _open_ip2region_searcher(db_path, mode, *modules),
+        ) as handle:
+            if handle.lock is None:
+                region = handle.resource.search(str(ip))
+            else:
+                with handle.lock:
+                    region = handle.resource.search(str(ip))
     except Exception:
         return None, None
     return parse_ip2region_result(region)
 
 
+def normalize_ip2region_cache_mode(value: Any) -> str:
+    mode = str(value or DEFAULT_IP2REGION_CACHE_MODE).strip().lower()
+    return mode if mode in IP2REGION_CACHE_MODES else DEFAULT_IP2REGION_CACHE_MODE
+
+
+def set_ip2region_cache_mode(mode: Any) -> str:
+    """设置 ip2region 缓存方式：content 整库读入内存，mmap 只读映射，vector_index 只缓存向量索引。"""
+    global _IP2REGION_CACHE_MODE
+    _IP2REGION_CACHE_MODE = normalize_ip2region_cache_mode(mode)
+    return _IP2REGION_CACHE_MODE
+
+
+def ip_location_db_stats() -> dict[str, int]:
+    return _IP_DB_POOL.stats()
+
+
+def close_ip_location_dbs() -> None:
+    _IP_DB_POOL.close()
+
+
+def reload_ip_location_dbs() -> None:
+    """IP库文件更新后调用，下一次查询重新核对文件并按需换新句柄。"""
+    _IP_DB_POOL.reload()
+
+
+class _IpDbHandle:
+    def __init__(self, resource, closers: tuple, signature: tuple, serialized: bool = False) -> None:
+        self.resource = resource
+        self.closers = closers
+        self.signature = signature
+        self.lock = threading.Lock() if serialized else None
+        self.users = 0
+        self.retired = False
+        self.checked_at = float("-inf")
+
+    def close(self) -> None:
+        for closer in self.closers:
+            try:
+                closer()
+            except Exception:
+                pass
+
+
+class _IpDbPool:
+    """常驻的本地IP库句柄池（ip2region 查询器和 mmdb 读取器）。
+
+    按文件的 inode、大小和修改时间复用句柄。查询路径不做文件 I/O：只在打开句柄、
+    reload() 之后或距上次核对超过 check_interval 秒时才 stat 一次文件；
+    文件被替换后换新句柄，旧句柄等在途查询结束再关闭。
+    """
+
+    def __init__(self, check_interval: float = 60.0, clock=None) -> None:
+        self._lock = threading.Lock()
+        self._handles: dict[tuple, _IpDbHandle] = {}
+        self._check_interval = max(0.0, float(check_interval))
+        self._clock = clock or time.monotonic
+        self.opened = 0
+        self.reloads = 0
+        self.checks = 0
+
+    @contextmanager
+    def use(self, path: str | Path, option, opener):
+        path_text = str(path)
+        key = (path_text, option)
+        now = self._clock()
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and now - handle.checked_at < self._check_interval:
+                handle.users += 1
+            else:
+                handle = None
+        if handle is None:
+            signature = _ip_db_file_signature(path_text)
+            with self._lock:
+                self.checks += 1
+                handle = self._handles.get(key)
+                if handle is not None and handle.signature == signature:
+                    handle.checked_at = now
+                    handle.users += 1
+                else:
+                    handle = None
+            if handle is None:
+                handle = self._open(key, signature, opener, now)
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.users -= 1
+                closable = handle.retired and handle.users <= 0
+            if closable:
+                handle.close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "opened": self.opened,
+                "reloads": self.reloads,
+                "checks": self.checks,
+                "open_handles": len(self._handles),
+            }
+
+    def reload(self) -> None:
+        with self._lock:
+            for handle in self._handles.values():
+                handle.checked_at = float("-inf")
+
+    def close(self) -> None:
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            closable = []
+            for handle in handles:
+                handle.retired = True
+                if handle.users <= 0:
+                    closable.append(handle)
+        for handle in closable:
+            handle.close()
+
+    def _open(self, key: tuple, signature: tuple, opener, now: float) -> _IpDbHandle:
+        resource, closers, serialized = opener(key[0])
+        fresh = _IpDbHandle(resource, closers, signature, serialized)
+        fresh.checked_at = now
+        retired = None
+        with self._lock:
+            current = self._handles.get(key)
+            if current is not None and current.signature == signature:
+                current.checked_at = now
+                current.users += 1
+                discard = fresh
+                fresh = current
+            else:
+                discard = None
+                self._handles[key] = fresh
+                fresh.users += 1
+                self.opened += 1
+                if current is not None:
+                    self.reloads += 1
+                    current.retired = True
+                    if current.users <= 0:
+                        retired = current
+        if discard is not None:
+            discard.close()
+        if retired is not None:
+            retired.close()
+        return fresh
+
+
+def _open_mmdb_reader(path: str, maxminddb_module):
+    mode = getattr(maxminddb_module, "MODE_MMAP", None)
+    if mode is None:
+        reader = maxminddb_module.open_database(path)
+    else:
+        reader = maxminddb_module.open_database(path, mode)
+    closer = getattr(reader, "close", None)
+    return reader, (closer,) if callable(closer) else (), False
+
+
+def _ip_db_file_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _open_ip2region_searcher(path: str, mode: str, searcher_module, util_module):
+    header = util_module.load_header_from_file(path)
+    version = util_module.version_from_header(header)
+    if mode == "vector_index":
+        vector_index = util_module.load_vector_index_from_file(path)
+        searcher = searcher_module.new_with_vector_index(version, path, vector_index)
+        return searcher, (searcher.close,), True
+    if mode == "mmap":
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        searcher = searcher_module.new_with_buffer(version, buffer)
+        return searcher, (searcher.close, buffer.close), False
+    searcher = searcher_module.new_with_buffer(version, util_module.load_content_from_file(path))
+    return searcher, (searcher.close,), False
+
+
+_IP2REGION_CACHE_MODE = DEFAULT_IP2REGION_CACHE_MODE
+_IP_DB_POOL = _IpDbPool()
+
+
 def parse_ip2region_result(region: str | None) -> tuple[str | None, str | None]:
     if not region:
         return None, None
@@ -2735,12 +3906,19 @@ def fetch_ip_location_cached(
     return resolved
 
 
-def fetch_ip_location_from_pconline(ip: str, timeout: int = 2) -> str | None:
+def fetch_ip_location_from_pconline(
+    ip: str,
+    timeout: int = 2,
+    breaker: ProviderCircuitBreaker | None = None,
+) -> str | None:
+    if breaker and not breaker.allow():
+        return None
     url = f"https://whois.pconline.com.cn/ipJson.jsp?{urllib.parse.urlencode({'json': 'true', 'ip': ip})}"
     try:
         with urllib.request.urlopen(url, timeout=timeout) as response:
             payload_bytes = response.read()
-    except (OSError, urllib.error.URLError):
+    except (OSError, urllib.error.URLError) as err:
+        _record_ip_provider_failure(breaker, err)
         return None
     for encoding in ("utf-8", "gbk"):
         try:
@@ -2748,7 +3926,12 @@ def fetch_ip_location_from_pconline(ip: str, timeout: int = 2) -> str | None:
             break
         except (UnicodeDecodeError, json.JSONDecodeError):
             payload = None
-    if not payload or payload.get("err"):
+    if not isinstance(payload, dict):
+        _record_ip_provider_failure(breaker)
+        return None
+    if breaker:
+        breaker.record_success()
+    if payload.get("err"):
         return None
     parts = [
         _normalize_cn_geo_part(payload.get(key))
@@ -2758,13 +3941,25 @@ def fetch_ip_location_from_pconline(ip: str, timeout: int = 2) -> str | None:
     return " ".join(dict.fromkeys(parts)) or None
 
 
-def fetch_ip_location_from_ipapi(ip: str, timeout: int = 2) -> tuple[str | None, str | None] | None:
+def fetch_ip_location_from_ipapi(
+    ip: str,
+    timeout: int = 2,
+    breaker: ProviderCircuitBreaker | None = None,
+) -> tuple[str | None, str | None] | None:
+    if breaker and not breaker.allow():
+        return None
     url = f"https://ipapi.co/{urllib.parse.quote(ip)}/json/"
     try:
         with urllib.request.urlopen(url, timeout=timeout) as response:
             payload = json.loads(response.read().decode("utf-8"))
-    except (OSError, urllib.error.URLError, json.JSONDecodeError):
+    except (OSError, urllib.error.URLError, json.JSONDecodeError) as err:
+        _record_ip_provider_failure(breaker, err)
+        return None
+    if payload.get("reason") == "RateLimited":
+        _record_ip_provider_failure(breaker)
         return None
+    if breaker:
+        breaker.record_success()
     if payload.get("error"):
         return None
     parts = [
@@ -2776,18 +3971,75 @@ def fetch_ip_location_from_ipapi(ip: str, timeout: int = 2) -> tuple[str | None,
     return " ".join(dict.fromkeys(parts)) or None, str(isp).strip() if isp else None
 
 
-def fetch_ip_location_from_ip_api(ip: str, timeout: int = 2) -> tuple[str | None, str | None] | None:
+def fetch_ip_location_from_ip_api(
+    ip: str,
+    timeout: int = 2,
+    breaker: ProviderCircuitBreaker | None = None,
+) -> tuple[str | None, str | None] | None:
+    if breaker and not breaker.allow():
+        return None
     query = urllib.parse.urlencode({
         "lang": "zh-CN",
-        "fields": "status,country,regionName,city,isp,org,query",
+        "fields": IP_API_FIELDS,
     })
     url = f"https://ip-api.com/json/{urllib.parse.quote(ip)}?{query}"
     try:
         with urllib.request.urlopen(url, timeout=timeout) as response:
             payload = json.loads(response.read().decode("utf-8"))
-    except (OSError, urllib.error.URLError, json.JSONDecodeError):
+    except (OSError, urllib.error.URLError, json.JSONDecodeError) as err:
+        _record_ip_provider_failure(breaker, err)
         return None
-    if payload.get("status") != "success":
+    if breaker:
+        breaker.record_success()
+    return _parse_ip_api_payload(payload)
+
+
+def fetch_ip_locations_from_ip_api_batch(
+    ips: Iterable[str],
+    timeout: int = 2,
+    breaker: ProviderCircuitBreaker | None = None,
+    deadline_at: float | None = None,
+) -> dict[str, tuple[str | None, str | None]]:
+    """ip-api 批量接口，每次最多100个IP；给出 deadline_at（time.monotonic）时每批超时不超过剩余时间，过期后不再请求。"""
+    query = urllib.parse.urlencode({
+        "lang": "zh-CN",
+        "fields": IP_API_FIELDS,
+    })
+    ip_list = list(dict.fromkeys(ips))
+    results: dict[str, tuple[str | None, str | None]] = {}
+    for offset in range(0, len(ip_list), IP_API_BATCH_SIZE):
+        chunk_timeout = timeout
+        if deadline_at is not None:
+            chunk_timeout = min(timeout, deadline_at - time.monotonic())
+            if chunk_timeout <= 0:
+                break
+        if breaker and not breaker.allow():
+            break
+        request = urllib.request.Request(
+            f"https://ip-api.com/batch?{query}",
+            data=json.dumps(ip_list[offset:offset + IP_API_BATCH_SIZE]).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=chunk_timeout) as response:
+                payload = json.loads(response.read().decode("utf-8"))
+        except (OSError, urllib.error.URLError, json.JSONDecodeError) as err:
+            _record_ip_provider_failure(breaker, err)
+            break
+        if breaker:
+            breaker.record_success()
+        for item in payload if isinstance(payload, list) else []:
+            if not isinstance(item, dict) or not item.get("query"):
+                continue
+            result = _parse_ip_api_payload(item)
+            if result:
+                results[str(item["query"])] = result
+    return results
+
+
+def _parse_ip_api_payload(payload) -> tuple[str | None, str | None] | None:
+    if not isinstance(payload, dict) or payload.get("status") != "success":
         return None
     parts = [
         str(payload.get(key)).strip()
@@ -2798,6 +4050,12 @@ def fetch_ip_location_from_ip_api(ip: str, timeout: int = 2) -> tuple[str | None
     return " ".join(dict.fromkeys(parts)) or None, str(isp).strip() if isp else None
 
 
+def read_ip_location_db_version(directory: str | Path) -> str:
+    """本地IP库版本，取自更新状态文件中的更新时间；IP缓存据此判断是否需要作废。"""
+    updated_at = _read_ipdb_status(Path(directory) / IPDB_STATUS_FILENAME).get("updated_at")
+    return str(updated_at or "")
+
+
 def _read_ipdb_status(path: Path) -> dict:
     if not path.exists():
         return {}
@@ -2865,11 +4123,13 @@ def _lookup_mmdb_record(path: str | Path | None, ip: str, maxminddb_module, extr
     if not path:
         return None
     db_path = Path(path)
-    if not db_path.exists():
-        return None
     try:
-        with maxminddb_module.open_database(str(db_path)) as reader:
-            record = reader.get(str(ip))
+        with _IP_DB_POOL.use(
+            db_path,
+            ("mmdb", id(maxminddb_module)),
+            lambda path: _open_mmdb_reader(path, maxminddb_module),
+        ) as handle:
+            record = handle.resource.get(str(ip))
     except Exception:
         return None
     if not isinstance(record, dict):
@@ -3030,6 +4290,25 @@ def fetch_tvh_json(base_url: str, path: str, username: str, password: str, timeo
     return _open_tvh_json(request, url, username, password, timeout)
 
 
+def fetch_tvh_grid(base_url: str, path: str, username: str, password: str, parse_entry, timeout: int = 10) -> list:
+    """边读响应边解析 grid 的 entries 数组，逐条交给 parse_entry，只保留返回值不为 None 的结果。"""
+    url = f"{normalize_base_url(base_url)}{path}"
+    request = urllib.request.Request(url)
+
+    def read(response) -> list:
+        results = []
+        with hot_path_timing("grid.stream"):
+            for entry in iter_json_array_items(response, "entries"):
+                if not isinstance(entry, dict):
+                    continue
+                item = parse_entry(entry)
+                if item is not None:
+                    results.append(item)
+        return results
+
+    return _open_tvh_stream(request, url, username, password, timeout, read)
+
+
 def fetch_tvh_text(base_url: str, path: str, username: str, password: str, timeout: int = 10) -> str:
     url = f"{normalize_base_url(base_url)}{path}"
     request = urllib.request.Request(url)
@@ -3061,30 +4340,48 @@ def parse_tvh_epg_events(payload: dict, now: int | None = None) -> list[TvhEpgEv
     for entry in payload.get("entries", []) if isinstance(payload, dict) else []:
         if not isinstance(entry, dict):
             continue
-        event_id = _string_or_none(entry.get("eventId") or entry.get("event_id") or entry.get("id"))
-        channel_uuid = _string_or_none(entry.get("channelUuid") or entry.get("channel_uuid"))
-        channel_name = _string_or_none(entry.get("channelName") or entry.get("channel") or entry.get("name"))
-        title = _string_or_none(entry.get("title"))
-        start = _to_int_or_none(entry.get("start"))
-        stop = _to_int_or_none(entry.get("stop"))
-        if not event_id or not title or start is None or stop is None:
-            continue
-        if stop <= now_value:
-            continue
-        events.append(TvhEpgEvent(
-            event_id=event_id,
-            channel_uuid=channel_uuid or "",
-            channel_name=channel_name or "",
-            title=title,
-            start=start,
-            stop=stop,
-            subtitle=_string_or_none(entry.get("subtitle")),
-            summary=_string_or_none(entry.get("summary")),
-            description=_string_or_none(entry.get("description")),
-        ))
+        event = _tvh_epg_event_from_entry(entry, now_value)
+        if event is not None:
+            events.append(event)
     return sorted(events, key=lambda item: (item.start, item.stop, item.title))
 
 
+def _tvh_epg_event_from_entry(
+    entry: dict,
+    now_value: int,
+    cutoff: int | None = None,
+    start_from: int | None = None,
+    channel_uuid: str | None = None,
+    channel_name: str | None = None,
+) -> TvhEpgEvent | None:
+    """先按时间窗口和频道筛选原始条目，通过后才创建 TvhEpgEvent。"""
+    start = _to_int_or_none(entry.get("start"))
+    stop = _to_int_or_none(entry.get("stop"))
+    if start is None or stop is None or stop <= now_value:
+        return None
+    if (cutoff is not None and start >= cutoff) or (start_from is not None and start < start_from):
+        return None
+    event_id = _string_or_none(entry.get("eventId") or entry.get("event_id") or entry.get("id"))
+    title = _string_or_none(entry.get("title"))
+    if not event_id or not title:
+        return None
+    event_channel_uuid = _string_or_none(entry.get("channelUuid") or entry.get("channel_uuid")) or ""
+    event_channel_name = _string_or_none(entry.get("channelName") or entry.get("channel") or entry.get("name")) or ""
+    if not _tvh_epg_channel_matches(event_channel_uuid, event_channel_name, channel_uuid, channel_name):
+        return None
+    return TvhEpgEvent(
+        event_id=event_id,
+        channel_uuid=event_channel_uuid,
+        channel_name=event_channel_name,
+        title=title,
+        start=start,
+        stop=stop,
+        subtitle=_string_or_none(entry.get("subtitle")),
+        summary=_string_or_none(entry.get("summary")),
+        description=_string_or_none(entry.get("description")),
+    )
+
+
 def search_tvh_epg_events(
     events: Iterable[TvhEpgEvent],
     keyword: str,
@@ -3101,46 +4398,291 @@ def search_tvh_epg_events(
         return []
 
     now_value = int(now if now is not None else time.time())
-    results = [
-        event
-        for event in events
-        if (include_past or event.stop > now_value)
-        and _tvh_epg_event_matches_keyword(event, normalized_keywords)
-    ]
+    if isinstance(events, (TvhEpgEventList, TvhEpgSearchIndex)):
+        matched = events.matching_events(normalized_keywords)
+    else:
+        matched = (event for event in events if _tvh_epg_event_matches_keyword(event, normalized_keywords))
+    results = [event for event in matched if include_past or event.stop > now_value]
     results.sort(key=lambda item: (item.start, item.stop, item.title))
     return results if max_results is None else results[:max_results]
 
 
+_TVH_EPG_SEARCH_SEPARATOR = "\x00"
+
+
+class TvhEpgSearchIndex:
+    """节目搜索索引：每个节目预先折叠成一段检索文本，并按相邻两字建立倒排表筛选候选。
+
+    支持按节目键增量增删；删除只做标记，过期条目过多时整体压缩。
+    """
+
+    def __init__(self, events: Iterable[TvhEpgEvent] = ()) -> None:
+        self._lock = threading.RLock()
+        self._slots: dict[Any, int] = {}
+        self._entries: list[tuple[TvhEpgEvent, str] | None] = []
+        self._grams: dict[str, array] = {}
+        self._stale = 0
+        self.version = 0
+        for position, event in enumerate(events):
+            self.add(position, event)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, key: Any, event: TvhEpgEvent, text: str | None = None) -> None:
+        with self._lock:
+            self.discard(key)
+            if text is None:
+                text = _tvh_epg_event_search_text(event)
+            slot = len(self._entries)
+            self._slots[key] = slot
+            self._entries.append((event, text))
+            self._index_text(slot, text)
+            self.version += 1
+
+    def prepare_many(
+        self,
+        events: list[TvhEpgEvent],
+        offload: "ProcessOffload | None" = None,
+    ) -> tuple[int, list[str], dict[str, array]]:
+        """不持锁为一批节目生成折叠文本和倒排表，数量够多时可交给 offload 的子进程；结果交给 add_many 并入。"""
+        base = len(self._entries)
+        fields = [_tvh_epg_event_search_texts(event) for event in events]
+        if offload is not None:
+            texts, grams = offload.run(len(events), _prepare_tvh_epg_search_batch, fields, base)
+        else:
+            texts, grams = _prepare_tvh_epg_search_batch(fields, base)
+        return base, texts, grams
+
+    def add_many(
+        self,
+        items: list[tuple[Any, TvhEpgEvent]],
+        offload: "ProcessOffload | None" = None,
+        prepared: tuple[int, list[str], dict[str, array]] | None = None,
+        live: dict[Any, TvhEpgEvent] | None = None,
+    ) -> None:
+        """批量加入节目，键不能重复。
+
+        prepared 为 prepare_many 对同一批节目的结果，未给出时先在锁外生成；锁内只登记槽位并追加倒排表。
+        给出 live 时只有 live 中仍对应同一节目的键登记为有效，其余槽位直接记为过期。
+        """
+        if not items:
+            return
+        if prepared is None:
+            prepared = self.prepare_many([event for _key, event in items], offload=offload)
+        prepared_base, texts, grams = prepared
+        with self._lock:
+            for key, event in items:
+                if live is None or live.get(key) is event:
+                    self.discard(key)
+            base = len(self._entries)
+            if base != prepared_base:
+                shift = base - prepared_base
+                grams = {gram: array("I", [slot + shift for slot in slots]) for gram, slots in grams.items()}
+            for slot, ((key, event), text) in enumerate(zip(items, texts), start=base):
+                if live is None or live.get(key) is event:
+                    self._slots[key] = slot
+                    self._entries.append((event, text))
+                else:
+                    self._entries.append(None)
+                    self._stale += 1
+            for gram, slots in grams.items():
+                existing = self._grams.get(gram)
+                if existing is None:
+                    self._grams[gram] = slots
+                else:
+                    existing.extend(slots)
+            self.version += 1
+
+    def discard(self, key: Any) -> None:
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                return
+            self._entries[slot] = None
+            self._stale += 1
+            self.version += 1
+            if self._stale > 1024 and self._stale > len(self._slots):
+                self._compact()
+
+    def text(self, key: Any, event: TvhEpgEvent) -> str | None:
+        """返回已折叠的检索文本；该键当前对应的不是同一节目时返回 None。"""
+        with self._lock:
+            slot = self._slots.get(key)
+            entry = None if slot is None else self._entries[slot]
+            return entry[1] if entry is not None and entry[0] is event else None
+
+    def matching_events(
+        self,
+        normalized_keywords: tuple[str, ...],
+        version: int | None = None,
+    ) -> list[TvhEpgEvent] | None:
+        """按加入顺序返回任一关键词是检索文本子串的节目；索引版本已变化时返回 None。"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return None
+            if any(_TVH_EPG_SEARCH_SEPARATOR in keyword for keyword in normalized_keywords):
+                return [
+                    entry[0]
+                    for entry in self._entries
+                    if entry is not None and _tvh_epg_event_matches_keyword(entry[0], normalized_keywords)
+                ]
+            candidates: set[int] = set()
+            for keyword in normalized_keywords:
+                slots = self._candidates(keyword)
+                if slots is None:
+                    candidates = set(self._slots.values())
+                    break
+                candidates.update(slots)
+            matched = []
+            for slot in sorted(candidates):
+                entry = self._entries[slot]
+                if entry is not None and any(keyword in entry[1] for keyword in normalized_keywords):
+                    matched.append(entry[0])
+            return matched
+
+    def _candidates(self, keyword: str) -> set[int] | None:
+        if len(keyword) < 2:
+            return None
+        postings = []
+        for gram in {keyword[index:index + 2] for index in range(len(keyword) - 1)}:
+            slots = self._grams.get(gram)
+            if slots is None:
+                return set()
+            postings.append(slots)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for slots in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(slots)
+        return candidates
+
+    def _index_text(self, slot: int, text: str) -> None:
+        grams = self._grams
+        for gram in {text[index:index + 2] for index in range(len(text) - 1)}:
+            slots = grams.get(gram)
+            if slots is None:
+                slots = grams[gram] = array("I")
+            slots.append(slot)
+
+    def _compact(self) -> None:
+        live = sorted(self._slots.items(), key=lambda item: item[1])
+        entries = self._entries
+        self._slots = {}
+        self._entries = []
+        self._grams = {}
+        self._stale = 0
+        for key, slot in live:
+            event, text = entries[slot]
+            self._slots[key] = len(self._entries)
+            self._entries.append((event, text))
+            self._index_text(self._slots[key], text)
+
+
+class TvhEpgEventList(list):
+    """节目快照列表；搜索时优先使用来源仓库的增量索引，仓库已变化则为快照单独建索引。"""
+
+    def __init__(
+        self,
+        events: Iterable[TvhEpgEvent] = (),
+        search_index: TvhEpgSearchIndex | None = None,
+        version: int | None = None,
+    ) -> None:
+        super().__init__(events)
+        self._search_index = search_index
+        self._version = version
+        self._own_index: TvhEpgSearchIndex | None = None
+        self._lock = threading.Lock()
+
+    def matching_events(self, normalized_keywords: tuple[str, ...]) -> list[TvhEpgEvent]:
+        if self._search_index is not None and self._version is not None:
+            matched = self._search_index.matching_events(normalized_keywords, version=self._version)
+            if matched is not None:
+                return matched
+        with self._lock:
+            if self._own_index is None or len(self._own_index) != len(self):
+                self._own_index = TvhEpgSearchIndex()
+                for position, event in enumerate(self):
+                    text = None
+                    if self._search_index is not None:
+                        text = self._search_index.text(_tvh_epg_event_key(event), event)
+                    self._own_index.add(position, event, text)
+            index = self._own_index
+        return index.matching_events(normalized_keywords)
+
+
+def _prepare_tvh_epg_search_batch(
+    fields: list[tuple[str | None, ...]],
+    base: int = 0,
+) -> tuple[list[str], dict[str, array]]:
+    """为一批节目生成检索文本和从 base 起编号的相邻两字倒排表；只依赖字符串，可在子进程中执行。"""
+    texts = []
+    grams: dict[str, array] = {}
+    for slot, values in enumerate(fields, start=base):
+        text = _tvh_epg_search_text_from_fields(values)
+        texts.append(text)
+        for gram in {text[index:index + 2] for index in range(len(text) - 1)}:
+            slots = grams.get(gram)
+            if slots is None:
+                slots = grams[gram] = array("I")
+            slots.append(slot)
+    return texts, grams
+
+
+def _tvh_epg_event_search_text(event: TvhEpgEvent) -> str:
+    return _tvh_epg_search_text_from_fields(_tvh_epg_event_search_texts(event))
+
+
+def _tvh_epg_search_text_from_fields(values: Iterable[str | None]) -> str:
+    folded: dict[str, None] = {}
+    for text in values:
+        if text:
+            value = _fold_tvh_epg_text(text)
+            if value:
+                folded[value] = None
+    return _TVH_EPG_SEARCH_SEPARATOR.join(folded)
+
+
 def _tvh_epg_event_matches_keyword(event: TvhEpgEvent, normalized_keywords: tuple[str, ...]) -> bool:
-    return any(
-        keyword in text_variant
-        for text in _tvh_epg_event_search_texts(event)
-        if text and text.strip()
-        for text_variant in _tvh_epg_search_variants(text)
-        for keyword in normalized_keywords
-    )
+    for text in _tvh_epg_event_search_texts(event):
+        if not text:
+            continue
+        folded = _fold_tvh_epg_text(text)
+        if folded and any(keyword in folded for keyword in normalized_keywords):
+            return True
+    return False
 
 
 def _tvh_epg_event_search_texts(event: TvhEpgEvent) -> tuple[str | None, ...]:
-    return (
-        event.title,
-        event.channel_name,
-        event.subtitle,
-        event.summary,
-        getattr(event, "details", None),
-        event.description,
+    return tuple(
+        getattr(event, name, None)
+        for name in ("title", "channel_name", "subtitle", "summary", "details", "description")
     )
 
 
 def _tvh_epg_search_variants(value: str | None) -> tuple[str, ...]:
-    text = str(value or "").strip()
-    if not text:
-        return ()
-    return tuple(dict.fromkeys((
-        text.casefold(),
-        text.translate(SIMPLIFIED_TO_TRADITIONAL).casefold(),
-        text.translate(TRADITIONAL_TO_SIMPLIFIED).casefold(),
-    )))
+    folded = _fold_tvh_epg_text(str(value or ""))
+    return (folded,) if folded else ()
+
+
+_TVH_EPG_FOLD_CACHE_MAX_LENGTH = 128
+
+
+def _fold_tvh_epg_text(text: str) -> str:
+    """把简繁两种写法统一折叠成繁体并 casefold，空白文本返回空串。
+
+    对照表中简转繁幂等且繁转简再转繁不变，因此比较折叠结果与分别比较原文、转繁、转简三种写法等价。
+    标题、频道名等短文本在整份指南里大量重复，按原文缓存折叠结果。
+    """
+    if len(text) > _TVH_EPG_FOLD_CACHE_MAX_LENGTH:
+        return text.strip().translate(SIMPLIFIED_TO_TRADITIONAL).casefold()
+    return _fold_tvh_epg_short_text(text)
+
+
+@functools.lru_cache(maxsize=8192)
+def _fold_tvh_epg_short_text(text: str) -> str:
+    return text.strip().translate(SIMPLIFIED_TO_TRADITIONAL).casefold()
 
 
 def parse_tvh_dvr_configs(payload: dict) -> list[TvhDvrConfig]:
@@ -3172,50 +4714,62 @@ def parse_tvh_dvr_entries(payload: dict) -> list[TvhDvrEntry]:
     for entry in payload.get("entries", []) if isinstance(payload, dict) else []:
         if not isinstance(entry, dict):
             continue
-        uuid = _string_or_none(entry.get("uuid") or entry.get("id"))
-        title = _string_or_none(entry.get("disp_title") or entry.get("title") or entry.get("basename"))
-        start = _to_int_or_none(entry.get("start"))
-        stop = _to_int_or_none(entry.get("stop"))
-        if not uuid or not title or start is None or stop is None:
-            continue
-        entries.append(TvhDvrEntry(
-            uuid=uuid,
-            title=title,
-            channel=_string_or_none(
-                entry.get("channelname")
-                or entry.get("channelName")
-                or entry.get("channel_name")
-                or entry.get("channel")
-            ) or "",
-            start=start,
-            stop=stop,
-            start_real=_to_int_or_none(entry.get("start_real")),
-            stop_real=_to_int_or_none(entry.get("stop_real")),
-            duration=_to_int_or_none(entry.get("duration")),
-            start_extra=_to_int_or_none(entry.get("start_extra")),
-            stop_extra=_to_int_or_none(entry.get("stop_extra")),
-            sched_status=_string_or_none(entry.get("sched_status") or entry.get("sched_state")),
-            rec_status=_string_or_none(entry.get("rec_status") or entry.get("recording_state")),
-            status=_string_or_none(entry.get("status")),
-            comment=_string_or_none(entry.get("comment")),
-            error=_string_or_none(entry.get("error") or entry.get("last_error")),
-            errorcode=_to_int_or_none(entry.get("errorcode")),
-            recording_errors=_to_int_or_none(entry.get("errors")),
-            data_errors=_to_int_or_none(entry.get("data_errors")),
-            filesize=_to_int_or_none(entry.get("filesize") or entry.get("data_size")),
-            filename=_string_or_none(entry.get("filename") or entry.get("files") or entry.get("file")),
-            url=_string_or_none(entry.get("url") or entry.get("play_url") or entry.get("download_url")),
-        ))
+        item = _tvh_dvr_entry_from_entry(entry)
+        if item is not None:
+            entries.append(item)
+    return _sort_tvh_dvr_entries(entries)
+
+
+def _sort_tvh_dvr_entries(entries: Iterable[TvhDvrEntry]) -> list[TvhDvrEntry]:
     return sorted(entries, key=lambda item: (item.start_real or item.start, item.stop_real or item.stop, item.title))
 
 
+def _tvh_dvr_entry_from_entry(entry: dict) -> TvhDvrEntry | None:
+    uuid = _string_or_none(entry.get("uuid") or entry.get("id"))
+    title = _string_or_none(entry.get("disp_title") or entry.get("title") or entry.get("basename"))
+    start = _to_int_or_none(entry.get("start"))
+    stop = _to_int_or_none(entry.get("stop"))
+    if not uuid or not title or start is None or stop is None:
+        return None
+    return TvhDvrEntry(
+        uuid=uuid,
+        title=title,
+        channel=_string_or_none(
+            entry.get("channelname")
+            or entry.get("channelName")
+            or entry.get("channel_name")
+            or entry.get("channel")
+        ) or "",
+        start=start,
+        stop=stop,
+        start_real=_to_int_or_none(entry.get("start_real")),
+        stop_real=_to_int_or_none(entry.get("stop_real")),
+        duration=_to_int_or_none(entry.get("duration")),
+        start_extra=_to_int_or_none(entry.get("start_extra")),
+        stop_extra=_to_int_or_none(entry.get("stop_extra")),
+        sched_status=_string_or_none(entry.get("sched_status") or entry.get("sched_state")),
+        rec_status=_string_or_none(entry.get("rec_status") or entry.get("recording_state")),
+        status=_string_or_none(entry.get("status")),
+        comment=_string_or_none(entry.get("comment")),
+        error=_string_or_none(entry.get("error") or entry.get("last_error")),
+        errorcode=_to_int_or_none(entry.get("errorcode")),
+        recording_errors=_to_int_or_none(entry.get("errors")),
+        data_errors=_to_int_or_none(entry.get("data_errors")),
+        filesize=_to_int_or_none(entry.get("filesize") or entry.get("data_size")),
+        filename=_string_or_none(entry.get("filename") or entry.get("files") or entry.get("file")),
+        url=_string_or_none(entry.get("url") or entry.get("play_url") or entry.get("download_url")),
+    )
+
+
 def fetch_tvh_channels(base_url: str, username: str, password: str, timeout: int = 10) -> list[TvhChannel]:
     payload = fetch_tvh_json(base_url, "/api/channel/grid?limit=999&sort=number", username, password, timeout=timeout)
-    channels = parse_tvh_channels(payload)
+    with hot_path_timing("parse.channels"):
+        channels = parse_tvh_channels(payload)
     if channels:
         return channels
     payload = fetch_tvh_json(base_url, "/api/channel/list?numbers=1", username, password, timeout=timeout)
-    return parse_tvh_channels(payload)
+    with hot_path_timing("parse.channels"):
+        return parse_tvh_channels(payload)
 
 
 def fetch_tvh_epg_events(
@@ -3227,33 +4781,606 @@ def fetch_tvh_epg_events(
     hours: int = 24,
     timeout: int = 10,
     now: int | None = None,
+    server_filter: bool = False,
+    start_from: int | None = None,
+    offload: "ProcessOffload | None" = None,
 ) -> list[TvhEpgEvent]:
+    """拉取节目指南；给出 offload 时先读完整个响应，再把解析交给它，数量够多时在子进程中执行。"""
     now_value = int(now if now is not None else time.time())
-    query = urllib.parse.urlencode({
+    cutoff = now_value + max(1, int(hours or 24)) * 3600
+    query = {
         "limit": 999,
         "sort": "start",
         "dir": "ASC",
         "fulltext": 0,
-    })
-    payload = fetch_tvh_json(base_url, f"/api/epg/events/grid?{query}", username, password, timeout=timeout)
-    cutoff = now_value + max(1, int(hours or 24)) * 3600
-    events = []
-    for event in parse_tvh_epg_events(payload, now=now_value):
-        if event.start >= cutoff:
-            continue
-        if channel_uuid and event.channel_uuid and event.channel_uuid != channel_uuid:
-            continue
-        if channel_name and event.channel_name and _normalize_match_text(event.channel_name) != _normalize_match_text(channel_name):
-            continue
-        if channel_uuid and not event.channel_uuid and channel_name and _normalize_match_text(event.channel_name) != _normalize_match_text(channel_name):
+    }
+    if server_filter:
+        if channel_uuid or channel_name:
+            query["channel"] = channel_uuid or channel_name
+        filters = [
+            {"field": "stop", "type": "numeric", "value": now_value, "comparison": "gt"},
+            {"field": "start", "type": "numeric", "value": cutoff, "comparison": "lt"},
+        ]
+        if start_from is not None:
+            filters.append({"field": "start", "type": "numeric", "value": int(start_from) - 1, "comparison": "gt"})
+        query["filter"] = json.dumps(filters, separators=(",", ":"))
+    path = f"/api/epg/events/grid?{urllib.parse.urlencode(query)}"
+    if offload is not None:
+        url = f"{normalize_base_url(base_url)}{path}"
+        body = _open_tvh_stream(urllib.request.Request(url), url, username, password, timeout, lambda response: response.read())
+        rows = offload.run(
+            body.count(b'"eventId"'),
+            _parse_tvh_epg_grid_body,
+            body,
+            now_value,
+            cutoff,
+            start_from,
+            channel_uuid,
+            channel_name,
+        )
+        events = [TvhEpgEvent(*row) for row in rows]
+    else:
+        events = fetch_tvh_grid(
+            base_url,
+            path,
+            username,
+            password,
+            lambda entry: _tvh_epg_event_from_entry(
+                entry,
+                now_value,
+                cutoff=cutoff,
+                start_from=start_from,
+                channel_uuid=channel_uuid,
+                channel_name=channel_name,
+            ),
+            timeout=timeout,
+        )
+    return sorted(events, key=lambda item: (item.start, item.stop, item.title))
+
+
+def _parse_tvh_epg_grid_body(
+    body: bytes,
+    now_value: int,
+    cutoff: int,
+    start_from: int | None,
+    channel_uuid: str | None,
+    channel_name: str | None,
+) -> list[tuple]:
+    """解析整份 EPG grid 响应，按 TvhEpgEvent 字段顺序返回元组；只依赖标准库，可在子进程中执行。
+
+    返回元组而不是 TvhEpgEvent，子进程里的 core 与插件包内的 core 模块名不同，实例无法跨进程还原。
+    """
+    try:
+        payload = json.loads(body) if body else {}
+    except (json.JSONDecodeError, UnicodeDecodeError) as err:
+        raise TvhError(str(err)) from err
+    entries = payload.get("entries") if isinstance(payload, dict) else None
+    names = [item.name for item in fields(TvhEpgEvent)]
+    rows = []
+    for entry in entries or []:
+        if not isinstance(entry, dict):
             continue
-        events.append(event)
-    return events
+        event = _tvh_epg_event_from_entry(
+            entry,
+            now_value,
+            cutoff=cutoff,
+            start_from=start_from,
+            channel_uuid=channel_uuid,
+            channel_name=channel_name,
+        )
+        if event is not None:
+            rows.append(tuple(getattr(event, name) for name in names))
+    return rows
+
+
+PROCESS_OFFLOAD_TASKS = frozenset({"_prepare_tvh_epg_search_batch", "_parse_tvh_epg_grid_body"})
+
+
+class _OffloadWorkerPool:
+    """ProcessOffload 默认的进程池：以脚本方式启动 offload_worker.py，经管道收发 pickle 数据。
+
+    子进程只导入同目录的 core，不经过插件包的 __init__，也不会重新执行宿主程序的 __main__。
+    任务按函数名提交，只接受 PROCESS_OFFLOAD_TASKS 中的 core 函数。
+    单个任务超过 timeout 秒未返回时杀掉并回收该子进程，任务以 TvhError 失败。
+    """
+
+    def __init__(self, workers: int, script: str | Path | None = None, timeout: float = 60.0) -> None:
+        self.workers = max(1, int(workers))
+        self.script = Path(script) if script else Path(__file__).with_name("offload_worker.py")
+        self.timeout = max(0.0, float(timeout))
+        self._cond = threading.Condition()
+        self._idle: list[subprocess.Popen] = []
+        self._processes: list[subprocess.Popen] = []
+        self._closed = False
+
+    def submit(self, function, *args) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(self._call(function, args))
+        except Exception as err:
+            future.set_exception(err)
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for process in idle:
+            self._stop(process, wait)
+
+    def _call(self, function, args):
+        name = getattr(function, "__name__", "")
+        if name not in PROCESS_OFFLOAD_TASKS or globals().get(name) is not function:
+            raise TvhError(f"不支持的子进程任务: {name}")
+        process = self._acquire()
+        try:
+            ok, result = self._exchange(process, (name, args))
+        except BaseException:
+            self._release(process, broken=True)
+            raise
+        self._release(process)
+        if not ok:
+            raise TvhError(f"子进程任务失败: {result}")
+        return result
+
+    def _exchange(self, process: subprocess.Popen, request: tuple):
+        """在辅助线程里收发管道数据，调用方最多等待 timeout 秒；超时杀掉子进程使管道读写返回。"""
+        reply: dict[str, Any] = {}
+
+        def talk() -> None:
+            try:
+                pickle.dump(request, process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+                process.stdin.flush()
+                reply["value"] = pickle.load(process.stdout)
+            except BaseException as err:
+                reply["error"] = err
+
+        thread = threading.Thread(target=talk, name="tvhhelper-offload-io", daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        if thread.is_alive():
+            process.kill()
+            process.wait()
+            thread.join(1.0)
+            raise TvhError(f"子进程任务超过 {self.timeout:g} 秒未返回")
+        if "error" in reply:
+            raise reply["error"]
+        return reply["value"]
+
+    def _acquire(self) -> subprocess.Popen:
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise TvhError("子进程池已关闭")
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._processes) < self.workers:
+                    process = subprocess.Popen(
+                        [sys.executable, str(self.script)],
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        cwd=str(self.script.parent),
+                    )
+                    self._processes.append(process)
+                    return process
+                self._cond.wait()
+
+    def _release(self, process: subprocess.Popen, broken: bool = False) -> None:
+        with self._cond:
+            if broken or self._closed:
+                self._processes.remove(process)
+            else:
+                self._idle.append(process)
+            self._cond.notify()
+        if broken or self._closed:
+            self._stop(process, wait=not broken)
+
+    @staticmethod
+    def _stop(process: subprocess.Popen, wait: bool) -> None:
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        if wait:
+            try:
+                process.wait(timeout=2)
+                return
+            except subprocess.TimeoutExpired:
+                pass
+        process.kill()
+        process.wait()
+
+
+class ProcessOffload:
+    """把大批量的纯计算交给小进程池，避免长时间占用 GIL；数量低于 threshold 时仍在当前线程执行。
+
+    进程池首次需要时才创建，默认由 _OffloadWorkerPool 以脚本方式启动子进程，子进程只导入 core。
+    子进程任务失败（进程池损坏、无法序列化、超过 task_timeout 秒未返回等）时改为本地执行，并停用进程池。
+    """
+
+    def __init__(
+        self,
+        threshold: int = 2000,
+        workers: int = 2,
+        executor_factory=None,
+        task_timeout: float = 60.0,
+    ) -> None:
+        self.threshold = max(1, int(threshold))
+        self.workers = max(1, int(workers))
+        self.task_timeout = max(0.0, float(task_timeout))
+        self._executor_factory = executor_factory or self._new_executor
+        self._executor = None
+        self._disabled = False
+        self._lock = threading.Lock()
+        self.offloaded = 0
+        self.inline = 0
+        self.failures = 0
+
+    def run(self, size: int, function, *args):
+        executor = self._executor_for(size)
+        if executor is not None:
+            try:
+                result = executor.submit(function, *args).result()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                self.close(disable=True)
+            else:
+                with self._lock:
+                    self.offloaded += 1
+                return result
+        with self._lock:
+            self.inline += 1
+        return function(*args)
+
+    def close(self, disable: bool = False) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if disable:
+                self._disabled = True
+        if executor is not None:
+            executor.shutdown(wait=not disable, cancel_futures=True)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "offloaded": self.offloaded,
+                "inline": self.inline,
+                "failures": self.failures,
+                "threshold": self.threshold,
+                "workers": self.workers,
+            }
+
+    def _executor_for(self, size: int):
+        if size < self.threshold:
+            return None
+        with self._lock:
+            if self._disabled:
+                return None
+            if self._executor is None:
+                try:
+                    self._executor = self._executor_factory(self.workers)
+                except Exception:
+                    self.failures += 1
+                    self._disabled = True
+                    return None
+            return self._executor
+
+    def _new_executor(self, workers: int):
+        return _OffloadWorkerPool(workers, timeout=self.task_timeout)
+
+
+class TvhEpgStore:
+    """常驻内存的节目指南：按节目ID保存一份，按频道维护开始时间有序索引并增量刷新。"""
+
+    def __init__(
+        self,
+        hours: int = 24,
+        full_refresh_seconds: int = 1800,
+        now=None,
+        offload: "ProcessOffload | None" = None,
+    ) -> None:
+        self.hours = max(1, int(hours or 24))
+        self.full_refresh_seconds = max(0, int(full_refresh_seconds))
+        self.offload = offload
+        self._now = now or time.time
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._events: dict[str, TvhEpgEvent] = {}
+        self._channel_keys: dict[str, str] = {}
+        self._channels: dict[str, list[TvhEpgEvent]] = {}
+        self._channel_starts: dict[str, list[int]] = {}
+        self._channel_max_duration: dict[str, int] = {}
+        self._channel_names: dict[str, set[str]] = {}
+        self._dirty_channels: set[str] = set()
+        self._search_index = TvhEpgSearchIndex()
+        self._snapshot: TvhEpgEventList | None = None
+        self.high_water_mark: int | None = None
+        self.loaded_at: float | None = None
+        self.full_loaded_at: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def age(self, now: float | None = None) -> float | None:
+        if self.loaded_at is None:
+            return None
+        return max(0.0, float(now if now is not None else self._now()) - self.loaded_at)
+
+    def refresh(self, fetcher, now: int | None = None, force_full: bool = False) -> int:
+        """拉取节目并合并；首次和定期全量刷新，其余只取高水位之后的节目。"""
+        with self._refresh_lock:
+            now_value = int(now if now is not None else self._now())
+            full = (
+                force_full
+                or self.high_water_mark is None
+                or self.full_loaded_at is None
+                or now_value - self.full_loaded_at >= self.full_refresh_seconds
+            )
+            events = list(fetcher(None if full else self.high_water_mark))
+            with self._lock:
+                if full:
+                    fresh_keys = {_tvh_epg_event_key(event) for event in events}
+                    for key in [key for key in self._events if key not in fresh_keys]:
+                        self._remove(key)
+                changed = self.merge(events, now=now_value)
+                self.loaded_at = now_value
+                if full:
+                    self.full_loaded_at = now_value
+            return changed
+
+    def merge(self, events: Iterable[TvhEpgEvent], now: int | None = None) -> int:
+        """合并节目；检索文本和倒排表先在锁外准备好，锁内只更新频道索引并登记搜索槽位。"""
+        now_value = int(now if now is not None else self._now())
+        candidates: dict[str, TvhEpgEvent] = {}
+        for event in events:
+            if event.stop <= now_value:
+                continue
+            key = _tvh_epg_event_key(event)
+            if self._events.get(key) == event:
+                continue
+            candidates.pop(key, None)
+            candidates[key] = event
+        items = list(candidates.items())
+        prepared = self._search_index.prepare_many([event for _key, event in items], offload=self.offload)
+        changed = 0
+        with self._lock:
+            added: dict[str, TvhEpgEvent] = {}
+            for key, event in items:
+                if self._events.get(key) == event:
+                    continue
+                self._remove(key)
+                channel_key = _tvh_epg_channel_key(event)
+                self._events[key] = event
+                self._channel_keys[key] = channel_key
+                added[key] = event
+                self._snapshot = None
+                self._channels.setdefault(channel_key, []).append(event)
+                self._channel_names.setdefault(_normalize_match_text(event.channel_name or ""), set()).add(channel_key)
+                self._dirty_channels.add(channel_key)
+                if self.high_water_mark is None or event.start > self.high_water_mark:
+                    self.high_water_mark = event.start
+                changed += 1
+            self._search_index.add_many(items, prepared=prepared, live=added)
+            self.evict_ended(now_value)
+        return changed
+
+    def evict_ended(self, now: int | None = None) -> int:
+        now_value = int(now if now is not None else self._now())
+        with self._lock:
+            ended = [key for key, event in self._events.items() if event.stop <= now_value]
+            for key in ended:
+                self._remove(key)
+            if not self._events:
+                self.high_water_mark = None
+            return len(ended)
+
+    def events(self) -> list[TvhEpgEvent]:
+        """返回按开始时间排序的快照；内容不变时复用同一份列表，搜索走仓库的增量索引。"""
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = TvhEpgEventList(
+                    sorted(self._events.values(), key=lambda item: (item.start, item.stop, item.title)),
+                    search_index=self._search_index,
+                    version=self._search_index.version,
+                )
+            return self._snapshot
+
+    def window(
+        self,
+        channel_uuid: str | None = None,
+        channel_name: str | None = None,
+        now: int | None = None,
+        hours: int | None = None,
+    ) -> list[TvhEpgEvent]:
+        """返回频道当前正在播出及未来若干小时的节目。"""
+        now_value = int(now if now is not None else self._now())
+        cutoff = now_value + max(1, int(hours or self.hours)) * 3600
+        with self._lock:
+            self._reindex()
+            if channel_uuid and channel_name:
+                channel_keys = {channel_uuid, "#", f"#{_normalize_match_text(channel_name)}"}
+            elif channel_uuid:
+                channel_keys = {channel_uuid}
+                channel_keys.update(key for key in self._channels if key.startswith("#"))
+            elif channel_name:
+                channel_keys = set(self._channel_names.get(_normalize_match_text(channel_name), set()))
+                channel_keys.update(self._channel_names.get("", set()))
+            else:
+                channel_keys = set(self._channels)
+            matched = []
+            for channel_key in channel_keys:
+                events = self._channels.get(channel_key)
+                if not events:
+                    continue
+                starts = self._channel_starts[channel_key]
+                low = bisect.bisect_left(starts, now_value - self._channel_max_duration[channel_key])
+                high = bisect.bisect_left(starts, cutoff)
+                matched.extend(
+                    event
+                    for event in events[low:high]
+                    if event.stop > now_value and _tvh_epg_event_on_channel(event, channel_uuid, channel_name)
+                )
+        return sorted(matched, key=lambda item: (item.start, item.stop, item.title))
+
+    def _remove(self, key: str) -> None:
+        event = self._events.pop(key, None)
+        if event is None:
+            return
+        channel_key = self._channel_keys.pop(key)
+        self._search_index.discard(key)
+        self._snapshot = None
+        events = self._channels.get(channel_key) or []
+        try:
+            events.remove(event)
+        except ValueError:
+            pass
+        self._dirty_channels.add(channel_key)
+
+    def _reindex(self) -> None:
+        for channel_key in self._dirty_channels:
+            events = self._channels.get(channel_key)
+            if not events:
+                self._channels.pop(channel_key, None)
+                self._channel_starts.pop(channel_key, None)
+                self._channel_max_duration.pop(channel_key, None)
+                for keys in self._channel_names.values():
+                    keys.discard(channel_key)
+                continue
+            events.sort(key=lambda item: (item.start, item.stop, item.title))
+            self._channel_starts[channel_key] = [event.start for event in events]
+            self._channel_max_duration[channel_key] = max(max(0, event.stop - event.start) for event in events)
+        self._dirty_channels.clear()
+
+
+class TvhDvrStore:
+    """录制任务的共享快照：按 uuid 原地更新，记录刷新时间供状态、检查和菜单按新鲜度复用。
+
+    同时只有一个刷新在进行，其余调用方等待并复用同一次结果。
+    """
+
+    def __init__(self, now=None) -> None:
+        self._now = now or time.time
+        self._lock = threading.Lock()
+        self._entries: dict[str, TvhDvrEntry] = {}
+        self._order: list[str] = []
+        self._snapshot: list[TvhDvrEntry] | None = None
+        self._inflight: dict[str, Any] | None = None
+        self.refreshed_at: float | None = None
+
+    def age(self, now: float | None = None) -> float | None:
+        if self.refreshed_at is None:
+            return None
+        return max(0.0, float(now if now is not None else self._now()) - self.refreshed_at)
+
+    def is_fresh(self, max_age: float, now: float | None = None) -> bool:
+        age = self.age(now)
+        return age is not None and age <= max_age
+
+    def snapshot(self) -> list[TvhDvrEntry]:
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = [self._entries[uuid] for uuid in self._order]
+            return self._snapshot
+
+    def get(self, uuid: str) -> TvhDvrEntry | None:
+        with self._lock:
+            return self._entries.get(str(uuid))
+
+    def update(self, entries: Iterable[TvhDvrEntry], now: float | None = None) -> int:
+        """用一次完整拉取的结果原地更新，返回新增、变化和移除的条目数。"""
+        fresh = {str(entry.uuid): entry for entry in entries}
+        with self._lock:
+            changed = 0
+            for uuid in [uuid for uuid in self._entries if uuid not in fresh]:
+                del self._entries[uuid]
+                changed += 1
+            for uuid, entry in fresh.items():
+                if self._entries.get(uuid) != entry:
+                    self._entries[uuid] = entry
+                    changed += 1
+            order = list(fresh)
+            if changed or order != self._order:
+                self._order = order
+                self._snapshot = None
+            self.refreshed_at = float(now if now is not None else self._now())
+            return changed
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.refreshed_at = None
+
+    def load(self, fetcher, max_age: float | None = None) -> list[TvhDvrEntry]:
+        """快照未超过 max_age 秒时直接返回，否则刷新；刷新中的其他调用方共享结果。"""
+        with self._lock:
+            age = None if self.refreshed_at is None else max(0.0, self._now() - self.refreshed_at)
+            if max_age is not None and age is not None and age <= max_age:
+                if self._snapshot is None:
+                    self._snapshot = [self._entries[uuid] for uuid in self._order]
+                return self._snapshot
+            inflight = self._inflight
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight = {"done": threading.Event(), "error": None}
+        if not leader:
+            inflight["done"].wait()
+            if inflight["error"] is not None:
+                raise inflight["error"]
+            return self.snapshot()
+        try:
+            self.update(fetcher())
+            return self.snapshot()
+        except Exception as err:
+            inflight["error"] = err
+            raise
+        finally:
+            with self._lock:
+                self._inflight = None
+            inflight["done"].set()
+
+
+def _tvh_epg_event_key(event: TvhEpgEvent) -> str:
+    event_id = getattr(event, "event_id", None)
+    if event_id:
+        return str(event_id)
+    return "|".join([_tvh_epg_channel_key(event), str(event.start), str(event.title)])
+
+
+def _tvh_epg_channel_key(event: TvhEpgEvent) -> str:
+    channel_uuid = getattr(event, "channel_uuid", None)
+    if channel_uuid:
+        return str(channel_uuid)
+    return f"#{_normalize_match_text(getattr(event, 'channel_name', None) or '')}"
+
+
+def _tvh_epg_event_on_channel(event: TvhEpgEvent, channel_uuid: str | None, channel_name: str | None) -> bool:
+    return _tvh_epg_channel_matches(event.channel_uuid, event.channel_name, channel_uuid, channel_name)
+
+
+def _tvh_epg_channel_matches(
+    event_channel_uuid: str | None,
+    event_channel_name: str | None,
+    channel_uuid: str | None,
+    channel_name: str | None,
+) -> bool:
+    if channel_uuid and event_channel_uuid and event_channel_uuid != channel_uuid:
+        return False
+    if channel_name and event_channel_name and _normalize_match_text(event_channel_name) != _normalize_match_text(channel_name):
+        return False
+    if channel_uuid and not event_channel_uuid and channel_name and _normalize_match_text(event_channel_name) != _normalize_match_text(channel_name):
+        return False
+    return True
 
 
 def fetch_tvh_dvr_configs(base_url: str, username: str, password: str, timeout: int = 10) -> list[TvhDvrConfig]:
     payload = fetch_tvh_json(base_url, "/api/dvr/config/grid?limit=999", username, password, timeout=timeout)
-    return parse_tvh_dvr_configs(payload)
+    with hot_path_timing("parse.dvr_configs"):
+        return parse_tvh_dvr_configs(payload)
 
 
 def ensure_tvhhelper_dvr_config(
@@ -3429,33 +5556,41 @@ def fetch_tvh_dvr_entries(base_url: str, username: str, password: str, timeout:
         "sort": "stop",
         "dir": "DESC",
     })
-    entries: dict[str, TvhDvrEntry] = {}
-    for path in (
-        f"/api/dvr/entry/grid_upcoming?{upcoming_query}",
-        f"/api/dvr/entry/grid_finished?{finished_query}",
-        f"/api/dvr/entry/grid_failed?{finished_query}",
-    ):
-        payload = fetch_tvh_json(base_url, path, username, password, timeout=timeout)
-        for entry in parse_tvh_dvr_entries(payload):
-            entries[entry.uuid] = entry
     generic_query = urllib.parse.urlencode({
         "limit": 300,
         "sort": "stop",
         "dir": "DESC",
         "all": 1,
     })
-    try:
-        payload = fetch_tvh_json(
-            base_url,
-            f"/api/dvr/entry/grid?{generic_query}",
-            username,
-            password,
-            timeout=timeout,
-        )
-    except TvhError:
-        payload = {}
-    for entry in parse_tvh_dvr_entries(payload):
-        entries[entry.uuid] = entry
+
+    def fetch_generic():
+        try:
+            return fetch_tvh_grid(
+                base_url,
+                f"/api/dvr/entry/grid?{generic_query}",
+                username,
+                password,
+                _tvh_dvr_entry_from_entry,
+                timeout=timeout,
+            )
+        except TvhError:
+            return []
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(fetch_tvh_grid, base_url, path, username, password, _tvh_dvr_entry_from_entry, timeout=timeout)
+            for path in (
+                f"/api/dvr/entry/grid_upcoming?{upcoming_query}",
+                f"/api/dvr/entry/grid_finished?{finished_query}",
+                f"/api/dvr/entry/grid_failed?{finished_query}",
+            )
+        ]
+        futures.append(executor.submit(fetch_generic))
+        results = [future.result() for future in futures]
+    entries: dict[str, TvhDvrEntry] = {}
+    for result in results:
+        for entry in _sort_tvh_dvr_entries(result):
+            entries[entry.uuid] = entry
     return sorted(
         entries.values(),
         key=lambda item: (_dvr_sort_group(item), item.start_real or item.start, item.stop_real or item.stop, item.title),
@@ -4554,6 +6689,141 @@ def _format_file_size(value: int | None) -> str:
         size /= 1024
 
 
+class TvhNowNextSnapshot:
+    """当前节目快照：一次下载 mode=now 节目表，按频道 uuid 和规范化频道名建索引。
+
+    快照在 max_age 秒后或最早一个节目结束时失效，下次查询时重新下载；
+    频道表（台标、频道号）只在当前节目缺失时按需下载，channel_max_age 秒内复用。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        timeout: int = 2,
+        max_age: float = 300,
+        channel_max_age: float = 600,
+        min_interval: float = 5,
+        now=None,
+    ) -> None:
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.max_age = max_age
+        self.channel_max_age = channel_max_age
+        self.min_interval = min_interval
+        self._now = now or time.time
+        self._lock = threading.Lock()
+        self._programs_by_uuid: dict[str, dict] = {}
+        self._programs_by_name: dict[str, dict] = {}
+        self._expires_at: float | None = None
+        self._refreshed_at = 0.0
+        self._channels_by_uuid: dict[str, dict] = {}
+        self._channels_by_name: dict[str, dict] = {}
+        self._channels_expires_at: float | None = None
+        self.refreshes = 0
+        self.channel_refreshes = 0
+
+    def lookup(self, channel_name: str | None = None, channel_uuid: str | None = None) -> dict:
+        """返回与 fetch_tvh_channel_program 相同结构的频道节目信息，找不到时为空字典。"""
+        now = self._now()
+        with self._lock:
+            if self._expires_at is None or now >= self._expires_at:
+                self._refresh_programs(now)
+            metadata = self._find(self._programs_by_uuid, self._programs_by_name, channel_name, channel_uuid)
+            stop = _to_int_or_none(metadata.get("program_stop")) if metadata else None
+            if stop is not None and stop <= now and now >= self._refreshed_at + self.min_interval:
+                self._refresh_programs(now)
+                metadata = self._find(self._programs_by_uuid, self._programs_by_name, channel_name, channel_uuid)
+            if metadata:
+                return dict(metadata)
+            return dict(self._channel(channel_name, channel_uuid, now) or {})
+
+    def channel(self, channel_name: str | None = None, channel_uuid: str | None = None) -> dict | None:
+        """按 uuid 或频道名返回频道元数据（名称、uuid、台标、频道号）。"""
+        with self._lock:
+            metadata = self._channel(channel_name, channel_uuid, self._now())
+            return dict(metadata) if metadata else None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._expires_at = None
+            self._channels_expires_at = None
+
+    def _channel(self, channel_name, channel_uuid, now) -> dict | None:
+        if self._channels_expires_at is None or now >= self._channels_expires_at:
+            self._refresh_channels(now)
+        return self._find(self._channels_by_uuid, self._channels_by_name, channel_name, channel_uuid)
+
+    @staticmethod
+    def _find(by_uuid: dict, by_name: dict, channel_name: str | None, channel_uuid: str | None) -> dict | None:
+        if channel_uuid and channel_uuid in by_uuid:
+            return by_uuid[channel_uuid]
+        if channel_name:
+            return by_name.get(_normalize_match_text(channel_name))
+        return None
+
+    def _refresh_programs(self, now: float) -> None:
+        query = urllib.parse.urlencode({"mode": "now", "limit": 999})
+        payload = fetch_tvh_json(
+            self.base_url,
+            f"/api/epg/events/grid?{query}",
+            self.username,
+            self.password,
+            timeout=self.timeout,
+        )
+        by_uuid: dict[str, dict] = {}
+        by_name: dict[str, dict] = {}
+        expires_at = now + self.max_age
+        for entry in payload.get("entries", []) if isinstance(payload, dict) else []:
+            if not isinstance(entry, dict):
+                continue
+            metadata = _tvh_program_metadata_from_epg_entry(self.base_url, entry)
+            _index_channel_metadata(entry, metadata, by_uuid, by_name)
+            stop = _to_int_or_none(entry.get("stop"))
+            if stop is not None and stop > now:
+                expires_at = min(expires_at, stop)
+        self._programs_by_uuid = by_uuid
+        self._programs_by_name = by_name
+        self._refreshed_at = now
+        self._expires_at = max(expires_at, now + self.min_interval)
+        self.refreshes += 1
+
+    def _refresh_channels(self, now: float) -> None:
+        payload = fetch_tvh_json(
+            self.base_url,
+            "/api/channel/grid?limit=999",
+            self.username,
+            self.password,
+            timeout=self.timeout,
+        )
+        by_uuid: dict[str, dict] = {}
+        by_name: dict[str, dict] = {}
+        for entry in payload.get("entries", []) if isinstance(payload, dict) else []:
+            if not isinstance(entry, dict):
+                continue
+            metadata = _tvh_channel_metadata_from_channel_entry(self.base_url, entry)
+            number = entry.get("number")
+            if number not in (None, "", 0):
+                metadata["channel_number"] = number
+            _index_channel_metadata(entry, metadata, by_uuid, by_name)
+        self._channels_by_uuid = by_uuid
+        self._channels_by_name = by_name
+        self._channels_expires_at = now + self.channel_max_age
+        self.channel_refreshes += 1
+
+
+def _index_channel_metadata(entry: dict, metadata: dict, by_uuid: dict, by_name: dict) -> None:
+    entry_uuid = _string_or_none(entry.get("channelUuid") or entry.get("uuid"))
+    entry_name = _string_or_none(entry.get("channelName") or entry.get("name"))
+    if entry_uuid:
+        by_uuid.setdefault(entry_uuid, metadata)
+    if entry_name:
+        by_name.setdefault(_normalize_match_text(entry_name), metadata)
+
+
 def enrich_tvh_webhook_program(
     payload: dict,
     base_url: str,
@@ -4563,6 +6833,7 @@ def enrich_tvh_webhook_program(
     timeout: int = 2,
     enrich_program: bool = True,
     enrich_logo: bool = True,
+    snapshot: TvhNowNextSnapshot | None = None,
 ) -> dict:
     event = str(payload.get("event") or "")
     if not event.startswith("playback."):
@@ -4580,7 +6851,9 @@ def enrich_tvh_webhook_program(
 
     cache_key = "|".join([channel_uuid or "", channel or ""])
     metadata = cache.get(cache_key) if cache else None
-    if metadata is None:
+    if metadata is None and snapshot is not None:
+        metadata = snapshot.lookup(channel_name=channel, channel_uuid=channel_uuid)
+    elif metadata is None:
         metadata = fetch_tvh_channel_program(
             base_url,
             username,
@@ -4771,24 +7044,886 @@ def post_tvh_body(
 def _open_tvh_json(request: urllib.request.Request, url: str, username: str, password: str, timeout: int) -> dict:
     payload = _open_tvh_text(request, url, username, password, timeout)
     try:
-        return json.loads(payload) if payload else {}
+        with hot_path_timing("json.decode"):
+            return json.loads(payload) if payload else {}
     except json.JSONDecodeError as err:
         raise TvhError(str(err)) from err
 
 
 def _open_tvh_text(request: urllib.request.Request, url: str, username: str, password: str, timeout: int) -> str:
-    password_manager = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-    password_manager.add_password(None, url, username, password)
-    auth_handler = urllib.request.HTTPBasicAuthHandler(password_manager)
-    digest_handler = urllib.request.HTTPDigestAuthHandler(password_manager)
-    opener = urllib.request.build_opener(auth_handler, digest_handler)
+    client = get_tvh_http_client(url, username, password)
+    return client.request(
+        request.get_method(),
+        url,
+        body=request.data,
+        headers=dict(request.header_items()),
+        timeout=timeout,
+    )
+
+
+def _open_tvh_stream(request: urllib.request.Request, url: str, username: str, password: str, timeout: int, reader):
+    client = get_tvh_http_client(url, username, password)
+    return client.request(
+        request.get_method(),
+        url,
+        body=request.data,
+        headers=dict(request.header_items()),
+        timeout=timeout,
+        reader=reader,
+    )
+
+
+def _import_ijson():
     try:
-        with opener.open(request, timeout=timeout) as response:
-            return response.read().decode("utf-8", "replace")
-    except (urllib.error.URLError, urllib.error.HTTPError) as err:
+        import ijson  # type: ignore
+        return ijson
+    except Exception:
+        return None
+
+
+class _ChainedReader:
+    """先返回已读出的开头字节，再继续读底层流。"""
+
+    def __init__(self, head: bytes, stream) -> None:
+        self._head = head
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if self._head:
+            if size is None or size < 0:
+                data, self._head = self._head + self._stream.read(), b""
+                return data
+            data, self._head = self._head[:size], self._head[size:]
+            return data
+        return self._stream.read(size)
+
+
+_JSON_WHITESPACE = " \t\n\r"
+
+
+class _JsonStreamScanner:
+    """纯 Python 的增量 JSON 读取：按块解码，用 raw_decode 逐个取值，已消费的文本及时丢弃。"""
+
+    def __init__(self, stream, chunk_size: int) -> None:
+        self._stream = stream
+        self._chunk_size = max(1, int(chunk_size))
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def peek(self) -> str:
+        """跳过空白并返回下一个字符，数据读完时返回空串。"""
+        while True:
+            buffer = self.buffer
+            while self.pos < len(buffer) and buffer[self.pos] in _JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(buffer):
+                return buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"JSON格式错误: 位置 {self.pos} 需要 {chars!r}，实际为 {char or '结尾'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # 数字等标量在块边界处可能被截断，读到结尾时再补一块确认
+            if end >= len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _fill(self) -> bool:
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        while not self.eof:
+            chunk = self._stream.read(self._chunk_size)
+            text = self._text_decoder.decode(chunk or b"", final=not chunk)
+            if not chunk:
+                self.eof = True
+            if text:
+                self.buffer += text
+                return True
+        return False
+
+
+def _iter_json_array_items_fallback(stream, key: str, chunk_size: int):
+    scanner = _JsonStreamScanner(stream, chunk_size)
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        return
+    while True:
+        name = scanner.value()
+        if not isinstance(name, str):
+            raise ValueError("JSON格式错误: 对象键不是字符串")
+        scanner.expect(":")
+        if name == key and scanner.peek() == "[":
+            scanner.pos += 1
+            if scanner.peek() == "]":
+                scanner.pos += 1
+            else:
+                while True:
+                    yield scanner.value()
+                    if scanner.expect(",]") == "]":
+                        break
+        else:
+            scanner.value()
+        if scanner.expect(",}") == "}":
+            return
+
+
+def iter_json_array_items(stream, key: str = "entries", chunk_size: int = 65536, use_ijson: bool | None = None):
+    """从二进制流中逐个取出顶层对象 key 数组里的元素，不把整份响应读进内存。
+
+    装有 ijson 时使用它，否则用纯 Python 的增量解析；空响应视为没有元素，格式错误抛出 TvhError。
+    """
+    head = stream.read(chunk_size)
+    if not head or not head.strip():
+        return
+    stream = _ChainedReader(head, stream)
+    ijson = _import_ijson() if use_ijson is not False else None
+    if ijson is not None:
+        json_error = getattr(ijson, "JSONError", ValueError)
+        try:
+            yield from ijson.items(stream, f"{key}.item", use_float=True)
+        except (json_error, ValueError) as err:
+            raise TvhError(f"JSON格式错误: {err}") from err
+        return
+    try:
+        yield from _iter_json_array_items_fallback(stream, key, chunk_size)
+    except ValueError as err:
         raise TvhError(str(err)) from err
 
 
+class TvhHttpClient:
+    """按TVH地址和账号复用长连接，并缓存摘要认证参数。
+
+    与 urllib 一样遵循 HTTP(S)_PROXY / NO_PROXY：http 经代理发送完整 URL，https 经代理 CONNECT 隧道。
+    复用的空闲连接已被服务端关闭时自动换新连接重试一次；POST 等非幂等请求只在请求尚未发出时重试，
+    避免重复提交录制操作。
+    """
+
+    _redirect_statuses = {301, 302, 303, 307, 308}
+    _idempotent_methods = frozenset({"GET", "HEAD"})
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        max_idle_connections: int = 4,
+        connection_factory=None,
+        proxies: dict[str, str] | None = None,
+    ) -> None:
+        parsed = urllib.parse.urlsplit(normalize_base_url(base_url))
+        self.scheme = parsed.scheme or "https"
+        self.host = parsed.hostname or ""
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip("/")
+        self.proxy = self._resolve_proxy(urllib.request.getproxies() if proxies is None else proxies)
+        self.username = username or ""
+        self.password = password or ""
+        self.max_idle_connections = max(0, int(max_idle_connections))
+        self._connection_factory = connection_factory or self._new_connection
+        self._idle: list = []
+        self._lock = threading.Lock()
+        self._auth_scheme: str | None = None
+        self._digest: dict[str, str] = {}
+        self._digest_nc = 0
+        self._closed = False
+        self.connections_opened = 0
+        self.requests_served = 0
+        self.auth_challenges = 0
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+        timeout: int = 10,
+        reader=None,
+    ) -> Any:
+        """发送请求并返回解码后的响应文本；传入 reader 时改为把成功响应的流交给 reader，返回其结果。"""
+        path = self._request_path(url)
+        with hot_path_timing(f"http {method} {path.split('?', 1)[0]}"):
+            return self._request(method, path, body, headers, timeout, reader)
+
+    def _request(self, method, path, body, headers, timeout, reader):
+        for _ in range(4):
+            status, reason, response_headers, payload = self._send_with_auth(method, path, body, headers, timeout, reader)
+            if status in self._redirect_statuses:
+                location = response_headers.get("Location")
+                redirect_path = self._request_path(location) if location else None
+                if not redirect_path:
+                    raise TvhHttpError(status, reason)
+                if status == 303 or (status in {301, 302} and method == "POST"):
+                    method, body = "GET", None
+                path = redirect_path
+                continue
+            if status >= 400:
+                raise TvhHttpError(status, reason)
+            with self._lock:
+                self.requests_served += 1
+            if reader is not None:
+                return payload
+            return payload.decode("utf-8", "replace")
+        raise TvhError("HTTP Error: 重定向次数过多")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "connections_opened": self.connections_opened,
+                "requests_served": self.requests_served,
+                "auth_challenges": self.auth_challenges,
+                "idle_connections": len(self._idle),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _send_with_auth(self, method, path, body, headers, timeout, reader=None):
+        target = self._request_target(path)
+        result = self._send(method, target, body, headers, timeout, self._authorization(method, target), reader)
+        if result[0] != 401 or not (self.username or self.password):
+            return result
+        if not self._update_challenge(result[2].get_all("WWW-Authenticate") or []):
+            return result
+        return self._send(method, target, body, headers, timeout, self._authorization(method, target), reader)
+
+    def _send(self, method, path, body, headers, timeout, authorization, reader=None):
+        request_headers = dict(headers or {})
+        if authorization:
+            request_headers["Authorization"] = authorization
+        if self.proxy is not None and self.scheme == "http":
+            request_headers.update(self._proxy_headers())
+        for attempt in range(2):
+            connection, reused = self._acquire(timeout)
+            sent = False
+            try:
+                connection.request(method, path, body=body, headers=request_headers)
+                sent = True
+                response = connection.getresponse()
+                if reader is not None and 200 <= response.status < 300:
+                    payload = reader(response)
+                    response.read()
+                else:
+                    payload = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as err:
+                connection.close()
+                # 请求已完整发出后断开时，服务端可能已经执行；只有幂等请求才能安全重发
+                if reused and attempt == 0 and (not sent or method in self._idempotent_methods):
+                    continue
+                raise TvhError(str(err)) from err
+            except (OSError, http.client.HTTPException) as err:
+                connection.close()
+                raise TvhError(str(err)) from err
+            except Exception:
+                connection.close()
+                raise
+            self._release(connection, response.will_close)
+            return response.status, response.reason, response.headers, payload
+        raise TvhError("TVH连接已断开")
+
+    def _acquire(self, timeout):
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    self.connections_opened += 1
+            if connection is None:
+                return self._connection_factory(timeout), False
+            if self._is_stale(connection):
+                connection.close()
+                continue
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return connection, True
+
+    @staticmethod
+    def _is_stale(connection) -> bool:
+        """空闲的长连接上出现可读数据或 EOF，说明服务端已关闭，不能再用。"""
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _release(self, connection, will_close: bool) -> None:
+        if not will_close:
+            with self._lock:
+                if not self._closed and len(self._idle) < self.max_idle_connections:
+                    self._idle.append(connection)
+                    return
+        connection.close()
+
+    def _new_connection(self, timeout):
+        if self.proxy is not None:
+            if self.scheme == "https":
+                connection = http.client.HTTPSConnection(self.proxy.hostname, self.proxy.port, timeout=timeout)
+                connection.set_tunnel(self.host, self.port, headers=self._proxy_headers())
+                return connection
+            return http.client.HTTPConnection(self.proxy.hostname, self.proxy.port, timeout=timeout)
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _resolve_proxy(self, proxies: dict[str, str]):
+        proxy_url = proxies.get(self.scheme)
+        if not proxy_url or not self.host or urllib.request.proxy_bypass_environment(self.host, proxies):
+            return None
+        proxy = urllib.parse.urlsplit(proxy_url if "://" in proxy_url else f"http://{proxy_url}")
+        return proxy if proxy.hostname else None
+
+    def _proxy_headers(self) -> dict[str, str]:
+        if self.proxy is None or self.proxy.username is None:
+            return {}
+        credentials = ":".join(
+            urllib.parse.unquote(value or "") for value in (self.proxy.username, self.proxy.password)
+        ).encode("utf-8")
+        return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials).decode("ascii")}
+
+    def _request_target(self, path: str) -> str:
+        """经 http 代理时请求行要用完整 URL，其余情况用路径。"""
+        if self.proxy is None or self.scheme != "http":
+            return path
+        host = f"[{self.host}]" if ":" in self.host else self.host
+        port = f":{self.port}" if self.port else ""
+        return f"{self.scheme}://{host}{port}{path}"
+
+    def _request_path(self, url: str | None) -> str | None:
+        parsed = urllib.parse.urlsplit(url or "")
+        if parsed.scheme and (parsed.scheme != self.scheme or parsed.hostname != self.host or parsed.port != self.port):
+            return None
+        path = parsed.path or "/"
+        if not parsed.scheme and not path.startswith("/"):
+            path = f"{self.base_path}/{path}"
+        return f"{path}?{parsed.query}" if parsed.query else path
+
+    def _update_challenge(self, challenges: list[str]) -> bool:
+        digest = next((item for item in challenges if item.strip().lower().startswith("digest ")), None)
+        with self._lock:
+            self.auth_challenges += 1
+            if digest:
+                self._auth_scheme = "digest"
+                self._digest = _parse_http_auth_params(digest.strip()[7:])
+                self._digest_nc = 0
+                return True
+            if any(item.strip().lower().startswith("basic") for item in challenges) and self._auth_scheme != "basic":
+                self._auth_scheme = "basic"
+                return True
+        return False
+
+    def _authorization(self, method: str, path: str) -> str | None:
+        with self._lock:
+            if self._auth_scheme == "basic":
+                credentials = f"{self.username}:{self.password}".encode("utf-8")
+                return "Basic " + base64.b64encode(credentials).decode("ascii")
+            if self._auth_scheme != "digest" or not self._digest.get("nonce"):
+                return None
+            self._digest_nc += 1
+            nc = f"{self._digest_nc:08x}"
+            digest = dict(self._digest)
+        algorithm = digest.get("algorithm") or "MD5"
+        hasher = _digest_hash_function(algorithm)
+        realm = digest.get("realm", "")
+        nonce = digest["nonce"]
+        cnonce = secrets.token_hex(8)
+        ha1 = hasher(f"{self.username}:{realm}:{self.password}")
+        if algorithm.upper().endswith("-SESS"):
+            ha1 = hasher(f"{ha1}:{nonce}:{cnonce}")
+        ha2 = hasher(f"{method}:{path}")
+        qop_options = [item.strip() for item in digest.get("qop", "").split(",") if item.strip()]
+        parts = [
+            f'username="{self.username}"',
+            f'realm="{realm}"',
+            f'nonce="{nonce}"',
+            f'uri="{path}"',
+            f"algorithm={algorithm}",
+        ]
+        if "auth" in qop_options:
+            response = hasher(f"{ha1}:{nonce}:{nc}:{cnonce}:auth:{ha2}")
+            parts.extend(["qop=auth", f"nc={nc}", f'cnonce="{cnonce}"'])
+        else:
+            response = hasher(f"{ha1}:{nonce}:{ha2}")
+        parts.append(f'response="{response}"')
+        if digest.get("opaque"):
+            parts.append(f'opaque="{digest["opaque"]}"')
+        return "Digest " + ", ".join(parts)
+
+
+_TVH_HTTP_CLIENTS: dict[tuple[str, str], TvhHttpClient] = {}
+_TVH_HTTP_CLIENTS_LOCK = threading.Lock()
+
+
+def get_tvh_http_client(base_url: str, username: str, password: str) -> TvhHttpClient:
+    parsed = urllib.parse.urlsplit(normalize_base_url(base_url))
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+    key = (origin, username or "")
+    with _TVH_HTTP_CLIENTS_LOCK:
+        client = _TVH_HTTP_CLIENTS.get(key)
+        if client is not None and client.password == (password or ""):
+            return client
+        _TVH_HTTP_CLIENTS[key] = TvhHttpClient(origin, username, password)
+    if client is not None:
+        client.close()
+    return _TVH_HTTP_CLIENTS[key]
+
+
+def tvh_http_client_stats(base_url: str, username: str) -> dict[str, int] | None:
+    parsed = urllib.parse.urlsplit(normalize_base_url(base_url))
+    with _TVH_HTTP_CLIENTS_LOCK:
+        client = _TVH_HTTP_CLIENTS.get((f"{parsed.scheme}://{parsed.netloc}", username or ""))
+    return client.stats() if client else None
+
+
+def close_tvh_http_clients() -> None:
+    with _TVH_HTTP_CLIENTS_LOCK:
+        clients = list(_TVH_HTTP_CLIENTS.values())
+        _TVH_HTTP_CLIENTS.clear()
+    for client in clients:
+        client.close()
+
+
+TVH_COMET_PLAYBACK_CLASSES = frozenset({"subscriptions", "connections"})
+
+
+def make_tvh_comet_poller(base_url: str, username: str, password: str, timeout: int = 30):
+    """返回 comet 长轮询函数：传入 boxid（首次为 None），返回 TVH 的 {"boxid", "messages"}。
+
+    长轮询使用独立连接，不占用共享 TvhHttpClient 的连接；poll.close 关闭该连接。
+    """
+    url = f"{normalize_base_url(base_url)}/comet/poll"
+    client = TvhHttpClient(base_url, username, password, max_idle_connections=1)
+
+    def poll(boxid: str | None) -> dict:
+        data = {"boxid": boxid, "immediate": "0"} if boxid else {"immediate": "1"}
+        payload = client.request(
+            "POST",
+            url,
+            body=urllib.parse.urlencode(data).encode("utf-8"),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=timeout,
+        )
+        try:
+            return json.loads(payload) if payload else {}
+        except json.JSONDecodeError as err:
+            raise TvhError(str(err)) from err
+
+    poll.close = client.close
+    return poll
+
+
+class TvhCometWatcher:
+    """订阅 TVH comet 通知流，关注类别里出现新增、移除或 reload 通知时回调。
+
+    已知条目的 updateEntry（播放中每隔几秒一次）不触发回调。每批通知最多回调一次，两次回调至少间隔
+    min_interval 秒，期间到达的通知合并到下一次；(重新)连上后先回调一次补齐断线期间的变化。
+    轮询失败时按指数退避重连，期间 healthy 为 False，调用方据此退回定时轮询。
+    stop 之后才返回的长轮询结果直接丢弃，不再回调。
+    """
+
+    def __init__(
+        self,
+        poll,
+        on_change,
+        classes: Iterable[str] = TVH_COMET_PLAYBACK_CLASSES,
+        min_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        min_interval: float = 2.0,
+        clock=None,
+    ) -> None:
+        self._poll = poll
+        self._on_change = on_change
+        self.classes = frozenset(classes)
+        self.min_backoff = max(0.0, float(min_backoff))
+        self.max_backoff = max(self.min_backoff, float(max_backoff))
+        self.min_interval = max(0.0, float(min_interval))
+        self._clock = clock or time.monotonic
+        self._last_change: float | None = None
+        self._entries: dict[str, set[str]] = {}
+        self.boxid: str | None = None
+        self.healthy = False
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats = {"polls": 0, "notices": 0, "changes": 0, "reconnects": 0, "errors": 0}
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="tvhhelper-comet", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop.set()
+        self.healthy = False
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout)
+            if not thread.is_alive():
+                self._thread = None
+        close = getattr(self._poll, "close", None)
+        if close:
+            close()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive() and not self._stop.is_set())
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            self.poll_once()
+            if self.failures and not self._stop.is_set():
+                self._stop.wait(self.backoff())
+
+    def backoff(self) -> float:
+        if not self.failures:
+            return 0.0
+        return min(self.max_backoff, self.min_backoff * (2 ** (self.failures - 1)))
+
+    def poll_once(self) -> bool:
+        """执行一次长轮询，返回是否触发了回调。"""
+        try:
+            payload = self._poll(self.boxid)
+            if not isinstance(payload, dict):
+                raise TvhError("comet 返回格式无效")
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            self.failures += 1
+            self.healthy = False
+            self.boxid = None
+            return False
+        if self._stop.is_set():
+            return False
+        reconnected = not self.healthy
+        self.failures = 0
+        self.healthy = True
+        self.boxid = _string_or_none(payload.get("boxid")) or self.boxid
+        if reconnected:
+            self._entries.clear()
+        messages = [item for item in payload.get("messages") or [] if isinstance(item, dict)]
+        relevant = [item for item in messages if self._is_change_notice(item)]
+        with self._lock:
+            self._stats["polls"] += 1
+            self._stats["notices"] += len(relevant)
+            if reconnected:
+                self._stats["reconnects"] += 1
+        if not reconnected and not relevant:
+            return False
+        if self._last_change is not None:
+            remaining = self._last_change + self.min_interval - self._clock()
+            if remaining > 0 and self._stop.wait(remaining):
+                return False
+        if self._stop.is_set():
+            return False
+        with self._lock:
+            self._stats["changes"] += 1
+        try:
+            self._on_change()
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+        self._last_change = self._clock()
+        return True
+
+    def _is_change_notice(self, message: dict) -> bool:
+        notification_class = message.get("notificationClass")
+        if notification_class not in self.classes:
+            return False
+        if message.get("reload"):
+            return True
+        known = self._entries.setdefault(notification_class, set())
+        entry_id = str(message.get("id"))
+        if message.get("removeEntry"):
+            known.discard(entry_id)
+            return True
+        if message.get("updateEntry") and entry_id not in known:
+            known.add(entry_id)
+            return True
+        return False
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({"healthy": self.healthy, "failures": self.failures, "backoff": self.backoff()})
+        return stats
+
+
+def percentiles(samples: Iterable[float], points: Iterable[int] = (50, 95, 99)) -> dict[str, float | None]:
+    """按最近邻取样本分位数，返回 {"p50": ..., "p95": ...}；无样本时为 None。"""
+    ordered = sorted(samples)
+    result: dict[str, float | None] = {}
+    for point in points:
+        if not ordered:
+            result[f"p{point}"] = None
+            continue
+        index = min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))
+        result[f"p{point}"] = ordered[index]
+    return result
+
+
+class _HotPathStage:
+    __slots__ = ("_timings", "_name", "_started")
+
+    def __init__(self, timings: "HotPathTimings", name: str) -> None:
+        self._timings = timings
+        self._name = name
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = self._timings.clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._timings.record(self._name, self._timings.clock() - self._started, error=exc_type is not None)
+        return False
+
+
+_NULL_HOT_PATH_STAGE = nullcontext()
+
+
+class HotPathTimings:
+    """按阶段记录热路径耗时：每个阶段保留最近 samples 个样本算分位，阶段数达到 max_stages 后新阶段计入 dropped。
+
+    阶段可以嵌套（如 grid.stream 记在 http 阶段之内），各阶段耗时不能相加。
+    未启用时 stage 返回共享的空上下文，不读时钟也不加锁。
+    """
+
+    def __init__(self, samples: int = 256, max_stages: int = 64, clock=None) -> None:
+        self.enabled = False
+        self.samples = max(1, int(samples))
+        self.max_stages = max(1, int(max_stages))
+        self.clock = clock or time.perf_counter
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._stages: dict[str, dict[str, Any]] = {}
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_HOT_PATH_STAGE
+        return _HotPathStage(self, name)
+
+    def record(self, name: str, seconds: float, error: bool = False) -> None:
+        if not self.enabled:
+            return
+        seconds = max(0.0, float(seconds))
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                if len(self._stages) >= self.max_stages:
+                    self.dropped += 1
+                    return
+                stage = self._stages[name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "samples": deque(maxlen=self.samples),
+                }
+            stage["count"] += 1
+            stage["total"] += seconds
+            stage["max"] = max(stage["max"], seconds)
+            stage["samples"].append(seconds)
+            if error:
+                stage["errors"] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            copied = {name: (dict(stage), list(stage["samples"])) for name, stage in self._stages.items()}
+            dropped = self.dropped
+        stages = {}
+        for name in sorted(copied):
+            stage, samples = copied[name]
+            stages[name] = {
+                "count": stage["count"],
+                "errors": stage["errors"],
+                "total": stage["total"],
+                "max": stage["max"],
+                **percentiles(samples),
+            }
+        return {"enabled": self.enabled, "dropped": dropped, "stages": stages}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self.dropped = 0
+
+
+_HOT_PATH_TIMINGS = HotPathTimings()
+
+
+def hot_path_timing(name: str):
+    """返回记录 name 阶段耗时的上下文；未启用计时时为空上下文。"""
+    return _HOT_PATH_TIMINGS.stage(name)
+
+
+def configure_hot_path_timings(enabled: bool) -> None:
+    """开关热路径计时，并清空之前配置下记录的样本。"""
+    _HOT_PATH_TIMINGS.enabled = bool(enabled)
+    _HOT_PATH_TIMINGS.reset()
+
+
+def hot_path_timing_stats() -> dict[str, Any]:
+    return _HOT_PATH_TIMINGS.snapshot()
+
+
+def reset_hot_path_timings() -> None:
+    _HOT_PATH_TIMINGS.reset()
+
+
+class OrderedWorkQueue:
+    """有界后台任务队列：同一 key 的任务按提交顺序逐个处理，不同 key 由工作线程并行处理。
+
+    队列满时 submit 返回 False 并计入丢弃数；stats 给出深度、丢弃数和排队到完成的耗时分位。
+    """
+
+    def __init__(
+        self,
+        handler,
+        workers: int = 2,
+        max_size: int = 256,
+        latency_samples: int = 512,
+        name: str = "tvhhelper-worker",
+        now=None,
+    ) -> None:
+        self._handler = handler
+        self.workers = max(1, int(workers))
+        self.max_size = max(1, int(max_size))
+        self.name = name
+        self._now = now or time.monotonic
+        self._cond = threading.Condition()
+        self._pending: dict[Any, deque] = {}
+        self._ready: deque = deque()
+        self._busy: set = set()
+        self._threads: list[threading.Thread] = []
+        self._size = 0
+        self._closed = False
+        self._latencies: deque = deque(maxlen=max(1, int(latency_samples)))
+        self._stats = {"submitted": 0, "processed": 0, "dropped": 0, "errors": 0}
+
+    def submit(self, key: Any, item: Any) -> bool:
+        with self._cond:
+            if self._closed or self._size >= self.max_size:
+                self._stats["dropped"] += 1
+                return False
+            queue = self._pending.get(key)
+            if queue is None:
+                queue = self._pending[key] = deque()
+                if key not in self._busy:
+                    self._ready.append(key)
+            queue.append((self._now(), item))
+            self._size += 1
+            self._stats["submitted"] += 1
+            if len(self._threads) < self.workers and len(self._threads) < self._size + len(self._busy):
+                thread = threading.Thread(target=self._work, name=f"{self.name}-{len(self._threads) + 1}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+            return True
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                key = self._ready.popleft()
+                queue = self._pending[key]
+                queued_at, item = queue.popleft()
+                if not queue:
+                    del self._pending[key]
+                self._size -= 1
+                self._busy.add(key)
+            try:
+                self._handler(item)
+                failed = False
+            except Exception:
+                failed = True
+            with self._cond:
+                self._busy.discard(key)
+                if key in self._pending:
+                    self._ready.append(key)
+                self._stats["processed"] += 1
+                if failed:
+                    self._stats["errors"] += 1
+                self._latencies.append(self._now() - queued_at)
+                self._cond.notify_all()
+
+    def join(self, timeout: float | None = None) -> bool:
+        """等待已提交的任务全部处理完，超时返回 False。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._size or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self) -> None:
+        """停止接收任务并让工作线程退出，尚未开始的任务被丢弃。"""
+        with self._cond:
+            self._closed = True
+            self._stats["dropped"] += self._size
+            self._pending.clear()
+            self._ready.clear()
+            self._size = 0
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "depth": self._size,
+                "in_flight": len(self._busy),
+                "max_size": self.max_size,
+                "workers": self.workers,
+            })
+            latencies = list(self._latencies)
+        stats.update(percentiles(latencies))
+        return stats
+
+
+def _parse_http_auth_params(value: str) -> dict[str, str]:
+    return {
+        key.lower(): quoted if quoted else plain
+        for key, quoted, plain in re.findall(r'([\w-]+)\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^\s,]+))', value)
+    }
+
+
+def _digest_hash_function(algorithm: str):
+    name = str(algorithm or "MD5").upper().removesuffix("-SESS")
+    hash_name = {"MD5": "md5", "SHA-256": "sha256", "SHA-512-256": "sha512_256"}.get(name, "md5")
+    return lambda text: hashlib.new(hash_name, text.encode("utf-8")).hexdigest()
+
+
 def build_idnode_save_body(nodes: list[dict]) -> bytes:
     node_json = json.dumps(nodes, ensure_ascii=False, separators=(",", ":"))
     return urllib.parse.urlencode({"node": node_json}).encode("utf-8")
@@ -4893,7 +8028,8 @@ def fetch_tvh_inputs(base_url: str, username: str, password: str) -> list[str]:
         payload = fetch_tvh_json(base_url, "/api/status/inputs", username, password)
     except TvhError:
         return []
-    return parse_tvh_inputs(payload)
+    with hot_path_timing("parse.inputs"):
+        return parse_tvh_inputs(payload)
 
 
 def fetch_tvh_status_bundle(
@@ -4917,12 +8053,31 @@ def fetch_tvh_status_bundle(
     return status, inputs, subscriptions
 
 
+def run_warmup_stages(stages: dict[str, Any], max_workers: int = 3, clock=None) -> dict[str, dict[str, Any]]:
+    """并行执行预热阶段，返回每个阶段的耗时（秒）和错误信息；单个阶段失败不影响其他阶段。"""
+    clock = clock or time.perf_counter
+
+    def run(stage):
+        started = clock()
+        try:
+            stage()
+            error = None
+        except Exception as err:
+            error = str(err) or err.__class__.__name__
+        return {"seconds": max(0.0, clock() - started), "error": error}
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        futures = {name: executor.submit(run, stage) for name, stage in stages.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
 def fetch_tvh_subscriptions(base_url: str, username: str, password: str) -> list[TvhSubscription]:
     try:
         payload = fetch_tvh_json(base_url, "/api/status/subscriptions", username, password)
     except TvhError:
         return []
-    return parse_tvh_subscriptions(payload)
+    with hot_path_timing("parse.subscriptions"):
+        return parse_tvh_subscriptions(payload)
 
 
 def fetch_tvh_connections(base_url: str, username: str, password: str) -> list[TvhSubscription]:
@@ -4930,7 +8085,8 @@ def fetch_tvh_connections(base_url: str, username: str, password: str) -> list[T
         payload = fetch_tvh_json(base_url, "/api/status/connections", username, password)
     except TvhError:
         return []
-    return parse_tvh_connections(payload)
+    with hot_path_timing("parse.connections"):
+        return parse_tvh_connections(payload)
 
 
 def cancel_tvh_subscription(base_url: str, username: str, password: str, subscription_id: str) -> bool:
@@ -4945,14 +8101,21 @@ def fetch_tvh_users(
     password: str,
     passwd_path: str | None = None,
 ) -> list[TvhUser]:
-    payload = fetch_tvh_json(base_url, "/api/access/entry/grid", username, password)
-    tokens: dict[str, str] = {}
-    passwd_users: list[TvhUser] = []
-    try:
-        passwd_payload = fetch_tvh_json(base_url, "/api/passwd/entry/grid", username, password)
-        tokens.update(tokens_from_passwd_payload(passwd_payload))
-        passwd_users = parse_tvh_passwd_users(passwd_payload)
-    except TvhError:
-        pass
-    tokens.update({k: v for k, v in load_passwd_tokens(passwd_path).items() if k not in tokens})
-    return merge_tokens(parse_tvh_users(payload), tokens, passwd_users)
+    def fetch_passwd():
+        try:
+            return fetch_tvh_json(base_url, "/api/passwd/entry/grid", username, password)
+        except TvhError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        passwd_future = executor.submit(fetch_passwd)
+        payload = fetch_tvh_json(base_url, "/api/access/entry/grid", username, password)
+        passwd_payload = passwd_future.result()
+    with hot_path_timing("parse.users"):
+        tokens: dict[str, str] = {}
+        passwd_users: list[TvhUser] = []
+        if passwd_payload is not None:
+            tokens.update(tokens_from_passwd_payload(passwd_payload))
+            passwd_users = parse_tvh_passwd_users(passwd_payload)
+        tokens.update({k: v for k, v in load_passwd_tokens(passwd_path).items() if k not in tokens})
+        return merge_tokens(parse_tvh_users(payload), tokens, passwd_users)
@@ -0,0 +1,30 @@
+"""ProcessOffload 子进程入口。
+
+以脚本方式启动，只导入同目录下仅依赖标准库的 core，不加载插件包和宿主程序。
+从 stdin 逐个读取 pickle 的 (任务名, 参数)，执行后把 (是否成功, 结果或错误) 写回 stdout，stdin 关闭时退出。
+"""
+import pickle
+import sys
+
+import core
+
+
+def main() -> None:
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        try:
+            name, args = pickle.load(stdin)
+        except EOFError:
+            return
+        try:
+            if name not in core.PROCESS_OFFLOAD_TASKS:
+                raise core.TvhError(f"不支持的子进程任务: {name}")
+            reply = (True, getattr(core, name)(*args))
+        except Exception as err:
+            reply = (False, f"{err.__class__.__name__}: {err}")
+        pickle.dump(reply, stdout, protocol=pickle.HIGHEST_PROTOCOL)
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+"""tvhhelper 热点路径基准测试。
+
+用法: python tests/benchmark_tvhhelper.py [名称 ...]
+不带参数时运行全部基准。
+"""
+
+import argparse
+import dataclasses
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+
+PLUGIN_DIR = Path(__file__).resolve().parents[1] / "plugins.v2" / "tvhhelper"
+sys.path.insert(0, str(PLUGIN_DIR))
+
+import core  # noqa: E402
+
+
+TITLE_WORDS = ["新闻", "联播", "體育", "天气", "电影", "纪录片", "少儿", "綜藝", "财经", "法治", "Football", "Drama"]
+DESCRIPTION_WORDS = ["直播", "回顾", "精彩", "赛事", "報道", "观察", "访谈", "特别节目", "world", "report", "live", "城市"]
+
+
+def build_epg_events(count: int = 10000, channels: int = 200, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    now = int(time.time())
+    events = []
+    for index in range(count):
+        channel = index % channels
+        start = now + (index // channels) * 1800 - 600
+        title = f"{rng.choice(TITLE_WORDS)}{rng.choice(TITLE_WORDS)} {index}"
+        description = " ".join(rng.choice(DESCRIPTION_WORDS) for _ in range(rng.randint(8, 30)))
+        events.append(core.TvhEpgEvent(
+            event_id=str(index),
+            channel_uuid=f"channel-{channel}",
+            channel_name=f"CCTV-{channel}",
+            title=title,
+            subtitle=rng.choice(["", "第一集", "重播"]),
+            summary="",
+            description=description,
+            start=start,
+            stop=start + 1800,
+        ))
+    return events
+
+
+def _best_of(function, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_epg_search() -> None:
+    events = build_epg_events()
+    keywords = ["新闻", "体育", "CCTV-15", "精彩赛事", "report", "不存在的节目"]
+    now = int(time.time())
+
+    linear = _best_of(lambda: [core.search_tvh_epg_events(events, keyword, now=now, limit=10) for keyword in keywords])
+    store = core.TvhEpgStore(hours=24)
+    started = time.perf_counter()
+    store.merge(events, now=now)
+    merge = time.perf_counter() - started
+    indexed_events = store.events()
+    indexed = _best_of(lambda: [core.search_tvh_epg_events(indexed_events, keyword, now=now, limit=10) for keyword in keywords])
+
+    for keyword in keywords:
+        assert core.search_tvh_epg_events(events, keyword, now=now, limit=None) == \
+            core.search_tvh_epg_events(indexed_events, keyword, now=now, limit=None)
+    print(f"epg_search: {len(events)} 节目, {len(keywords)} 个关键词")
+    print(f"  逐条折叠: {linear * 1000:.1f} ms")
+    print(f"  载入并建索引: {merge * 1000:.1f} ms (每个节目只折叠一次)")
+    print(f"  索引查询: {indexed * 1000:.1f} ms")
+
+
+def bench_ipdb_lookup() -> None:
+    """需要 maxminddb 及 TVH_BENCH_IPDB_DIR 目录下的 country.mmdb / asn.mmdb（可选 ip2region_v4.xdb）。"""
+    directory = Path(os.environ.get("TVH_BENCH_IPDB_DIR", ""))
+    country_db = directory / core.IPDB_COUNTRY_FILENAME
+    asn_db = directory / core.IPDB_ASN_FILENAME
+    maxminddb = core._import_maxminddb()
+    if not maxminddb or not country_db.exists() or not asn_db.exists():
+        print("ipdb_lookup: 跳过（未安装 maxminddb 或未设置 TVH_BENCH_IPDB_DIR）")
+        return
+    rng = random.Random(7)
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(2000)]
+
+    def reopen_per_lookup():
+        for ip in ips:
+            for path in (country_db, asn_db):
+                with maxminddb.open_database(str(path)) as reader:
+                    reader.get(ip)
+
+    def pooled():
+        for ip in ips:
+            core.lookup_ip_location_from_mmdb(ip, country_db=country_db, asn_db=asn_db)
+
+    print(f"ipdb_lookup: {len(ips)} 个IP")
+    print(f"  mmdb 每次打开: {_best_of(reopen_per_lookup, 3) / len(ips) * 1e6:.1f} us/IP")
+    print(f"  mmdb 常驻读取器: {_best_of(pooled, 3) / len(ips) * 1e6:.1f} us/IP")
+
+    xdb = directory / core.IP2REGION_FILENAME
+    try:
+        searcher, util = core._resolve_ip2region_modules()
+    except ImportError:
+        return
+    if not xdb.exists():
+        return
+
+    def file_only_per_lookup():
+        for ip in ips:
+            header = util.load_header_from_file(str(xdb))
+            file_searcher = searcher.new_with_file_only(util.version_from_header(header), str(xdb))
+            try:
+                file_searcher.search(ip)
+            finally:
+                file_searcher.close()
+
+    print(f"  ip2region 每次打开: {_best_of(file_only_per_lookup, 3) / len(ips) * 1e6:.1f} us/IP")
+    for mode in core.IP2REGION_CACHE_MODES:
+        elapsed = _best_of(lambda: [core.lookup_ip_location_from_ip2region(ip, xdb, cache_mode=mode) for ip in ips], 3)
+        print(f"  ip2region 常驻({mode}): {elapsed / len(ips) * 1e6:.1f} us/IP")
+    core.close_ip_location_dbs()
+
+
+def build_playback_snapshot(count: int, seed: int = 7, churn: float = 0.0) -> dict:
+    """count 路播放，约 count/4 个用户；churn 比例的流换台或换客户端。"""
+    rng = random.Random(seed)
+    users = max(1, count // 4)
+    snapshot = {}
+    for index in range(count):
+        changed = rng.random() < churn
+        subscription_id = str(index if not changed or rng.random() < 0.5 else count + index)
+        snapshot[subscription_id] = core.TvhSubscription(
+            subscription_id=subscription_id,
+            username=f"user{index % users}",
+            channel=f"CCTV-{(index + (7 if changed else 0)) % 50}",
+            service=f"service-{index % 50}",
+            profile="pass",
+            started=f"2026-01-01 00:{index % 60:02d}:00",
+            state="Running",
+            peer=f"10.0.{index // 250}.{index % 250}",
+            user_agent="VLC",
+        )
+    return snapshot
+
+
+def _legacy_detect_playback_events(previous, current, enabled_users):
+    """索引化之前的逐对比较实现，仅作结果对照。"""
+    previous_items = core._real_playback_items(previous)
+    current_items = core._real_playback_items(current)
+    events = []
+    matched_previous = set()
+    matched_current = set()
+    for previous_key, previous_subscription in previous_items.items():
+        if not previous_subscription.subscription_id:
+            continue
+        for current_key, current_subscription in current_items.items():
+            if current_key in matched_current:
+                continue
+            if previous_subscription.subscription_id != current_subscription.subscription_id:
+                continue
+            matched_previous.add(previous_key)
+            matched_current.add(current_key)
+            if (
+                enabled_users.get(current_subscription.username)
+                and core._playback_content_signature(previous_subscription)
+                != core._playback_content_signature(current_subscription)
+            ):
+                events.append(("stop", previous_subscription))
+                events.append(("start", current_subscription))
+            break
+    previous = core._playback_notification_map(
+        subscription for key, subscription in previous_items.items() if key not in matched_previous
+    )
+    current = core._playback_notification_map(
+        subscription for key, subscription in current_items.items() if key not in matched_current
+    )
+    for key, subscription in current.items():
+        if key not in previous and enabled_users.get(subscription.username):
+            events.append(("start", subscription))
+        elif key in previous and enabled_users.get(subscription.username):
+            previous_subscription = previous[key]
+            if core._playback_content_signature(previous_subscription) != core._playback_content_signature(subscription):
+                events.append(("stop", previous_subscription))
+                events.append(("start", subscription))
+    for key, subscription in previous.items():
+        if key not in current and enabled_users.get(subscription.username):
+            events.append(("stop", subscription))
+    return events
+
+
+def bench_playback_diff() -> None:
+    for count in (10, 100, 1000):
+        previous = build_playback_snapshot(count)
+        current = build_playback_snapshot(count, churn=0.1)
+        enabled = {subscription.username: True for subscription in current.values()}
+        repeat = 20 if count < 1000 else 3
+
+        def poll():
+            events = core.detect_playback_events(previous, current, enabled)
+            return core.plan_playback_notifications(list(events), previous, current, now=100)
+
+        legacy_events = _legacy_detect_playback_events(previous, current, enabled)
+        assert core.detect_playback_events(previous, current, enabled) == legacy_events
+        legacy = _best_of(lambda: _legacy_detect_playback_events(previous, current, enabled), repeat)
+        indexed = _best_of(lambda: core.detect_playback_events(previous, current, enabled), repeat)
+        planned = _best_of(poll, repeat)
+        print(f"playback_diff: {count} 路播放, {len(legacy_events)} 个事件")
+        print(f"  逐对比较: {legacy * 1000:.2f} ms")
+        print(f"  索引比较: {indexed * 1000:.2f} ms")
+        print(f"  比较并规划通知: {planned * 1000:.2f} ms")
+
+
+def build_epg_grid_body(count: int = 999, channels: int = 50, seed: int = 7) -> bytes:
+    """模拟 /api/epg/events/grid 的响应体，节目带较长的描述。"""
+    entries = [
+        {
+            "eventId": int(event.event_id),
+            "channelUuid": event.channel_uuid,
+            "channelName": event.channel_name,
+            "title": event.title,
+            "subtitle": event.subtitle,
+            "description": event.description * 3,
+            "start": event.start,
+            "stop": event.stop,
+            "genre": [16],
+        }
+        for event in build_epg_events(count, channels=channels, seed=seed)
+    ]
+    return json.dumps({"entries": entries, "totalCount": len(entries)}, ensure_ascii=False).encode("utf-8")
+
+
+def _peak_memory(function) -> tuple[float, object]:
+    tracemalloc.start()
+    try:
+        result = function()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+def bench_grid_parse() -> None:
+    now = int(time.time())
+    for count in (999, 5000):
+        body = build_epg_grid_body(count)
+
+        def whole_document(stream, **filters):
+            payload = json.loads(stream.read().decode("utf-8"))
+            return [
+                event
+                for event in core.parse_tvh_epg_events(payload, now=now)
+                if core._tvh_epg_event_on_channel(event, filters.get("channel_uuid"), None)
+            ]
+
+        def streaming(stream, use_ijson=False, **filters):
+            events = []
+            for entry in core.iter_json_array_items(stream, "entries", use_ijson=use_ijson):
+                event = core._tvh_epg_event_from_entry(entry, now, **filters)
+                if event is not None:
+                    events.append(event)
+            return events
+
+        print(f"grid_parse: {count} 节目, 响应 {len(body) / 1024:.0f} KB")
+        for label, filters in (("全部频道", {}), ("单个频道", {"channel_uuid": "channel-3"})):
+            variants = [("整份解析", whole_document), ("流式解析", streaming)]
+            if core._import_ijson():
+                variants.append(("流式解析(ijson)", lambda stream, **kw: streaming(stream, use_ijson=None, **kw)))
+            expected = None
+            for name, function in variants:
+                peak, events = _peak_memory(lambda: function(io.BytesIO(body), **filters))
+                elapsed = _best_of(lambda: function(io.BytesIO(body), **filters), 3)
+                if expected is None:
+                    expected = events
+                assert sorted(events, key=lambda item: item.event_id) == sorted(expected, key=lambda item: item.event_id)
+                print(f"  {label} {name}: 峰值 {peak / 1024 / 1024:.2f} MB, {elapsed * 1000:.1f} ms, {len(events)} 条")
+
+
+def _unslotted(cls):
+    """按同样字段生成不带 __slots__ 的旧式 frozen dataclass，仅作对照。"""
+    fields = [
+        (item.name, item.type, dataclasses.field(default=item.default))
+        if item.default is not dataclasses.MISSING
+        else (item.name, item.type)
+        for item in dataclasses.fields(cls)
+    ]
+    return dataclasses.make_dataclass(f"Legacy{cls.__name__}", fields, frozen=True)
+
+
+def _legacy_copy(legacy_cls, record, **changes):
+    """逐字段调用构造函数复制，模拟 replace 之前的写法。"""
+    values = {item.name: getattr(record, item.name) for item in dataclasses.fields(record)}
+    values.update(changes)
+    return legacy_cls(**values)
+
+
+def _retained_memory(function) -> tuple[float, object]:
+    tracemalloc.start()
+    try:
+        result = function()
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+
+def bench_record_memory() -> None:
+    legacy_event = _unslotted(core.TvhEpgEvent)
+    legacy_entry = _unslotted(core.TvhDvrEntry)
+    legacy_subscription = _unslotted(core.TvhSubscription)
+    events = build_epg_events(5000)
+    entries = [
+        core.TvhDvrEntry(uuid=f"dvr-{index}", title=event.title, channel=event.channel_name, start=event.start, stop=event.stop)
+        for index, event in enumerate(events[:2000])
+    ]
+    fields = {
+        name: [{item.name: getattr(record, item.name) for item in dataclasses.fields(record)} for record in records]
+        for name, records in (("event", events), ("entry", entries))
+    }
+
+    print("record_memory: 常驻内存")
+    for label, slotted, legacy, values in (
+        ("5000 个节目", core.TvhEpgEvent, legacy_event, fields["event"]),
+        ("2000 个录制任务", core.TvhDvrEntry, legacy_entry, fields["entry"]),
+    ):
+        before, _ = _retained_memory(lambda: [legacy(**item) for item in values])
+        after, _ = _retained_memory(lambda: [slotted(**item) for item in values])
+        print(f"  {label}: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
+
+    snapshot = build_playback_snapshot(100)
+    subscriptions = list(snapshot.values())
+    connections = [
+        core.TvhSubscription(subscription_id=f"c{index}", username=item.username, channel=item.peer, peer=item.peer, client="HTTP")
+        for index, item in enumerate(subscriptions)
+    ]
+    legacy_subscriptions = [_legacy_copy(legacy_subscription, item) for item in subscriptions]
+    legacy_connections = [_legacy_copy(legacy_subscription, item) for item in connections]
+    locations = {item.peer: ("香港", "HKBN") for item in subscriptions}
+
+    def legacy_poll():
+        unused = list(legacy_connections)
+        merged = []
+        for subscription in legacy_subscriptions:
+            match = next((item for item in unused if item.username == subscription.username), None)
+            if match:
+                unused.remove(match)
+                merged.append(_legacy_copy(
+                    legacy_subscription,
+                    subscription,
+                    subscription_id=match.subscription_id,
+                    peer=match.peer or subscription.peer,
+                    client=subscription.client or match.client,
+                ))
+            else:
+                merged.append(subscription)
+        merged.extend(unused)
+        return [
+            _legacy_copy(legacy_subscription, item, location=locations.get(item.peer, (None, None))[0], isp=locations.get(item.peer, (None, None))[1])
+            for item in merged
+        ]
+
+    def poll():
+        merged = core.merge_subscription_details(subscriptions, connections)
+        return [
+            dataclasses.replace(item, location=locations.get(item.peer, (None, None))[0], isp=locations.get(item.peer, (None, None))[1])
+            for item in merged
+        ]
+
+    for name, function in (("逐字段复制", legacy_poll), ("slots + replace", poll)):
+        retained, _ = _retained_memory(function)
+        elapsed = _best_of(function, 20)
+        print(f"  100 路播放轮询 {name}: 结果 {retained / 1024:.0f} KB, {elapsed * 1000:.2f} ms")
+
+
+def _spin_rate(stop: threading.Event) -> float:
+    count = 0
+    started = time.perf_counter()
+    while not stop.is_set():
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def _main_thread_share(function) -> tuple[float, float]:
+    """后台线程执行 function，返回总耗时以及期间主线程纯 Python 循环相对空闲时的速度。"""
+    idle = threading.Event()
+    threading.Timer(0.3, idle.set).start()
+    baseline = _spin_rate(idle)
+    done = threading.Event()
+    started = time.perf_counter()
+
+    def run():
+        try:
+            function()
+        finally:
+            done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    rate = _spin_rate(done)
+    return time.perf_counter() - started, rate / baseline
+
+
+def bench_epg_offload() -> None:
+    events = build_epg_events(20000)
+    now = int(time.time())
+    offload = core.ProcessOffload(threshold=1000, workers=2)
+    try:
+        core.TvhEpgStore(hours=24, offload=offload).merge(events[:1000], now=now)
+        print(f"epg_offload: {len(events)} 节目载入并建索引，同时主线程执行纯 Python 循环")
+        for name, store_offload in (("当前线程", None), ("子进程", offload)):
+            elapsed, share = _main_thread_share(lambda: core.TvhEpgStore(hours=24, offload=store_offload).merge(events, now=now))
+            print(f"  {name}: 总耗时 {elapsed * 1000:.0f} ms, 主线程速度 {share * 100:.0f}%")
+        print(f"  子进程统计: {offload.stats()}, CPU 数 {os.cpu_count()}")
+    finally:
+        offload.close()
+
+
+def bench_hot_path_timing() -> None:
+    payload = json.dumps({"entries": [
+        {"id": index, "username": f"user{index}", "channel": "CCTV-1", "hostname": f"10.0.0.{index}"}
+        for index in range(20)
+    ]})
+    rounds = 200000
+
+    def empty_loop() -> None:
+        for _ in range(rounds):
+            pass
+
+    def stage_loop() -> None:
+        for _ in range(rounds):
+            with core.hot_path_timing("parse.subscriptions"):
+                pass
+
+    parse = _best_of(lambda: core.parse_tvh_subscriptions(json.loads(payload)), repeat=200)
+    empty = _best_of(empty_loop)
+    print(f"hot_path_timing: 单个计时阶段的开销，对比一次 20 条订阅的解码加解析 {parse * 1e6:.1f} us")
+    try:
+        for label, enabled in (("计时关闭", False), ("计时开启", True)):
+            core.configure_hot_path_timings(enabled)
+            per_stage = (_best_of(stage_loop) - empty) / rounds
+            print(f"  {label}: {per_stage * 1e9:.0f} ns/阶段 ({per_stage / parse * 100:.2f}%)")
+    finally:
+        core.configure_hot_path_timings(False)
+        core.reset_hot_path_timings()
+
+
+BENCHMARKS = {
+    "epg_offload": bench_epg_offload,
+    "epg_search": bench_epg_search,
+    "grid_parse": bench_grid_parse,
+    "hot_path_timing": bench_hot_path_timing,
+    "ipdb_lookup": bench_ipdb_lookup,
+    "playback_diff": bench_playback_diff,
+    "record_memory": bench_record_memory,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="tvhhelper 基准测试")
+    parser.add_argument("names", nargs="*", help="要运行的基准")
+    args = parser.parse_args()
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
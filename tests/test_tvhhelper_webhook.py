@@ -3,6 +3,7 @@ import hmac
 import importlib
 import os
 import sys
+import tempfile
 import threading
 import time
 import types
@@ -16,9 +17,10 @@ if hasattr(time, "tzset"):
 
 def install_moviepilot_stubs(monkeypatch, include_user_message=True):
     class Response:
-        def __init__(self, success=True, message=""):
+        def __init__(self, success=True, message="", data=None):
             self.success = success
             self.message = message
+            self.data = data
 
     class NotificationType:
         Plugin = "Plugin"
@@ -109,7 +111,7 @@ def install_moviepilot_stubs(monkeypatch, include_user_message=True):
         "app.core": types.ModuleType("app.core"),
         "app.core.config": types.SimpleNamespace(settings=types.SimpleNamespace(
             API_TOKEN="api-token",
-            CONFIG_DIR="/config",
+            CONFIG_DIR=tempfile.mkdtemp(prefix="tvhhelper-config-"),
             TZ="Asia/Shanghai",
         )),
         "app.core.event": types.SimpleNamespace(eventmanager=EventManager(), Event=Event),
@@ -139,6 +141,13 @@ def import_tvhhelper(monkeypatch, include_user_message=True):
     return module
 
 
+def _manual_dvr_store_clock(module, plugin):
+    """让录制任务快照按手动时钟老化，模拟后台检查的相邻两次触发。"""
+    clock = {"now": time.time()}
+    plugin._dvr_store = module.TvhDvrStore(now=lambda: clock["now"])
+    return clock
+
+
 def test_receive_webhook_posts_plugin_notification(monkeypatch):
     module = import_tvhhelper(monkeypatch)
     plugin = module.tvhhelper()
@@ -390,6 +399,7 @@ def test_receive_webhook_dvr_complete_defers_notification_until_file_is_availabl
 
     assert response.success is True
     assert plugin.messages == []
+    plugin._tvhhelper__flush_dvr_completion_state()
     state = plugin.get_data("dvr_completion_notifications")
     assert len(state["pending"]) == 1
 
@@ -419,6 +429,7 @@ def test_pending_dvr_completion_notifies_once_when_file_becomes_available(monkey
         "webhook_secret": "secret",
         "tvh_url": "https://tvh.example.com",
     })
+    clock = _manual_dvr_store_clock(module, plugin)
     base = time.time()
     plugin.receive_webhook(
         payload={
@@ -432,12 +443,14 @@ def test_pending_dvr_completion_notifies_once_when_file_becomes_available(monkey
         x_tvh_token="secret",
     )
     current["available"] = True
+    clock["now"] += 11
 
     plugin.check_dvr_completion_pending(now=base + 11)
     plugin.check_dvr_completion_pending(now=base + 30)
 
     assert len(plugin.messages) == 1
     assert plugin.messages[0]["title"] == "TVH录制完成"
+    plugin._tvhhelper__flush_dvr_completion_state()
     state = plugin.get_data("dvr_completion_notifications")
     assert state["pending"] == {}
     assert len(state["notified"]) == 1
@@ -613,6 +626,7 @@ def test_init_seeds_historical_dvr_completions_without_notifications(monkeypatch
         "tvh_pass": "pass",
     })
 
+    plugin._tvhhelper__flush_dvr_completion_state()
     state = plugin.get_data("dvr_completion_notifications")
     assert state["notified"] == {"dvr:old-dvr": startup}
     assert state["baseline_initialized_at"] == startup
@@ -669,6 +683,7 @@ def test_init_does_not_seed_recent_dvr_completion(monkeypatch):
         "tvh_pass": "pass",
     })
 
+    plugin._tvhhelper__flush_dvr_completion_state()
     state = plugin.get_data("dvr_completion_notifications")
     assert state["notified"] == {}
     assert state["baseline_initialized_at"] == startup
@@ -702,7 +717,7 @@ def test_dvr_complete_does_not_notify_when_persistent_state_save_fails(monkeypat
         "webhook_notify": True,
         "webhook_secret": "secret",
     })
-    monkeypatch.setattr(plugin, "save_data", lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError("disk full")))
+    monkeypatch.setattr(plugin._dvr_completion_store, "commit", lambda state: False)
 
     response = plugin.receive_webhook(
         payload={
@@ -1142,11 +1157,13 @@ def test_check_dvr_reliability_notifies_once_when_recording_storage_recovers(mon
         "dvr_reliability_enabled": True,
         "tvh_url": "https://tvh.example.com",
     })
+    clock = _manual_dvr_store_clock(module, plugin)
 
     plugin.check_dvr_reliability()
     current["available"] = True
-    plugin.check_dvr_reliability()
-    plugin.check_dvr_reliability()
+    for _ in range(2):
+        clock["now"] += 60
+        plugin.check_dvr_reliability()
 
     assert len(plugin.messages) == 1
     assert plugin.messages[0]["title"] == "TVH录制存储已恢复"
@@ -1183,9 +1200,11 @@ def test_recording_storage_recovery_keeps_original_missing_uuid_baseline(monkeyp
     monkeypatch.setattr(module, "analyze_tvh_dvr_reliability", lambda *args, **kwargs: [])
     plugin = module.tvhhelper()
     plugin.init_plugin({"enabled": True, "dvr_reliability_enabled": True})
+    clock = _manual_dvr_store_clock(module, plugin)
 
     for value in range(4):
         phase["value"] = value
+        clock["now"] += 60
         plugin.check_dvr_reliability()
         if value < 3:
             assert plugin.messages == []
@@ -1194,6 +1213,60 @@ def test_recording_storage_recovery_keeps_original_missing_uuid_baseline(monkeyp
     assert plugin.messages[0]["title"] == "TVH录制存储已恢复"
 
 
+def test_dvr_entries_share_one_snapshot_between_menus_and_status(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    calls = []
+
+    def fetch_entries(*args, **kwargs):
+        calls.append(args)
+        return [module.TvhDvrEntry(uuid="dvr-1", title="晚间新闻", channel="翡翠台", start=1, stop=2, status="Scheduled")]
+
+    monkeypatch.setattr(module, "fetch_tvh_dvr_entries", fetch_entries)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True, "tvh_url": "https://tvh.example.com"})
+
+    assert plugin._tvhhelper__fresh_tvh_dvr_entries() == []
+    first = plugin._tvhhelper__tvh_dvr_entries()
+    assert plugin._tvhhelper__tvh_dvr_entries() is first
+    assert plugin._tvhhelper__fresh_tvh_dvr_entries() is first
+    assert len(calls) == 1
+
+    plugin._tvhhelper__clear_tvh_data_cache("dvr_entries")
+    assert plugin._tvhhelper__fresh_tvh_dvr_entries() == []
+    plugin._tvhhelper__tvh_dvr_entries()
+    plugin._tvhhelper__tvh_dvr_entries(force_refresh=True)
+    assert len(calls) == 3
+
+
+def test_background_dvr_checks_share_a_recent_snapshot(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    calls = []
+
+    def fetch_entries(*args, **kwargs):
+        calls.append(args)
+        return [module.TvhDvrEntry(uuid="dvr-1", title="晚间新闻", channel="翡翠台", start=1, stop=2, status="Completed OK", filesize=1024)]
+
+    monkeypatch.setattr(module, "fetch_tvh_dvr_entries", fetch_entries)
+    monkeypatch.setattr(module, "fetch_tvh_inputs", lambda *args, **kwargs: ["adapter-1"])
+    monkeypatch.setattr(module, "fetch_tvh_status", lambda *args, **kwargs: module.TvhServerStatus(ok=True))
+    monkeypatch.setattr(module, "analyze_tvh_dvr_reliability", lambda *args, **kwargs: [])
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True, "dvr_reliability_enabled": True})
+    clock = _manual_dvr_store_clock(module, plugin)
+
+    plugin.check_dvr_reliability()
+    plugin.check_dvr_reliability()
+    enriched = plugin._tvhhelper__enrich_webhook_dvr({"event": "dvr.complete", "dvr_uuid": "dvr-1"})
+    assert enriched["filesize"] == 1024
+    assert len(calls) == 1
+
+    clock["now"] += plugin._dvr_background_max_age + 1
+    plugin.check_dvr_reliability()
+    assert len(calls) == 2
+    plugin._tvhhelper__tvh_dvr_entries(force_refresh=True)
+    assert len(calls) == 3
+
+
 def test_storage_recovery_send_failure_merges_concurrent_missing_baseline(monkeypatch):
     module = import_tvhhelper(monkeypatch)
     current = {"available": False}
@@ -1216,18 +1289,19 @@ def test_storage_recovery_send_failure_merges_concurrent_missing_baseline(monkey
     monkeypatch.setattr(module, "analyze_tvh_dvr_reliability", lambda *args, **kwargs: [])
     plugin = module.tvhhelper()
     plugin.init_plugin({"enabled": True, "dvr_reliability_enabled": True})
+    clock = _manual_dvr_store_clock(module, plugin)
     plugin.check_dvr_reliability()
 
     def fail_after_concurrent_update(**kwargs):
-        state = dict(module._PluginBase.data["dvr_completion_notifications"])
-        state["recovery_missing_ids"] = ["new"]
-        module._PluginBase.data["dvr_completion_notifications"] = state
+        plugin._dvr_completion_state["recovery_missing_ids"] = ["new"]
         raise RuntimeError("notification offline")
 
     monkeypatch.setattr(plugin, "_tvhhelper__post_tvh_notification", fail_after_concurrent_update)
     current["available"] = True
+    clock["now"] += 60
     plugin.check_dvr_reliability()
 
+    plugin._tvhhelper__flush_dvr_completion_state()
     state = plugin.get_data("dvr_completion_notifications")
     assert set(state["recovery_missing_ids"]) == {"old", "new"}
 
@@ -1267,6 +1341,28 @@ def test_receive_webhook_enriches_ip_location(monkeypatch):
     assert "当前时长: 00:01:05" in plugin.messages[0]["text"]
 
 
+def test_ip_location_cache_is_reused_after_plugin_restart(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    calls = []
+    monkeypatch.setattr(
+        module,
+        "fetch_ip_location",
+        lambda ip, timeout=2, guard=None: calls.append(ip) or ("香港 葵青区", "Zouter Limited"),
+    )
+    config = {"enabled": True, "ip_lookup_enabled": True, "ipdb_enabled": False}
+    plugin = module.tvhhelper()
+    plugin.init_plugin(config)
+
+    assert plugin._tvhhelper__lookup_webhook_ip("151.243.229.106") == ("香港 葵青区", "Zouter Limited")
+    plugin.stop_service()
+
+    restarted = module.tvhhelper()
+    restarted.init_plugin(config)
+
+    assert restarted._tvhhelper__lookup_webhook_ip("151.243.229.106") == ("香港 葵青区", "Zouter Limited")
+    assert calls == ["151.243.229.106"]
+
+
 def test_local_ip_lookup_prefers_ip2region_for_china_ip(monkeypatch):
     module = import_tvhhelper(monkeypatch)
     monkeypatch.setattr(
@@ -3373,3 +3469,429 @@ def test_receive_webhook_ignores_duplicate_event_id(monkeypatch):
     assert second.success is True
     assert second.message == "Webhook重复事件已忽略"
     assert len(plugin.messages) == 1
+
+
+def test_record_program_lists_fall_back_to_one_shared_guide_download(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    calls = []
+    start = int(time.time()) + 600
+    guide = [
+        module.core.TvhEpgEvent(event_id="1", channel_uuid="ch-1", channel_name="翡翠台", title="新闻", start=start, stop=start + 600),
+        module.core.TvhEpgEvent(event_id="2", channel_uuid="ch-2", channel_name="ViuTV", title="剧集", start=start, stop=start + 600),
+    ]
+
+    def fake_fetch(*args, **kwargs):
+        calls.append(kwargs)
+        if kwargs.get("server_filter"):
+            raise module.TvhHttpError(400, "Bad Request")
+        return guide
+
+    monkeypatch.setattr(module, "fetch_tvh_epg_events", fake_fetch)
+    monkeypatch.setattr(module.core, "fetch_tvh_epg_events", fake_fetch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True})
+
+    first = plugin._tvhhelper__tvh_epg_events(types.SimpleNamespace(uuid="ch-1", name="翡翠台"))
+    second = plugin._tvhhelper__tvh_epg_events(types.SimpleNamespace(uuid="ch-2", name="ViuTV"))
+
+    assert [event.event_id for event in first] == ["1"]
+    assert [event.event_id for event in second] == ["2"]
+    assert [bool(call.get("server_filter")) for call in calls] == [True, False]
+
+
+def test_transient_epg_filter_errors_fall_back_for_one_call_only(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    calls = []
+    start = int(time.time()) + 600
+    guide = [
+        module.core.TvhEpgEvent(event_id="1", channel_uuid="ch-1", channel_name="翡翠台", title="新闻", start=start, stop=start + 600),
+    ]
+    errors = [module.TvhError("timed out"), module.TvhHttpError(401, "Unauthorized")]
+
+    def fake_fetch(*args, **kwargs):
+        calls.append(bool(kwargs.get("server_filter")))
+        if kwargs.get("server_filter") and errors:
+            raise errors.pop(0)
+        return guide
+
+    monkeypatch.setattr(module, "fetch_tvh_epg_events", fake_fetch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True})
+
+    for name in ("翡翠台", "ViuTV"):
+        plugin._tvhhelper__tvh_epg_events(types.SimpleNamespace(uuid=name, name=name))
+        plugin._epg_store = None
+    plugin._tvhhelper__tvh_epg_events(types.SimpleNamespace(uuid="ch-1", name="翡翠台"))
+
+    assert plugin._epg_server_filter is True
+    assert calls == [True, False, True, False, True]
+
+
+def test_record_search_reads_shared_epg_store_from_memory(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    fetches = []
+    start = int(time.time()) + 600
+    guide = [
+        module.core.TvhEpgEvent(event_id="1", channel_uuid="ch-1", channel_name="翡翠台", title="新闻", start=start, stop=start + 600),
+        module.core.TvhEpgEvent(event_id="2", channel_uuid="ch-2", channel_name="ViuTV", title="剧集", start=start, stop=start + 600),
+    ]
+    monkeypatch.setattr(module, "fetch_tvh_epg_events", lambda *args, **kwargs: fetches.append(kwargs) or guide)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True})
+    plugin.chain.run_module = lambda *args, **kwargs: True
+
+    for keyword in ("新闻", "剧集"):
+        plugin.handle_command(types.SimpleNamespace(event_data={
+            "action": "tvh_search",
+            "arg_str": keyword,
+            "channel": "telegram",
+            "user": "user-id",
+        }))
+    programs = plugin._tvhhelper__tvh_epg_events(types.SimpleNamespace(uuid="ch-2", name="ViuTV"))
+
+    assert len(fetches) == 1
+    assert [event.event_id for event in programs] == ["2"]
+    assert any(service["id"] == "tvhhelper_epg_refresh" for service in plugin.get_service())
+
+
+def test_comet_push_drives_playback_checks_until_watcher_drops(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    watchers = []
+    fetches = []
+
+    class FakeWatcher:
+        def __init__(self, poll, on_change, **kwargs):
+            self.on_change = on_change
+            self.healthy = True
+            self.stopped = False
+            watchers.append(self)
+
+        def start(self):
+            return None
+
+        def stop(self):
+            self.stopped = True
+
+    monkeypatch.setattr(module, "TvhCometWatcher", FakeWatcher)
+    monkeypatch.setattr(
+        module.tvhhelper,
+        "_tvhhelper__tvh_online_subscriptions",
+        lambda self: fetches.append(1) or [],
+    )
+    plugin = module.tvhhelper()
+    plugin.init_plugin({
+        "enabled": True,
+        "play_notify": True,
+        "play_notify_source": "polling",
+        "play_notify_comet": True,
+        "ip_lookup_enabled": False,
+        "play_notify_users": {"ck": True},
+    })
+
+    assert len(watchers) == 1
+    plugin.check_playback()
+    assert fetches == []
+    watchers[0].on_change()
+    assert fetches == [1]
+
+    watchers[0].healthy = False
+    plugin.check_playback()
+    assert fetches == [1, 1]
+
+    plugin.stop_service()
+    assert watchers[0].stopped is True
+
+
+def test_async_webhook_returns_before_processing_and_reports_queue_stats(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    release = threading.Event()
+    monkeypatch.setattr(
+        module.tvhhelper,
+        "_tvhhelper__enrich_webhook_program",
+        lambda self, payload: release.wait(timeout=2) and payload,
+    )
+    plugin = module.tvhhelper()
+    plugin.init_plugin({
+        "enabled": True,
+        "webhook_notify": True,
+        "webhook_secret": "secret",
+        "webhook_async": True,
+        "ip_lookup_enabled": False,
+        "play_notify_users": {"ck": True},
+    })
+
+    response = plugin.receive_webhook(
+        payload={"event": "playback.start", "event_id": "async-1", "channel": "翡翠台", "user": "ck"},
+        x_tvh_token="secret",
+    )
+
+    assert response.success is True
+    assert response.message == "Webhook已加入处理队列"
+    assert plugin.messages == []
+    release.set()
+    assert plugin._webhook_queue.join(timeout=2) is True
+    assert len(plugin.messages) == 1
+    page_text = str(plugin.get_page())
+    assert "Webhook处理队列" in page_text
+    assert "耗时 P95" in page_text
+    plugin.stop_service()
+
+
+def test_dvr_completion_state_survives_restart_before_write_back(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    monkeypatch.setattr(module, "fetch_tvh_dvr_ticket_download_url", lambda *args, **kwargs: None)
+    plugin = module.tvhhelper()
+    config = {"enabled": True, "webhook_notify": True, "webhook_secret": "secret"}
+    plugin.init_plugin(config)
+    payload = {
+        "event": "dvr.complete",
+        "event_id": "journal-1",
+        "timestamp": int(time.time()),
+        "title": "晚间新闻",
+        "channel": "翡翠台",
+        "dvr_uuid": "dvr-1",
+        "filename": "/recordings/晚间新闻.ts",
+        "filesize": 1024,
+        "status": "Completed OK",
+    }
+
+    assert plugin.receive_webhook(payload=payload, x_tvh_token="secret").success is True
+    assert plugin.get_data("dvr_completion_notifications") is None
+
+    restarted = module.tvhhelper()
+    restarted.init_plugin(config)
+    response = restarted.receive_webhook(payload=dict(payload, event_id="journal-2"), x_tvh_token="secret")
+
+    assert response.message == "录制完成通知已发送"
+    assert "dvr:dvr-1" in restarted.get_data("dvr_completion_notifications")["notified"]
+
+
+def test_plugin_data_reset_discards_unflushed_dvr_completion_state(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    monkeypatch.setattr(module, "fetch_tvh_dvr_ticket_download_url", lambda *args, **kwargs: None)
+    plugin = module.tvhhelper()
+    config = {"enabled": True, "webhook_notify": True, "webhook_secret": "secret"}
+    plugin.init_plugin(config)
+    payload = {
+        "event": "dvr.complete",
+        "event_id": "reset-1",
+        "timestamp": int(time.time()),
+        "title": "晚间新闻",
+        "channel": "翡翠台",
+        "dvr_uuid": "dvr-1",
+        "filename": "/recordings/晚间新闻.ts",
+        "filesize": 1024,
+        "status": "Completed OK",
+    }
+    assert plugin.receive_webhook(payload=payload, x_tvh_token="secret").success is True
+    journal = plugin._dvr_completion_store.journal_path
+    assert journal.exists()
+
+    plugin.handle_reset(module.Event(types.SimpleNamespace(plugin_id="tvhhelper", reset_config=False)))
+
+    assert not journal.exists()
+    assert plugin._dvr_completion_state["notified"] == {}
+    plugin.stop_service()
+    assert plugin.get_data("dvr_completion_notifications") is None
+    restarted = module.tvhhelper()
+    restarted.init_plugin(config)
+    assert "dvr:dvr-1" not in restarted._dvr_completion_state["notified"]
+    restarted.stop_service()
+
+
+def test_idle_dvr_completion_check_does_not_touch_plugin_data(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True, "webhook_notify": True})
+    monkeypatch.setattr(plugin, "get_data", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("read")))
+    monkeypatch.setattr(plugin, "save_data", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("write")))
+
+    for offset in range(5):
+        plugin.check_dvr_completion_pending(now=time.time() + offset * 10)
+
+
+def test_due_dvr_completion_is_checked_by_deadline_scheduler(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    module._PluginBase.data["dvr_completion_notifications"] = {
+        "pending": {
+            "dvr:dvr-1": {
+                "payload": {"event": "dvr.complete", "dvr_uuid": "dvr-1", "title": "晚间新闻", "channel": "翡翠台"},
+                "attempts": 0,
+                "next_check_at": time.time() + 0.1,
+            },
+        },
+        "notified": {},
+    }
+    monkeypatch.setattr(
+        module,
+        "fetch_tvh_dvr_entries",
+        lambda *args, **kwargs: [module.TvhDvrEntry(
+            uuid="dvr-1",
+            title="晚间新闻",
+            channel="翡翠台",
+            start=1,
+            stop=2,
+            status="Completed OK",
+            filesize=1024,
+            filename="/recordings/晚间新闻.ts",
+        )],
+    )
+    monkeypatch.setattr(module, "fetch_tvh_dvr_ticket_download_url", lambda *args, **kwargs: None)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True, "webhook_notify": True})
+
+    assert all(service["id"] != "tvhhelper_dvr_completion_pending" for service in plugin.get_service())
+    deadline = time.time() + 2
+    while not plugin.messages and time.time() < deadline:
+        time.sleep(0.02)
+    plugin.stop_service()
+
+    assert plugin.messages[0]["title"] == "TVH录制完成"
+    assert plugin._dvr_completion_scheduler.next_deadline() is None
+
+
+def test_queued_dvr_completion_registers_its_deadline(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True, "webhook_notify": True, "webhook_secret": "secret"})
+    assert plugin._dvr_completion_scheduler.next_deadline() is None
+
+    before = time.time()
+    plugin.receive_webhook(
+        payload={
+            "event": "dvr.complete",
+            "event_id": "deadline-1",
+            "title": "晚间新闻",
+            "channel": "翡翠台",
+            "dvr_uuid": "dvr-1",
+            "filename": "/recordings/晚间新闻.ts",
+        },
+        x_tvh_token="secret",
+    )
+    plugin.stop_service()
+
+    assert before + 10 <= plugin._dvr_completion_scheduler.next_deadline() <= time.time() + 10
+
+
+def test_tvh_data_cache_serves_stale_value_while_refreshing(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True, "tvh_cache_max_stale": 120})
+    refreshed = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(len(calls) + 1)
+        if len(calls) > 1:
+            refreshed.set()
+        return f"value-{len(calls)}"
+
+    assert plugin._tvhhelper__cached_tvh_data("sample", 0, loader) == "value-1"
+    assert plugin._tvhhelper__cached_tvh_data("sample", 0, loader) == "value-1"
+    assert refreshed.wait(timeout=2)
+    assert plugin.get_config()["tvh_cache_max_stale"] == 120
+
+
+def test_prewarm_fills_menu_caches_in_background(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    calls = []
+
+    def recorder(name, value):
+        def fetch(*args, **kwargs):
+            calls.append(name)
+            return value
+        return fetch
+
+    monkeypatch.setattr(module, "fetch_tvh_status", recorder("status", module.TvhServerStatus(ok=True)))
+    monkeypatch.setattr(module, "fetch_tvh_inputs", recorder("inputs", ["adapter-1"]))
+    monkeypatch.setattr(module, "fetch_tvh_subscriptions", recorder("subscriptions", []))
+    monkeypatch.setattr(module, "fetch_tvh_connections", recorder("connections", []))
+    monkeypatch.setattr(module, "fetch_tvh_dvr_entries", recorder("dvr_entries", []))
+    monkeypatch.setattr(module, "fetch_tvh_dvr_configs", recorder("dvr_configs", []))
+    monkeypatch.setattr(module, "fetch_tvh_channels", recorder("channels", [types.SimpleNamespace(uuid="ch-1", name="翡翠台")]))
+    monkeypatch.setattr(module, "fetch_tvh_users", recorder("users", [module.TvhUser(username="ck")]))
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True, "prewarm": True})
+    plugin._prewarm_thread.join(timeout=2)
+
+    assert set(plugin._prewarm_stats) == {"status", "dvr_entries", "dvr_configs", "channels", "users"}
+    assert all(item["error"] is None for item in plugin._prewarm_stats.values())
+    assert calls.count("dvr_entries") == 1
+    warmed = len(calls)
+    plugin._tvhhelper__tvh_channels()
+    plugin._tvhhelper__tvh_users()
+    plugin._tvhhelper__tvh_dvr_entries()
+    assert len(calls) == warmed
+
+
+def test_prewarm_is_off_by_default(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True})
+
+    assert plugin._prewarm_thread is None
+    assert plugin.get_config()["prewarm"] is False
+
+
+def test_epg_process_offload_is_opt_in(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True})
+    assert plugin._epg_store.offload is None
+
+    plugin.init_plugin({"enabled": True, "epg_process_offload": True})
+    offload = plugin._epg_offload
+    plugin.stop_service()
+
+    assert offload.threshold == 2000
+    assert plugin._epg_store.offload is offload
+    assert plugin.get_config()["epg_process_offload"] is True
+
+
+def test_epg_process_offload_worker_runs_when_core_is_imported_through_the_package(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    assert module.core.__name__ == "tvhhelper.core"
+    start = int(time.time()) + 600
+    events = [
+        module.core.TvhEpgEvent(str(index), f"ch-{index % 5}", f"翡翠台{index % 5}", f"新聞{index}", start + index, start + index + 600)
+        for index in range(150)
+    ]
+    offload = module.ProcessOffload(threshold=100, workers=1)
+    store = module.TvhEpgStore(hours=24, offload=offload)
+    try:
+        store.merge(events)
+    finally:
+        offload.close()
+
+    assert offload.stats()["offloaded"] == 1
+    assert offload.stats()["failures"] == 0
+    assert [event.event_id for event in module.search_tvh_epg_events(store.events(), "新闻12", limit=None)] == [
+        "12", "120", "121", "122", "123", "124", "125", "126", "127", "128", "129",
+    ]
+
+
+def test_hot_path_timings_are_opt_in_and_exposed_on_page_and_api(monkeypatch):
+    module = import_tvhhelper(monkeypatch)
+    plugin = module.tvhhelper()
+    plugin.init_plugin({"enabled": True})
+    assert "热路径耗时" not in str(plugin.get_page())
+
+    plugin.init_plugin({"enabled": True, "hot_path_timings": True, "webhook_secret": "secret"})
+    plugin.receive_webhook(payload={"event": "system.webhooktest"}, x_tvh_token="wrong")
+
+    assert plugin.get_hot_path_timings(apikey="wrong").success is False
+    response = plugin.get_hot_path_timings(apikey="api-token")
+    assert response.success is True
+    assert response.data["enabled"] is True
+    assert response.data["stages"]["webhook"]["count"] >= 1
+    assert "p95" in response.data["stages"]["webhook"]
+    assert "热路径耗时" in str(plugin.get_page())
+    assert any(api["path"] == "/timings" for api in plugin.get_api())
+    assert plugin.get_config()["hot_path_timings"] is True
+
+    plugin.init_plugin({"enabled": True, "hot_path_timings": True, "webhook_secret": "secret"})
+    assert module.hot_path_timing_stats()["stages"] == {}
+
+    plugin.stop_service()
+    assert module.hot_path_timing_stats()["enabled"] is False
+